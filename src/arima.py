@@ -5,27 +5,28 @@ import matplotlib.pyplot as plt
 from scipy import signal
 from scipy import stats
 
-import statsmodels.api as sm
 from statsmodels.tsa.arima_model import ARIMA
 
 
 from src.import_process_data import import_caiso_dataset
+from src.seasonal_trend import fit_seasonal_means
+from src.autocorrelation import acf_matrix, acf_confint
+from src.decompose import decompose_multi_seasonal
+from src.rollup import summarize_rollup
+from src.kernels import rolling_mean
 
 
 def fit_moving_average_trend(series, window=6):
 #    return pd.rolling_mean(series, window, center=True)
-    return series.rolling(window, center=True).mean()
+    return pd.Series(rolling_mean(series.values, window, center=True), index=series.index, name=series.name)
 
 def plot_moving_average_trend(ax, name, series, window=6):
     moving_average_trend = fit_moving_average_trend(series, window)
     plot_trend_data(ax, name, series)
     ax.plot(series.index.date, moving_average_trend)
     
-def fit_seasonal_trend(series):
-    dummies = create_monthly_dummies(series)
-    X = sm.add_constant(dummies.values, prepend=False)
-    seasonal_model = sm.OLS(series.values, X).fit()
-    return seasonal_model.predict(X)
+def fit_seasonal_trend(series, components=('month',)):
+    return fit_seasonal_means(series.values, series.index, components)
 
 def plot_seasonal_trend(ax, name, series):
     seasons_average_trend = fit_seasonal_trend(series)
@@ -69,9 +70,36 @@ def calc_stat_summary_for_all_hubs(all_lmp, hub_names):
     
     plt.show();
 
+def calc_stat_summary_from_rollup(rollup, hub_cols, hub_names):
+    '''
+    Prints the mean, median and standard deviation for all hubs from a precomputed daily or monthly rollup.
+    The median is approximated by the count-weighted median of the period medians.
+    
+    Parameters
+    ----------
+    rollup: dataframe
+        Daily or monthly rollup from read_rollup().
+    
+    hub_cols: arr
+        Names of the hourly price columns, e.g. '$_MWH_np15'.
+    
+    hub_names: arr
+        An array comprised of strings that are the names of the provided hubs.
+    
+    Return
+    ------
+    '''
+    
+    for col, name in zip(hub_cols, hub_names):
+        summary = summarize_rollup(rollup, col)
+        print (f"{name} avg. price: {round(summary['mean'], 5)}")
+        print (f"{name} approx. median price: {round(summary['median'], 5)}")
+        print(f"{name} std. dev.: {round(summary['std'], 5)}")
+        print('\n')
+
 def plot_shared_yscales(axs, x, ys, titles, hub_name):
-    ymiddles =  [ (y.max()+y.min())/2 for y in ys ]
-    yrange = max( (y.max()-y.min())/2 for y in ys )
+    ymiddles =  [ (np.nanmax(y)+np.nanmin(y))/2 for y in ys ]
+    yrange = max( (np.nanmax(y)-np.nanmin(y))/2 for y in ys )
     for ax, y, title, ymiddle in zip(axs, ys, titles, ymiddles):
         ax.plot(x, y)
         ax.set_title(f"{title} - {hub_name}")
@@ -79,41 +107,46 @@ def plot_shared_yscales(axs, x, ys, titles, hub_name):
     plt.show();
 
 
-def plot_seasonal_decomposition(lmp_curve, hub_name, period=1):
+def plot_seasonal_decomposition(lmp_curve, hub_name, periods=(24, 168)):
     '''
     Deconstructs and plots the price curve into trend, seasonal and residual components.
+    There is one seasonal component for each period, e.g. daily and weekly.
     
     '''
     
-    fig, axs = plt.subplots(4, figsize=(20,12), sharex=True)
-    tsr_decomp = sm.tsa.seasonal_decompose(lmp_curve, period)
+    components, _ = decompose_multi_seasonal(lmp_curve.values, periods)
+    seasonal_names = [f'seasonal_{p}' for p in periods]
+    
+    fig, axs = plt.subplots(3 + len(periods), figsize=(20, 3 * (3 + len(periods))), sharex=True)
     
     plot_shared_yscales(axs,
-                        series.index,
-                        [lmp_curve, tsr_decomp.trend, tsr_decomp.seasonal, tsr_decomp.resid],
-                        ["Raw Series", "Trend Component $T_t$", "Seasonal Component $S_t$", "Residual Component $R_t$"],
+                        lmp_curve.index,
+                        [components[name][:, 0] for name in ['observed', 'trend'] + seasonal_names + ['resid']],
+                        ["Raw Series", "Trend Component $T_t$"] + [f"{p}-Hour Seasonal Component $S_t$" for p in periods] + ["Residual Component $R_t$"],
                         hub_name)
     plt.tight_layout()
     plt.show();
 
 def compute_autocorrelation(series, lag=1):
-    truncated = series[lag:]
-    lagged = np.copy(series)[:(len(truncated))]
-    return np.corrcoef(series, lagged)[0,1]
+    return acf_matrix(series, lag)[lag, 0]
 
-def plot_lmp_curve_autocorrelation(arr_curves, hub_names, acf_lag=48):
+def plot_lmp_curve_autocorrelation(arr_curves, hub_names, acf_lag=48, alpha=0.05):
     
     n_hubs = len(hub_names)
+    lmp_matrix = np.column_stack(arr_curves)
+    acf = acf_matrix(lmp_matrix, acf_lag)
+    confint = acf_confint(acf, len(lmp_matrix), alpha)
+    lags = np.arange(acf.shape[0])
     
-    diff_dict = dict()
-    for curve, name in zip(arr_curves, hub_names):
-        diff_dict[name] = curve
-    
-    fig, axs = plt.subplots(n_hubs, figsize=(20, 3 * n_hubs))
-
-    for i, name, diff in enumerate(diff_dict.items()):
-        _ = sm.graphics.tsa.plot_acf(diff, lags=acf_lag, ax=axs[i])
-        axs[i].set_title(f"Autocorrelation - {name}")
+    fig, axs = plt.subplots(n_hubs, figsize=(20, 3 * n_hubs), squeeze=False)
+
+    for i, name in enumerate(hub_names):
+        ax = axs[i, 0]
+        ax.vlines(lags, 0, acf[:, i])
+        ax.plot(lags, acf[:, i], 'o')
+        ax.fill_between(lags, -confint[:, i], confint[:, i], alpha=0.25)
+        ax.axhline(0, color='black', lw=0.5)
+        ax.set_title(f"Autocorrelation - {name}")
 
 
 if __name__ == '__main__':
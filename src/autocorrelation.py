@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from scipy import fft
+from scipy import stats
+
+
+def _as_column_matrix(lmp_matrix):
+    if isinstance(lmp_matrix, (pd.DataFrame, pd.Series)):
+        lmp_matrix = lmp_matrix.values
+    lmp_matrix = np.asarray(lmp_matrix, dtype=float)
+    return lmp_matrix[:, None] if lmp_matrix.ndim == 1 else lmp_matrix
+
+def acf_matrix(lmp_matrix, n_lags=720):
+    """
+    Computes the autocorrelation of every column for lags 0 to n_lags with one FFT.
+    Matches statsmodels' acf() with fft=True and adjusted=False.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Hourly prices with shape (n_hours,) or (n_hours, n_hubs). Missing prices are not supported.
+
+    n_lags : int
+        Largest lag in hours.
+
+    Returns
+    -------
+
+    acf : arr
+        Autocorrelations with shape (n_lags + 1, n_hubs).
+    """
+    lmp_matrix = _as_column_matrix(lmp_matrix)
+    if np.isnan(lmp_matrix).any():
+        raise ValueError('Fill missing prices before computing autocorrelations.')
+
+    n_hours = lmp_matrix.shape[0]
+    n_lags = min(n_lags, n_hours - 1)
+    demeaned = lmp_matrix - lmp_matrix.mean(axis=0)
+
+    # Zero padding to at least twice the length turns the circular correlation into a linear one.
+    n_fft = fft.next_fast_len(2 * n_hours - 1, real=True)
+    spectrum = fft.rfft(demeaned, n=n_fft, axis=0, workers=-1)
+    acov = fft.irfft(spectrum * np.conj(spectrum), n=n_fft, axis=0, workers=-1)[:n_lags + 1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return acov / acov[0]
+
+def pacf_matrix(acf, n_lags=None):
+    """
+    Computes partial autocorrelations from autocorrelations with the Durbin-Levinson recursion.
+    The recursion steps through lags but is vectorized across columns.
+    Matches statsmodels' pacf() with method='ldb'.
+
+    Parameters
+    ----------
+    acf : arr
+        Output of acf_matrix().
+
+    n_lags : int
+        Largest lag. Defaults to every lag in acf.
+
+    Returns
+    -------
+
+    pacf : arr
+        Partial autocorrelations with shape (n_lags + 1, n_hubs).
+    """
+    acf = _as_column_matrix(acf)
+    if n_lags is None:
+        n_lags = acf.shape[0] - 1
+
+    n_cols = acf.shape[1]
+    pacf = np.zeros((n_lags + 1, n_cols))
+    pacf[0] = 1.0
+    phi = np.zeros((n_lags + 1, n_cols))
+    sigma = np.ones(n_cols)
+    for k in range(1, n_lags + 1):
+        phi_k = (acf[k] - np.einsum('ij,ij->j', phi[1:k], acf[k - 1:0:-1])) / sigma
+        phi[1:k] = phi[1:k] - phi_k * phi[k - 1:0:-1]
+        phi[k] = phi_k
+        sigma = sigma * (1 - phi_k ** 2)
+        pacf[k] = phi_k
+    return pacf
+
+def acf_confint(acf, n_obs, alpha=0.05):
+    """
+    Calculates Bartlett's confidence band for autocorrelations, as drawn by statsmodels' plot_acf().
+
+    Parameters
+    ----------
+    acf : arr
+        Output of acf_matrix().
+
+    n_obs : int
+        Number of hours used to compute acf.
+
+    alpha : float
+        Significance level.
+
+    Returns
+    -------
+
+    half_width : arr
+        Half-width of the confidence band with the same shape as acf. Zero at lag 0.
+    """
+    acf = _as_column_matrix(acf)
+    z = stats.norm.ppf(1 - alpha / 2)
+    var = np.ones_like(acf) / n_obs
+    var[0] = 0
+    var[2:] = (1 + 2 * np.cumsum(acf[1:-1] ** 2, axis=0)) / n_obs
+    return z * np.sqrt(var)
+
+def ljung_box_matrix(acf, n_obs):
+    """
+    Calculates the Ljung-Box statistic and p-value at every lag for every column.
+
+    Parameters
+    ----------
+    acf : arr
+        Output of acf_matrix().
+
+    n_obs : int
+        Number of hours used to compute acf.
+
+    Returns
+    -------
+
+    q_stat : arr
+        Ljung-Box Q statistics for lags 1 to n_lags with shape (n_lags, n_hubs).
+
+    p_value : arr
+        Corresponding p-values.
+    """
+    acf = _as_column_matrix(acf)
+    lags = np.arange(1, acf.shape[0])[:, None]
+    q_stat = n_obs * (n_obs + 2) * np.cumsum(acf[1:] ** 2 / (n_obs - lags), axis=0)
+    return q_stat, stats.chi2.sf(q_stat, lags)
@@ -0,0 +1,244 @@
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+
+HOURS_DAY = 24
+HOURS_WEEK = 168
+
+
+def backtest_origins(n_hours, n_periods_fcst, n_origins, step=HOURS_DAY):
+    """
+    Creates evenly spaced forecast origins that end with the last full forecast window.
+
+    Parameters
+    ----------
+    n_hours : int
+        Number of hours in the price matrix.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    n_origins : int
+        Number of forecast origins.
+
+    step : int
+        Number of hours between consecutive origins.
+
+    Returns
+    -------
+
+    origins : arr
+        Index of the first forecasted hour for each origin. Only hours before the origin are used to forecast.
+    """
+    last_origin = n_hours - n_periods_fcst
+    return last_origin - step * np.arange(n_origins)[::-1]
+
+def stack_fcst_targets(lmp_matrix, origins, n_periods_fcst):
+    """
+    Gathers the actual prices that correspond to the baseline forecasts.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Hourly prices with one column per hub, i.e. shape (n_hours, n_hubs).
+
+    origins : arr
+        Index of the first forecasted hour for each origin.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    Returns
+    -------
+
+    y_true : arr
+        Actual prices with shape (n_origins, n_periods_fcst, n_hubs).
+    """
+    lmp_matrix = _as_hub_matrix(lmp_matrix)
+    return lmp_matrix[np.asarray(origins)[:, None] + np.arange(n_periods_fcst)]
+
+def _as_hub_matrix(lmp_matrix):
+    if isinstance(lmp_matrix, (pd.DataFrame, pd.Series)):
+        lmp_matrix = lmp_matrix.values
+    lmp_matrix = np.asarray(lmp_matrix, dtype=float)
+    return lmp_matrix[:, None] if lmp_matrix.ndim == 1 else lmp_matrix
+
+def _same_phase_index(origins, n_periods_fcst, season):
+    # Index of the most recent observation before the origin that shares the forecasted hour's position in the season.
+    horizon = np.arange(n_periods_fcst)
+    idx = np.asarray(origins)[:, None] + horizon - season * (horizon // season + 1)
+    if idx.min() < 0:
+        raise ValueError(f'Every origin needs at least {season} hours of history.')
+    return idx
+
+def _fold_seasons(lmp_matrix, season):
+    # Reshapes (n_hours, n_hubs) into (n_seasons, season, n_hubs) so that same-phase hours share an axis.
+    n_hours, n_hubs = lmp_matrix.shape
+    n_seasons = -(-n_hours // season)
+    padded = np.full((n_seasons * season, n_hubs), np.nan)
+    padded[:n_hours] = lmp_matrix
+    return padded.reshape(n_seasons, season, n_hubs)
+
+def _unfold_seasons(folded, n_hours):
+    return folded.reshape(-1, folded.shape[2])[:n_hours]
+
+def seasonal_naive_fcst(lmp_matrix, origins, n_periods_fcst, season=HOURS_DAY):
+    """
+    Forecasts each hour with the price observed one season earlier, e.g. t-24 or t-168.
+    Hours further out than one season repeat the last observed season.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Hourly prices with one column per hub, i.e. shape (n_hours, n_hubs).
+
+    origins : arr
+        Index of the first forecasted hour for each origin.
+
+    n_periods_fcst : int
+        Number of hours to forecast from each origin.
+
+    season : int
+        Length of the season in hours. Use 24 for daily and 168 for weekly seasonality.
+
+    Returns
+    -------
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_hubs).
+    """
+    lmp_matrix = _as_hub_matrix(lmp_matrix)
+    return lmp_matrix[_same_phase_index(origins, n_periods_fcst, season)]
+
+def profile_mean_fcst(lmp_matrix, origins, n_periods_fcst, season=HOURS_WEEK, n_seasons=None):
+    """
+    Forecasts each hour with the average historic price of the same position in the season.
+    A 168-hour season produces hour-of-day x day-of-week profile means when lmp_matrix starts at midnight.
+    Cumulative sums over the season axis give the mean for every origin at once.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Regular hourly prices with one column per hub, i.e. shape (n_hours, n_hubs). Missing prices are ignored.
+
+    origins : arr
+        Index of the first forecasted hour for each origin.
+
+    n_periods_fcst : int
+        Number of hours to forecast from each origin.
+
+    season : int
+        Length of the season in hours.
+
+    n_seasons : int
+        Only average over the most recent n_seasons. All history before the origin is used if None.
+
+    Returns
+    -------
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_hubs).
+    """
+    lmp_matrix = _as_hub_matrix(lmp_matrix)
+    n_hours = lmp_matrix.shape[0]
+
+    folded = _fold_seasons(lmp_matrix, season)
+    observed = ~np.isnan(folded)
+    cum_sum = _unfold_seasons(np.cumsum(np.where(observed, folded, 0.0), axis=0), n_hours)
+    cum_count = _unfold_seasons(np.cumsum(observed, axis=0), n_hours)
+
+    idx = _same_phase_index(origins, n_periods_fcst, season)
+    total, count = cum_sum[idx], cum_count[idx]
+    if n_seasons is not None:
+        start_idx = idx - season * n_seasons
+        dropped = start_idx >= 0
+        start_idx = np.where(dropped, start_idx, 0)
+        total = total - np.where(dropped[..., None], cum_sum[start_idx], 0.0)
+        count = count - np.where(dropped[..., None], cum_count[start_idx], 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
+def ewm_profile_fcst(lmp_matrix, origins, n_periods_fcst, season=HOURS_WEEK, alpha=0.3):
+    """
+    Forecasts each hour with an exponentially weighted average of prior prices at the same position in the season.
+    The smoothing recursion runs along the season axis for all hubs and positions in one filter call.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Regular hourly prices with one column per hub, i.e. shape (n_hours, n_hubs).
+
+    origins : arr
+        Index of the first forecasted hour for each origin.
+
+    n_periods_fcst : int
+        Number of hours to forecast from each origin.
+
+    season : int
+        Length of the season in hours.
+
+    alpha : float
+        Smoothing factor between 0 and 1. Larger values put more weight on recent seasons.
+
+    Returns
+    -------
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_hubs).
+    """
+    lmp_matrix = _as_hub_matrix(lmp_matrix)
+    n_hours = lmp_matrix.shape[0]
+
+    # Carry the last observed price forward within each position so that gaps do not reset the average.
+    folded = pd.DataFrame(_fold_seasons(lmp_matrix, season).reshape(-1, season * lmp_matrix.shape[1]))
+    folded = folded.ffill().bfill().values
+
+    # Starting the filter at the first season makes the first smoothed value equal the first observation.
+    zi = (1 - alpha) * folded[:1]
+    smoothed, _ = signal.lfilter([alpha], [1, -(1 - alpha)], folded, axis=0, zi=zi)
+    smoothed = _unfold_seasons(smoothed.reshape(-1, season, lmp_matrix.shape[1]), n_hours)
+
+    return smoothed[_same_phase_index(origins, n_periods_fcst, season)]
+
+def calc_baseline_rmse(y_true, fcst):
+    """
+    Calculates the RMSE of every hub across all origins and forecasted hours.
+
+    Parameters
+    ----------
+    y_true : arr
+        Actual prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    fcst : arr
+        Forecasted prices with the same shape as y_true.
+
+    Returns
+    -------
+
+    rmse : arr
+        RMSE for each hub.
+    """
+    return np.sqrt(np.nanmean((y_true - fcst) ** 2, axis=(0, 1)))
+
+
+if __name__ == '__main__':
+
+    from src.import_process_data import import_caiso_dataset
+
+    caiso = import_caiso_dataset('caiso_master')
+    hub_names = ['NP15', 'SP15', 'ZP26']
+    lmp_matrix = caiso[['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26']].values
+
+    # Ten-day forecasts from the last 30 days of origins.
+    origins = backtest_origins(len(lmp_matrix), 240, 30)
+    y_true = stack_fcst_targets(lmp_matrix, origins, 240)
+
+    baselines = {'Seasonal Naive t-24': seasonal_naive_fcst(lmp_matrix, origins, 240, season=24),
+                 'Seasonal Naive t-168': seasonal_naive_fcst(lmp_matrix, origins, 240, season=168),
+                 'Hour x Weekday Profile': profile_mean_fcst(lmp_matrix, origins, 240),
+                 'EW Profile': ewm_profile_fcst(lmp_matrix, origins, 240)}
+
+    for name, fcst in baselines.items():
+        print(name, dict(zip(hub_names, calc_baseline_rmse(y_true, fcst).round(3).tolist())))
@@ -0,0 +1,531 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import peak_rss_mb
+from src.interval_ingest import HUB_COLUMNS, measure_ingest_peak_rss
+from src.kernels import numba, rolling_mean, rolling_std, rolling_quantile, ewma, lag_stack
+from src.synthetic import write_synthetic_oasis_csvs, write_synthetic_natgas_csv, FakeIsoClient, synthetic_node_ids
+from src.import_process_data import (create_price_curves, scrape_process_caiso_load_data,
+                                     scrape_process_caiso_generation_data, scrape_process_caiso_net_ex_data,
+                                     obtain_format_hh_natgas_to_df, create_caiso_master_df)
+
+
+BENCH_DIR = '../data/benchmarks'
+BENCH_STAGES = ('create_price_curves', 'scrape_process_caiso_load_data', 'scrape_process_caiso_generation_data',
+                'scrape_process_caiso_net_ex_data', 'create_caiso_master_df', 'windowize_data', 'arima_fit',
+                'arima_predict', 'gbm_fit', 'lstm_epoch')
+KERNELS = ('rolling_mean', 'rolling_std', 'rolling_quantile', 'ewma', 'lag_stack')
+
+
+def _time_call(func, repeats):
+    # Keeps the last result so that downstream stages can use it.
+    wall, cpu = [], []
+    for _ in range(repeats):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = func()
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+    return result, np.array(wall), np.array(cpu)
+
+def _lstm_epoch_times(lmp_curve, n_prev, n_epochs, batch_size):
+    from tensorflow import keras
+    from src.model import windowize_data, build_lstm_uni_var
+
+    class EpochTimer(keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.epoch_start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.times.append(time.perf_counter() - self.epoch_start)
+
+    timer = EpochTimer()
+    timer.times = []
+    X, y = windowize_data(lmp_curve, n_prev)
+    lstm_uni = build_lstm_uni_var(n_prev, X.shape[2])
+    lstm_uni.fit(X, y, batch_size=batch_size, epochs=n_epochs, verbose=0, callbacks=[timer])
+    return len(X), np.array(timer.times)
+
+def run_benchmarks(n_years=1, n_nodes=3, repeats=3, stages=BENCH_STAGES, data_dir=None, seed=0, n_prev=24,
+                   arima_hours=24 * 28, arima_order=(2, 1, 1), lstm_hours=24 * 90, lstm_epochs=3, batch_size=64):
+    """
+    Benchmarks every pipeline stage on synthetic data of a configurable size.
+    Stages run in pipeline order on the output of the previous stage, so later stages see realistic inputs.
+    A stage that fails is recorded with its error and the remaining stages that do not depend on it still run.
+
+    Parameters
+    ----------
+    n_years : float
+        Length of the synthetic history in years.
+
+    n_nodes : int
+        Number of pricing nodes in the OASIS files. create_price_curves() parses all of them and keeps the three hubs.
+
+    repeats : int
+        Number of timed calls per stage.
+
+    stages : tuple of strings
+        Stages to benchmark. Stages whose inputs are not benchmarked are still run once, untimed.
+
+    data_dir : str
+        Directory for the synthetic files. A temporary directory is used if None.
+
+    seed : int
+        Seed of the synthetic data.
+
+    n_prev : int
+        Window length for windowize_data() and the LSTM.
+
+    arima_hours : int
+        Hours of NP15 prices used to fit the ARIMA model, which is too slow to fit on years of hourly data.
+
+    arima_order : tuple
+        (p, d, q) order of the ARIMA model.
+
+    lstm_hours : int
+        Hours of NP15 prices used to time LSTM epochs.
+
+    lstm_epochs : int
+        Number of LSTM epochs. The first epoch includes graph tracing and is reported separately.
+
+    batch_size : int
+        LSTM batch size.
+
+    Returns
+    -------
+
+    results : dataframe
+        One row per stage with rows processed, min and median wall time, median CPU time, peak RSS and status.
+    """
+    if data_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        data_dir = tmp_dir.name
+
+    lmp_files = write_synthetic_oasis_csvs(os.path.join(data_dir, 'caiso_lmp_nodes'), n_years=n_years,
+                                           n_nodes=n_nodes, seed=seed)
+    first_month = pd.Timestamp(os.path.basename(lmp_files[0])[:8])
+    last_month = pd.Timestamp(os.path.basename(lmp_files[-1])[9:17])
+    natgas_file = write_synthetic_natgas_csv(os.path.join(data_dir, 'natgas.csv'), first_month - pd.Timedelta('7D'),
+                                             last_month, seed=seed)
+    oasis_start = pd.date_range(start=first_month, end=last_month, freq='14D')
+    oasis_end = oasis_start + pd.Timedelta('14D')
+    iso_class = FakeIsoClient(seed=seed)
+
+    results = []
+    outputs = {}
+
+    def run(stage, func, rows=None):
+        n_repeats = repeats if stage in stages else 1
+        record = {'stage': stage, 'n_years': n_years, 'n_nodes': n_nodes, 'repeats': n_repeats}
+        try:
+            result, wall, cpu = _time_call(func, n_repeats)
+        except Exception as err:
+            record.update(status='error', error=f'{type(err).__name__}: {err}')
+            results.append(record)
+            return None
+        record.update(rows=rows(result) if rows is not None else len(result), wall_s_min=wall.min(),
+                      wall_s_median=np.median(wall), cpu_s_median=np.median(cpu), peak_rss_mb=peak_rss_mb(),
+                      status='ok', error=None)
+        if stage in stages:
+            results.append(record)
+        outputs[stage] = result
+        return result
+
+    curves = run('create_price_curves', lambda: create_price_curves(lmp_files), rows=lambda r: sum(map(len, r)))
+    load = run('scrape_process_caiso_load_data',
+               lambda: scrape_process_caiso_load_data(iso_class, oasis_start, oasis_end))
+    gen = run('scrape_process_caiso_generation_data',
+              lambda: scrape_process_caiso_generation_data(iso_class, oasis_start, oasis_end))
+    net_ex = run('scrape_process_caiso_net_ex_data',
+                 lambda: scrape_process_caiso_net_ex_data(iso_class, oasis_start, oasis_end))
+    if any(out is None for out in (curves, load, gen, net_ex)):
+        return pd.DataFrame(results)
+
+    natgas = obtain_format_hh_natgas_to_df(natgas_file)
+    caiso = run('create_caiso_master_df', lambda: create_caiso_master_df(*curves, gen, load, net_ex, natgas))
+    if caiso is None:
+        return pd.DataFrame(results)
+    lmp_curve = caiso['$_MWH_np15'].to_numpy(dtype=float)
+
+    from src.model import windowize_data, arimax_fit, arimax_predict
+    run('windowize_data', lambda: windowize_data(lmp_curve, n_prev), rows=lambda r: len(r[0]))
+
+    if 'arima_fit' in stages or 'arima_predict' in stages:
+        # The legacy ARIMA class is not available in current statsmodels, so the state space model is timed.
+        p, d, q = arima_order
+        arima_train = lmp_curve[-arima_hours - 24:-24]
+        no_exog = np.empty((len(arima_train), 0))
+        arima = run('arima_fit', lambda: arimax_fit(arima_train, no_exog, p, d, q), rows=lambda r: len(arima_train))
+        if arima is not None:
+            run('arima_predict', lambda: arimax_predict(arima, np.empty((24, 0))))
+
+    if 'gbm_fit' in stages:
+        from src.model import EXOG_COLUMNS
+        from src.gbm import gbm_fcst
+        from src.baseline import backtest_origins
+        # Trees are fit on every hub and the full history, which the LSTM and ARIMA stages only sample.
+        lmp_matrix = caiso[['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26']].to_numpy(dtype=float)
+        exog = caiso.rename({'HH_$_million_BTU_not_seasonal_adj': 'HH_$_mill_BTU', 'total_mw': 'total_gen'}, axis=1)
+        exog = exog[EXOG_COLUMNS].apply(pd.to_numeric).ffill().bfill().to_numpy()
+        origins = backtest_origins(len(lmp_matrix), 24, 7)
+        run('gbm_fit', lambda: gbm_fcst(lmp_matrix, origins, 24, exog, caiso['HOUR_UTC'].to_numpy()),
+            rows=lambda r: len(lmp_matrix))
+
+    if 'lstm_epoch' in stages:
+        record = {'stage': 'lstm_epoch', 'n_years': n_years, 'n_nodes': n_nodes, 'repeats': lstm_epochs - 1}
+        try:
+            n_windows, epoch_times = _lstm_epoch_times(lmp_curve[-lstm_hours:], n_prev, lstm_epochs, batch_size)
+            warm = epoch_times[1:] if len(epoch_times) > 1 else epoch_times
+            record.update(rows=n_windows, wall_s_min=warm.min(), wall_s_median=np.median(warm), cpu_s_median=None,
+                          first_epoch_s=epoch_times[0], peak_rss_mb=peak_rss_mb(), status='ok', error=None)
+        except Exception as err:
+            record.update(status='error', error=f'{type(err).__name__}: {err}')
+        results.append(record)
+
+    return pd.DataFrame(results)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_benchmark_results(results, release, bench_dir=BENCH_DIR):
+    """
+    Saves the results of run_benchmarks() for a release, together with the environment they were measured in.
+
+    Parameters
+    ----------
+    results : dataframe
+        Output of run_benchmarks().
+
+    release : str
+        Release or version name, e.g. 'v0.3'. Results of the same release are replaced.
+
+    bench_dir : str
+        Directory with one JSON file per release.
+
+    Returns
+    -------
+
+    path : str
+        Path of the JSON file.
+    """
+    os.makedirs(bench_dir, exist_ok=True)
+    payload = {'release': release,
+               'measured': datetime.now(timezone.utc).isoformat(),
+               'commit': _git_commit(),
+               'python': sys.version.split()[0],
+               'numpy': np.__version__,
+               'pandas': pd.__version__,
+               'platform': platform.platform(),
+               'n_cpus': os.cpu_count(),
+               'results': json.loads(results.to_json(orient='records'))}
+    path = os.path.join(bench_dir, f'{release}.json')
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=1)
+    return path
+
+def load_benchmark_history(bench_dir=BENCH_DIR):
+    """
+    Loads the benchmark results of every saved release.
+
+    Parameters
+    ----------
+    bench_dir : str
+        Directory written by save_benchmark_results().
+
+    Returns
+    -------
+
+    history : dataframe
+        One row per release and stage, ordered by measurement time.
+    """
+    frames = []
+    for file_name in sorted(os.listdir(bench_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        with open(os.path.join(bench_dir, file_name)) as f:
+            payload = json.load(f)
+        frame = pd.DataFrame(payload['results'])
+        frame.insert(0, 'release', payload['release'])
+        frame.insert(1, 'measured', pd.Timestamp(payload['measured']))
+        frame.insert(2, 'commit', payload['commit'])
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True).sort_values(['measured', 'stage'], kind='stable')
+
+def compare_releases(history, baseline, candidate, threshold=1.2):
+    """
+    Compares the median wall time of every stage between two releases measured at the same scale.
+
+    Parameters
+    ----------
+    history : dataframe
+        Output of load_benchmark_history().
+
+    baseline : str
+        Reference release.
+
+    candidate : str
+        Release to check.
+
+    threshold : float
+        A stage is flagged as a regression when it is this many times slower than in the baseline.
+
+    Returns
+    -------
+
+    comparison : dataframe
+        Median wall times, their ratio and a regression flag for each stage and scale.
+    """
+    keys = ['stage', 'n_years', 'n_nodes']
+    times = history[history['status'] == 'ok'].pivot_table(index=keys, columns='release', values='wall_s_median')
+    comparison = times[[baseline, candidate]].dropna().rename(columns={baseline: 'baseline_s', candidate: 'candidate_s'})
+    comparison['ratio'] = comparison['candidate_s'] / comparison['baseline_s']
+    comparison['regression'] = comparison['ratio'] > threshold
+    comparison.columns.name = None
+    return comparison.reset_index()
+
+
+def check_ingest_ram_ceiling(max_memory_mb=256, node_counts=(10, 50, 120), market='RTM', n_years=1 / 12,
+                             selections=('hubs', 'all'), data_dir=None, seed=0):
+    """
+    Checks that the chunked ingest stays under its RAM ceiling however large the input files are and however many of
+    their nodes are kept.
+    Synthetic OASIS files grow with the number of nodes. Each size is ingested keeping the three hubs and keeping every
+    node, each in a fresh process whose peak resident memory is compared with the ceiling.
+
+    Parameters
+    ----------
+    max_memory_mb : float
+        RAM ceiling passed to ingest_interval_lmp().
+
+    node_counts : tuple of ints
+        Number of nodes in the files of each input size.
+
+    market : str
+        'RTM', 'FMM' or 'DAM'.
+
+    n_years : float
+        Length of the synthetic history in years.
+
+    selections : tuple of strings
+        Nodes kept from every file, 'hubs' for the three trading hubs and 'all' for every node.
+
+    data_dir : str
+        Directory for the synthetic files and the store. A temporary directory is used if None.
+
+    seed : int
+        Seed of the synthetic data.
+
+    Returns
+    -------
+
+    results : dataframe
+        One row per input size and selection with the input size, the number of nodes kept and the peak RSS in MB.
+    """
+    if data_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        data_dir = tmp_dir.name
+
+    results = []
+    for n_nodes in node_counts:
+        lmp_dir = os.path.join(data_dir, f'caiso_lmp_{market.lower()}_{n_nodes}')
+        lmp_files = write_synthetic_oasis_csvs(lmp_dir, n_years=n_years, n_nodes=n_nodes, seed=seed, market=market)
+        input_mb = sum(os.path.getsize(lmp_file) for lmp_file in lmp_files) / 1024 ** 2
+        for selection in selections:
+            nodes = HUB_COLUMNS if selection == 'hubs' else {node_id: node_id for node_id in synthetic_node_ids(n_nodes)}
+            peak_mb = measure_ingest_peak_rss(lmp_files, market, nodes, os.path.join(data_dir, 'store'), max_memory_mb)
+            results.append({'n_nodes': n_nodes, 'input_mb': input_mb, 'n_selected': len(nodes), 'peak_rss_mb': peak_mb,
+                            'max_memory_mb': max_memory_mb, 'within_ceiling': peak_mb <= max_memory_mb})
+
+    results = pd.DataFrame(results)
+    if not results['within_ceiling'].all():
+        raise AssertionError(f'The ingest exceeded its RAM ceiling of {max_memory_mb} MB:\n{results.to_string(index=False)}')
+    return results
+
+def _pandas_kernel(kernel, frame, window, q, alpha, lags):
+    if kernel == 'rolling_mean':
+        return frame.rolling(window).mean()
+    if kernel == 'rolling_std':
+        return frame.rolling(window).std()
+    if kernel == 'rolling_quantile':
+        return frame.rolling(window).quantile(q)
+    if kernel == 'ewma':
+        return frame.ewm(alpha=alpha, adjust=False, ignore_na=True).mean()
+    return np.stack([frame.shift(lag).to_numpy() for lag in lags], axis=-1)
+
+def _array_kernel(kernel, values, window, q, alpha, lags, backend):
+    if kernel == 'rolling_mean':
+        return rolling_mean(values, window, backend=backend)
+    if kernel == 'rolling_std':
+        return rolling_std(values, window, backend=backend)
+    if kernel == 'rolling_quantile':
+        return rolling_quantile(values, window, q, backend=backend)
+    if kernel == 'ewma':
+        return ewma(values, alpha, backend=backend)
+    return lag_stack(values, lags, backend=backend)
+
+def run_kernel_benchmarks(n_nodes=500, n_years=5, repeats=3, kernels=KERNELS, backends=('pandas', 'numpy', 'numba'),
+                          window=168, q=0.9, alpha=0.1, lags=(24, 48, 168), seed=0):
+    """
+    Benchmarks the rolling and windowing kernels on a node by hour price matrix against the pandas equivalents.
+    numba kernels are compiled by a warm-up call before they are timed, and are skipped if numba is not installed.
+
+    Parameters
+    ----------
+    n_nodes : int
+        Number of node price series.
+
+    n_years : float
+        Length of every series in years of hours.
+
+    repeats : int
+        Number of timed calls per kernel and backend.
+
+    kernels : tuple of strings
+        Kernels to time, from KERNELS.
+
+    backends : tuple of strings
+        'pandas', 'numpy' and/or 'numba'.
+
+    window : int
+        Rolling window length in hours.
+
+    q : float
+        Quantile of the rolling quantile.
+
+    alpha : float
+        Smoothing factor of the EWMA.
+
+    lags : tuple of ints
+        Lags of the lag stack in hours.
+
+    seed : int
+        Seed of the random prices.
+
+    Returns
+    -------
+
+    results : dataframe
+        One row per kernel and backend with the median wall time and the speedup over pandas.
+    """
+    rng = np.random.default_rng(seed)
+    n_hours = int(round(n_years * 8760))
+    values = 30 + np.cumsum(rng.normal(size=(n_hours, n_nodes)), axis=0)
+    # Scattered missing hours make every backend take its NaN handling path.
+    values[rng.random(values.shape) < 0.001] = np.nan
+    frame = pd.DataFrame(values)
+
+    results = []
+    for kernel in kernels:
+        for backend in backends:
+            if backend == 'numba' and numba is None:
+                continue
+            if backend == 'pandas':
+                func = lambda: _pandas_kernel(kernel, frame, window, q, alpha, lags)
+            else:
+                func = lambda: _array_kernel(kernel, values, window, q, alpha, lags, backend)
+                if backend == 'numba':
+                    _array_kernel(kernel, values[:window * 2, :2], window, q, alpha, lags, backend)
+            wall = _time_call(func, repeats)[1]
+            results.append({'kernel': kernel, 'backend': backend, 'n_nodes': n_nodes, 'n_hours': n_hours,
+                            'wall_s': np.median(wall)})
+
+    results = pd.DataFrame(results)
+    pandas_s = results[results['backend'] == 'pandas'].set_index('kernel')['wall_s']
+    results['speedup'] = pandas_s.reindex(results['kernel']).to_numpy() / results['wall_s']
+    return results
+
+def run_global_model_benchmarks(node_counts=(10, 100, 500), n_years=1, n_periods_fcst=24, n_origins=30, n_epochs=2,
+                                steps_per_epoch=50, seed=0):
+    """
+    Times the global LSTM as the number of nodes grows. Training draws a fixed number of batches and every node is
+    forecast in one inference call, so the cost per node should fall as nodes are added.
+
+    Parameters
+    ----------
+    node_counts : tuple of ints
+        Number of nodes of each run.
+
+    n_years : float
+        Length of every price series in years of hours.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    n_origins : int
+        Number of daily forecast origins at the end of the series.
+
+    n_epochs : int
+        Number of training epochs.
+
+    steps_per_epoch : int
+        Number of batches per epoch.
+
+    seed : int
+        Seed of the random prices and of the model.
+
+    Returns
+    -------
+
+    results : dataframe
+        One row per node count with the fit and inference wall time, in total and per node.
+    """
+    from src.baseline import backtest_origins
+    from src.global_model import fit_global_lstm, global_lstm_fcst
+
+    rng = np.random.default_rng(seed)
+    n_hours = int(round(n_years * 8760))
+    # Every node has its own level and daily swing around a shared profile.
+    profile = np.sin(2 * np.pi * np.arange(n_hours) / 24)[:, None]
+
+    results = []
+    for n_nodes in node_counts:
+        lmp_cube = (rng.uniform(20, 60, n_nodes) + rng.uniform(2, 15, n_nodes) * profile
+                    + rng.normal(size=(n_hours, n_nodes)))
+        origins = backtest_origins(n_hours, n_periods_fcst, n_origins)
+        (global_lstm, normalization), fit_s, _ = _time_call(
+            lambda: fit_global_lstm(lmp_cube, origins[0], n_periods_fcst, n_epochs=n_epochs,
+                                    steps_per_epoch=steps_per_epoch, seed=seed), 1)
+        fcst, predict_s, _ = _time_call(lambda: global_lstm_fcst(global_lstm, normalization, lmp_cube, origins), 1)
+        results.append({'n_nodes': n_nodes, 'n_hours': n_hours, 'fit_s': fit_s[0], 'predict_s': predict_s[0],
+                        'fit_s_per_node': fit_s[0] / n_nodes, 'predict_s_per_node': predict_s[0] / n_nodes})
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmarks the pipeline on synthetic data.')
+    parser.add_argument('release', help='Name the results are saved under, e.g. v0.3.')
+    parser.add_argument('--years', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--nodes', type=int, nargs='+', default=[3])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--baseline', help='Release to compare against.')
+    parser.add_argument('--ram-ceiling', type=float, help='Also check the chunked ingest against this RAM ceiling in MB.')
+    parser.add_argument('--kernels', action='store_true', help='Also benchmark the rolling kernels at 500 nodes x 5 years.')
+    parser.add_argument('--global-model', action='store_true', help='Also time the global LSTM at 10, 100 and 500 nodes.')
+    args = parser.parse_args()
+
+    results = pd.concat([run_benchmarks(n_years, n_nodes, args.repeats) for n_years in args.years for n_nodes in args.nodes],
+                        ignore_index=True)
+    print(results.to_string(index=False))
+    save_benchmark_results(results, args.release)
+    if args.baseline is not None:
+        print(compare_releases(load_benchmark_history(), args.baseline, args.release).to_string(index=False))
+    if args.ram_ceiling is not None:
+        print(check_ingest_ram_ceiling(args.ram_ceiling).to_string(index=False))
+    if args.kernels:
+        print(run_kernel_benchmarks().to_string(index=False))
+    if args.global_model:
+        print(run_global_model_benchmarks().to_string(index=False))
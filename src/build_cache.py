@@ -0,0 +1,404 @@
+import os
+import re
+import sys
+import json
+import time
+import pickle
+import hashlib
+import importlib.util
+
+import pandas as pd
+
+
+BUILD_CACHE_DIR = '../data/build_cache'
+BUILD_STAGES = ('ingest', 'hourly', 'master', 'features', 'windows')
+FILE_DIGESTS = '_file_digests.json'
+# The scraped generation, load and net export snapshots kept next to the LMP files.
+SYSTEM_FILES = {'gen': '../data/caiso_gen_jan_19_may_20.csv',
+                'load': '../data/caiso_load_jan_19_may_20.csv',
+                'net_ex': '../data/caiso_net_ex_jan_19_may_20.csv'}
+# Script entry points at the end of a module run no stage, so they are left out of its code version.
+_MAIN_BLOCK = re.compile(rb'^if __name__ == [\'"]__main__[\'"]:', re.MULTILINE)
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_digests(paths, cache_dir=BUILD_CACHE_DIR):
+    """
+    Hashes the contents of input files. Digests are remembered with each file's size and modification time,
+    so unchanged files, however large, are not read again.
+
+    Parameters
+    ----------
+    paths : list of strings
+        Input files.
+
+    cache_dir : str
+        Directory of the build cache.
+
+    Returns
+    -------
+
+    digests : list of strings
+        sha256 of each file's contents.
+    """
+    memo_path = os.path.join(cache_dir, FILE_DIGESTS)
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+
+    digests, changed = [], False
+    for path in paths:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        if memo.get(path, {}).get('signature') != signature:
+            memo[path] = {'signature': signature, 'sha256': _sha256_file(path)}
+            changed = True
+        digests.append(memo[path]['sha256'])
+
+    if changed:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(memo_path + '.tmp', 'w') as f:
+            json.dump(memo, f)
+        os.replace(memo_path + '.tmp', memo_path)
+    return digests
+
+def code_digest(modules):
+    """
+    Hashes the source of the modules a stage runs, so that any change to them invalidates its cached outputs.
+    Only the listed modules are hashed, without their __main__ blocks, so each stage lists every module whose code
+    builds its output and editing any other module, e.g. a plot in a module that is merely imported, leaves its cache
+    valid. Modules are located without importing them.
+
+    Parameters
+    ----------
+    modules : list of strings
+        Module names, e.g. ['src.import_process_data', 'src.time_axis'].
+
+    Returns
+    -------
+
+    digest : str
+        sha256 of the module sources.
+    """
+    digest = hashlib.sha256()
+    for module in sorted(set(modules)):
+        with open(importlib.util.find_spec(module).origin, 'rb') as f:
+            digest.update(_MAIN_BLOCK.split(f.read(), maxsplit=1)[0])
+    return digest.hexdigest()
+
+def stage_key(name, code, params=None, files=(), deps=()):
+    """
+    Derives the cache key of a stage from everything its output depends on.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+
+    code : str
+        Code version, e.g. from code_digest().
+
+    params : dict
+        Parameters of the stage. Values are keyed by their repr().
+
+    files : list of strings
+        Content digests of the input files, e.g. from file_digests().
+
+    deps : list of strings
+        Keys of the upstream stages, so that a change anywhere upstream reaches every downstream stage.
+
+    Returns
+    -------
+
+    key : str
+        sha256 hex digest.
+    """
+    spec = {'name': name, 'code': code, 'params': {k: repr(v) for k, v in sorted((params or {}).items())},
+            'files': list(files), 'deps': list(deps), 'python': sys.version_info[:2]}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+def _artifact_path(name, key, cache_dir):
+    return os.path.join(cache_dir, name, f'{key}.pkl')
+
+def run_stage(name, func, params=None, files=(), deps=(), code=None, cache_dir=BUILD_CACHE_DIR):
+    """
+    Runs a build stage, or loads its output from the cache when nothing it depends on has changed.
+    Outputs are written atomically under the stage key, and the stage remembers its latest key so that later steps
+    can load the artifact with load_stage_output().
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, e.g. 'master'.
+
+    func : function
+        Builds the stage output from params, e.g. lambda: create_price_curves(lmp_files).
+
+    params : dict
+        Parameters that change the output.
+
+    files : list of strings
+        Input files that change the output.
+
+    deps : list of strings
+        Keys of the upstream stages.
+
+    code : list of strings
+        Modules that make up the code version. Defaults to the module of func.
+
+    cache_dir : str
+        Directory of the build cache.
+
+    Returns
+    -------
+
+    output : object
+        Output of the stage.
+
+    key : str
+        Cache key of the output, to pass to downstream stages.
+
+    cached : bool
+        Whether the output was loaded from the cache.
+    """
+    key = stage_key(name, code_digest(code or [func.__module__]), params, file_digests(files, cache_dir), deps)
+    path = _artifact_path(name, key, cache_dir)
+    if os.path.exists(path):
+        output, cached = pd.read_pickle(path), True
+    else:
+        output, cached = func(), False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    with open(os.path.join(cache_dir, name, '_latest.tmp'), 'w') as f:
+        f.write(key)
+    os.replace(os.path.join(cache_dir, name, '_latest.tmp'), os.path.join(cache_dir, name, '_latest'))
+    return output, key, cached
+
+def load_stage_output(name, key=None, cache_dir=BUILD_CACHE_DIR):
+    """
+    Loads a cached stage output without rebuilding anything, e.g. the windows for modeling.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+
+    key : str
+        Cache key of the output. The latest output of the stage is loaded if None.
+
+    cache_dir : str
+        Directory of the build cache.
+
+    Returns
+    -------
+
+    output : object
+        Output of the stage.
+    """
+    if key is None:
+        latest = os.path.join(cache_dir, name, '_latest')
+        if not os.path.exists(latest):
+            raise FileNotFoundError(f'Stage {name} has not been built in {cache_dir}.')
+        with open(latest) as f:
+            key = f.read().strip()
+    return pd.read_pickle(_artifact_path(name, key, cache_dir))
+
+def read_hourly_system_csv(path):
+    """
+    Reads a scraped generation, load or net export snapshot and keys it by HOUR_UTC, as the scrapers do.
+
+    Parameters
+    ----------
+    path : str
+        Path of the csv file with a date_hour_start column in UTC.
+
+    Returns
+    -------
+
+    hourly : dataframe
+        Hourly values keyed by HOUR_UTC.
+    """
+    from src.time_axis import utc_hours
+
+    snapshot = pd.read_csv(path, index_col=0)
+    snapshot['HOUR_UTC'] = utc_hours(snapshot.pop('date_hour_start'))
+    return snapshot.groupby('HOUR_UTC', as_index=False).sum()
+
+def build_features(caiso):
+    """
+    Derives the features shared by EDA and modeling from the imputed master dataset: total renewable generation and
+    the lagged, rolling, calendar, net load and spark spread features of compute_features().
+
+    Parameters
+    ----------
+    caiso : dataframe
+        Imputed CAISO dataset with the column names of the store, sorted by time.
+
+    Returns
+    -------
+
+    features : dataframe
+        The dataset with the derived columns added.
+    """
+    from src.features import compute_features
+
+    features = caiso.copy()
+    features['total_re'] = features['solar'] + features['wind']
+    derived = compute_features(features).set_index(features.index)
+    return features.join(derived.drop(columns=[col for col in derived.columns if col in features.columns]))
+
+def build_windows(features, n_prev, columns):
+    """
+    Windows every price curve for the LSTM.
+
+    Parameters
+    ----------
+    features : dataframe
+        Output of build_features().
+
+    n_prev : int
+        The number of values that comprise a window.
+
+    columns : list of strings
+        Price curves to window.
+
+    Returns
+    -------
+
+    windows : dict
+        Maps each column to (x, y) from windowize_data().
+    """
+    from src.model import windowize_data
+
+    return {col: windowize_data(features[col].to_numpy(dtype=float), n_prev) for col in columns}
+
+def build_caiso_pipeline(lmp_files=None, natgas_file='../data/natgas_jan_19_may_20.csv', system_files=SYSTEM_FILES,
+                         iso_class=None, oasis_start=None, oasis_end=None, bad_dates=('2020-05-05',),
+                         method='seasonal', n_prev=24, window_columns=('$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26'),
+                         name='caiso_master', store_dir='../data/store', cache_dir=BUILD_CACHE_DIR):
+    """
+    Builds the CAISO datasets as a graph of cached stages: ingest -> hourly -> master -> features -> windows.
+    Each stage is keyed by its input files, code and parameters and by the keys of its upstream stages, so a rebuild
+    with nothing changed only hashes file metadata and loads the final artifacts.
+
+    Parameters
+    ----------
+    lmp_files : list of strings
+        Paths of the monthly OASIS LMP csv files. Defaults to LMP_FILES.
+
+    natgas_file : str
+        Path of the FRED gas price csv file.
+
+    system_files : dict
+        Paths of the scraped 'gen', 'load' and 'net_ex' snapshots. Used unless iso_class is given.
+
+    iso_class : Class object
+        pyiso CAISO client to scrape generation, load and net export with. The scrape is keyed by its date range.
+
+    oasis_start : DatetimeIndex
+        Start of each scraped period.
+
+    oasis_end : DatetimeIndex
+        End of each scraped period.
+
+    bad_dates : tuple of strings
+        Operating dates whose values are discarded and imputed.
+
+    method : str
+        Imputation method - 'seasonal', 'linear' or 'profile'.
+
+    n_prev : int
+        Window length of the windows stage.
+
+    window_columns : tuple of strings
+        Price curves to window.
+
+    name : str
+        Name of the master dataset in the store. The store is written whenever the master is rebuilt or missing.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    cache_dir : str
+        Directory of the build cache.
+
+    Returns
+    -------
+
+    outputs : dict
+        Output of each stage.
+
+    report : dataframe
+        One row per stage with its key, whether it was cached and its wall time.
+    """
+    from src import import_process_data as ipd
+    from src.store import write_partition, list_partitions
+
+    if lmp_files is None:
+        lmp_files = ipd.LMP_FILES
+    outputs, keys, report = {}, {}, []
+
+    def stage(stage_name, func, **kwargs):
+        start = time.perf_counter()
+        outputs[stage_name], keys[stage_name], cached = run_stage(stage_name, func, cache_dir=cache_dir, **kwargs)
+        report.append({'stage': stage_name, 'key': keys[stage_name][:12], 'cached': cached,
+                       'wall_s': time.perf_counter() - start})
+        return cached
+
+    stage('ingest', lambda: (*ipd.create_price_curves(lmp_files), ipd.obtain_format_hh_natgas_to_df(natgas_file)),
+          files=list(lmp_files) + [natgas_file], code=['src.import_process_data', 'src.time_axis'])
+
+    if iso_class is None:
+        system_paths = [system_files['gen'], system_files['load'], system_files['net_ex']]
+        stage('hourly', lambda: tuple(read_hourly_system_csv(path) for path in system_paths), files=system_paths,
+              code=['src.build_cache', 'src.time_axis'])
+    else:
+        stage('hourly', lambda: (ipd.scrape_process_caiso_generation_data(iso_class, oasis_start, oasis_end),
+                                 ipd.scrape_process_caiso_load_data(iso_class, oasis_start, oasis_end),
+                                 ipd.scrape_process_caiso_net_ex_data(iso_class, oasis_start, oasis_end)),
+              params={'oasis_start': list(oasis_start), 'oasis_end': list(oasis_end)},
+              code=['src.import_process_data', 'src.time_axis'])
+
+    def build_master():
+        np15, sp15, zp26, natgas = outputs['ingest']
+        gen, load, net_ex = outputs['hourly']
+        caiso = ipd.create_caiso_master_df(np15, sp15, zp26, gen, load, net_ex, natgas)
+        caiso = caiso.rename({'HH_$_million_BTU_not_seasonal_adj': 'HH_$_mill_BTU', 'total_mw': 'total_gen'}, axis=1)
+        caiso['HH_$_mill_BTU'] = pd.to_numeric(caiso['HH_$_mill_BTU'])
+        return ipd.impute_caiso_master(caiso, bad_dates, method)
+
+    master_cached = stage('master', build_master, params={'bad_dates': tuple(bad_dates), 'method': method},
+                          deps=[keys['ingest'], keys['hourly']],
+                          code=['src.import_process_data', 'src.impute', 'src.time_axis', 'src.build_cache'])
+    if not master_cached or len(list_partitions(name, store_dir)) == 0:
+        caiso, quality_report = outputs['master']
+        # A rebuilt master may differ in any month, so the stored one is replaced rather than appended to.
+        ipd.save_caiso_df_to_store(caiso, name, store_dir, rebuild=True)
+        write_partition(quality_report, f'{name}_quality', store_dir=store_dir)
+
+    stage('features', lambda: build_features(outputs['master'][0]), deps=[keys['master']],
+          code=['src.build_cache', 'src.features', 'src.kernels', 'src.time_axis'])
+    stage('windows', lambda: build_windows(outputs['features'], n_prev, list(window_columns)),
+          params={'n_prev': n_prev, 'window_columns': tuple(window_columns)}, deps=[keys['features']],
+          code=['src.build_cache', 'src.model'])
+
+    return outputs, pd.DataFrame(report)
+
+
+if __name__ == '__main__':
+
+    for attempt in ['first', 'no-change']:
+        outputs, report = build_caiso_pipeline()
+        print(attempt)
+        print(report.to_string(index=False))
@@ -0,0 +1,188 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _trend_weights(trend_window):
+    # Even windows use the 2 x MA so that the average stays centered on an hour, as in seasonal_decompose().
+    if trend_window % 2 == 0:
+        weights = np.ones(trend_window + 1)
+        weights[[0, -1]] = 0.5
+    else:
+        weights = np.ones(trend_window)
+    return weights / trend_window
+
+def init_decomposition(periods=(24, 168), trend_window=None, keep_history=True):
+    """
+    Creates the state of an online moving-average decomposition with one seasonal component per period.
+    Feed hours to the state with update_decomposition().
+
+    Parameters
+    ----------
+    periods : tuple of ints
+        Seasonal periods in hours, e.g. 24 for daily and 168 for weekly seasonality.
+        Components are estimated in the order provided, each from what is left after the previous ones.
+
+    trend_window : int
+        Length of the centered moving average used for the trend. Defaults to the longest period.
+
+    keep_history : bool
+        Keeps every finalized component so that decomposition_arrays() can return the full history.
+
+    Returns
+    -------
+
+    state : dict
+        Decomposition state.
+    """
+    if trend_window is None:
+        trend_window = max(periods)
+    weights = _trend_weights(trend_window)
+
+    return {'periods': tuple(periods),
+            'weights': weights,
+            'half': len(weights) // 2,
+            'tail': None,
+            'n_seen': 0,
+            'n_final': 0,
+            'phase_sums': None,
+            'phase_counts': None,
+            'keep_history': keep_history,
+            'history': {'observed': [], 'trend': [], 'resid': [], **{f'seasonal_{p}': [] for p in periods}}}
+
+def _phase_sums(phase, n_phases, values):
+    # Sums every column by phase in a single bincount over (phase, column) pairs. Missing values are skipped.
+    n_cols = values.shape[1]
+    observed = ~np.isnan(values)
+    flat_codes = (phase[:, None] * n_cols + np.arange(n_cols)).ravel()
+    sums = np.bincount(flat_codes, weights=np.where(observed, values, 0.0).ravel(), minlength=n_phases * n_cols)
+    counts = np.bincount(flat_codes, weights=observed.ravel(), minlength=n_phases * n_cols)
+    return sums.reshape(n_phases, n_cols), counts.reshape(n_phases, n_cols)
+
+def update_decomposition(state, new_values):
+    """
+    Adds new hours to an online decomposition and finalizes every hour whose centered trend is now known.
+    Each call costs time proportional to the new hours plus one trend window, regardless of the length of history.
+    Trend and residual are missing for the first half window, as in seasonal_decompose().
+    Seasonal components are running phase means and are not revised for hours that were already finalized.
+
+    Parameters
+    ----------
+    state : dict
+        Output of init_decomposition().
+
+    new_values : arr
+        New hourly prices with shape (n_new,) or (n_new, n_hubs).
+
+    Returns
+    -------
+
+    components : dict
+        Maps 'observed', 'trend', 'seasonal_<period>' and 'resid' to arrays covering only the newly finalized hours.
+    """
+    new_values = np.asarray(new_values, dtype=float)
+    if new_values.ndim == 1:
+        new_values = new_values[:, None]
+    n_cols = new_values.shape[1]
+    if state['tail'] is None:
+        state['tail'] = np.empty((0, n_cols))
+        state['phase_sums'] = [np.zeros((p, n_cols)) for p in state['periods']]
+        state['phase_counts'] = [np.zeros((p, n_cols)) for p in state['periods']]
+
+    weights, half = state['weights'], state['half']
+    buffer = np.concatenate([state['tail'], new_values])
+    buffer_start = state['n_seen'] - len(state['tail'])
+    n_seen = state['n_seen'] + len(new_values)
+
+    # Hours in [n_final, final_end) now have every value their centered trend needs.
+    times = np.arange(state['n_final'], max(n_seen - half, state['n_final']))
+    observed = buffer[times - buffer_start]
+    trend = np.full_like(observed, np.nan)
+    has_trend = times >= half
+    if has_trend.any():
+        windows = sliding_window_view(buffer, len(weights), axis=0)
+        trend[has_trend] = windows[times[has_trend] - half - buffer_start] @ weights
+
+    components = {'observed': observed, 'trend': trend}
+    remainder = observed - trend
+    total_seasonal = np.zeros_like(observed)
+    for i, period in enumerate(state['periods']):
+        phase = times % period
+        sums, counts = _phase_sums(phase[has_trend], period, remainder[has_trend])
+        state['phase_sums'][i] += sums
+        state['phase_counts'][i] += counts
+
+        # Center each seasonal pattern on zero so that its level stays in the trend.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            phase_means = state['phase_sums'][i] / state['phase_counts'][i]
+            is_known = np.isfinite(phase_means)
+            phase_means = phase_means - np.where(is_known, phase_means, 0).sum(axis=0) / is_known.sum(axis=0)
+        seasonal = phase_means[phase]
+
+        components[f'seasonal_{period}'] = seasonal
+        remainder = remainder - seasonal
+        total_seasonal = total_seasonal + seasonal
+    components['resid'] = observed - trend - total_seasonal
+
+    state['tail'] = buffer[-(len(weights) - 1):] if len(weights) > 1 else buffer[:0]
+    state['n_seen'] = n_seen
+    state['n_final'] = state['n_final'] + len(times)
+    if state['keep_history']:
+        for name, values in components.items():
+            state['history'][name].append(values)
+
+    return components
+
+def decomposition_arrays(state):
+    """
+    Returns the decomposition of every hour added so far, e.g. for plotting.
+    Hours that are not finalized yet have missing components.
+
+    Parameters
+    ----------
+    state : dict
+        Output of init_decomposition() that has been updated with update_decomposition().
+
+    Returns
+    -------
+
+    components : dict
+        Maps 'observed', 'trend', 'seasonal_<period>' and 'resid' to arrays with shape (n_hours, n_hubs).
+    """
+    if not state['keep_history']:
+        raise ValueError('The decomposition was initialized with keep_history=False.')
+
+    n_cols = state['tail'].shape[1]
+    n_pending = state['n_seen'] - state['n_final']
+    components = {}
+    for name, blocks in state['history'].items():
+        pending = state['tail'][len(state['tail']) - n_pending:] if name == 'observed' else np.full((n_pending, n_cols), np.nan)
+        components[name] = np.concatenate(blocks + [pending]) if blocks else pending
+    return components
+
+def decompose_multi_seasonal(lmp_matrix, periods=(24, 168), trend_window=None):
+    """
+    Decomposes a full price history into trend, seasonal and residual components in one pass.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Hourly prices with shape (n_hours,) or (n_hours, n_hubs).
+
+    periods : tuple of ints
+        Seasonal periods in hours.
+
+    trend_window : int
+        Length of the centered moving average used for the trend. Defaults to the longest period.
+
+    Returns
+    -------
+
+    components : dict
+        Maps 'observed', 'trend', 'seasonal_<period>' and 'resid' to arrays with shape (n_hours, n_hubs).
+
+    state : dict
+        Decomposition state that can be updated with new hours.
+    """
+    state = init_decomposition(periods, trend_window)
+    update_decomposition(state, lmp_matrix)
+    return decomposition_arrays(state), state
@@ -3,48 +3,116 @@ import numpy as np
 import matplotlib.pyplot as plt
 #%matplotlib inline
 import seaborn as sns
-from pandas.plotting import lag_plot
 
+from src.rollup import read_rollup
+from src.import_process_data import impute_caiso_master
+from src.build_cache import BUILD_CACHE_DIR, run_stage, load_stage_output
+from src.kernels import rolling_mean
+from src.time_axis import utc_hours, utc_hours_to_local
+from src.plotting import show_or_save
 
-def import_process_data_for_eda():
+
+# The legacy master csv was written as GMT - 7 hours all year rather than in Pacific time.
+LEGACY_MASTER_TZ = 'Etc/GMT+7'
+
+def import_process_data_for_eda(bad_dates=('2020-05-05',), method='seasonal', master_file='../data/caiso_master.csv',
+                                cache_dir=BUILD_CACHE_DIR):
     '''
-    Prepares CAISO master dataset for EDA by filling in May 1 to 4 with the data from April 27 to 30 and removing the data provided for May 5.
-    CAISO OASIS system seems to experienced and error in the beginning of May 2020.
+    Prepares CAISO master dataset for EDA by placing it on a complete hourly index and imputing missing hours.
+    CAISO OASIS system seems to experienced and error in the beginning of May 2020, which left May 1 to 4 and May 15 empty.
+    Hours on bad_dates are treated as missing as well.
+    The prepared dataset is cached under a hash of the master file, the code and the parameters, so it is only rebuilt
+    when one of them changes.
     
     Parameters
     ----------
-    caiso : dateframe
-        Final CAISO dataset that's comprised of all three hub's LMPs and exogenous variables, e.g. energy generation.
+    bad_dates : tuple of strings
+        Operating dates whose prices and volumes should be discarded and imputed.
+        
+    method : str
+        Imputation method - 'seasonal' (same hour last week), 'linear' or 'profile'.
+        
+    master_file : str
+        Path of the legacy CAISO master csv file, whose timestamps are GMT - 7 hours all year. If None, the latest
+        master stage of build_caiso_pipeline() is used as it was built, with the pipeline's bad dates and method.
+        
+    cache_dir : str
+        Directory of the build cache.
         
     Returns
     -------
     caiso_eda : dataframe
         A dateset that's been prepared for visualizations.
         
+    quality_report : dataframe
+        One row for each run of missing, duplicate or incomplete hours that was imputed.
+        
     '''
     
-    caiso = pd.read_csv('../data/caiso_master.csv')
-    caiso.drop('Unnamed: 0', axis=1, inplace=True)
-    caiso['INTERVAL_START_PT'] = pd.to_datetime(caiso['INTERVAL_START_PT']).apply(lambda x: x.replace(tzinfo=None))
-    caiso['INTERVAL_END_PT'] = pd.to_datetime(caiso['INTERVAL_END_PT']).apply(lambda x: x.replace(tzinfo=None))
-    caiso['date_hour_start'] = pd.to_datetime(caiso['date_hour_start']).apply(lambda x: x.replace(tzinfo=None))
-    caiso['OPR_DT_PT'] = pd.to_datetime(caiso['OPR_DT_PT'])
-    caiso.set_index('INTERVAL_START_PT', inplace=True)
-    caiso.rename({'HH_$_million_BTU_not_seasonal_adj': 'HH_$_mill_BTU', 'total_mw':'total_gen'},axis=1, inplace=True)
-    caiso['HH_$_mill_BTU'] = pd.to_numeric(caiso['HH_$_mill_BTU'])
-    apr_30_20 = caiso[caiso['OPR_DT_PT'] == '2020-04-30']
-    end_may20_hrly = pd.concat([apr_30_20, apr_30_20, apr_30_20, apr_30_20], axis=0)
-    beg_may_arr = pd.date_range(start='2020-05-01', end='2020-05-05', freq='H')[:-1]
-    end_may20_hrly.set_index(beg_may_arr, inplace=True)
-    caiso_eda = pd.concat([caiso, end_may20_hrly], axis=0)
-    caiso_eda.sort_index()
-    caiso_eda['total_re'] = caiso_eda['solar'] + caiso_eda['wind']
-    caiso_eda = caiso_eda[caiso_eda['OPR_DT_PT'] != '2020-05-05']
-    return caiso_eda
-
-def plot_day_ahead_hourly_prices(date_rng, lmp_curve, hub_name):
+    if master_file is None:
+        caiso_eda, quality_report = load_stage_output('master', cache_dir=cache_dir)
+        caiso_eda['total_re'] = caiso_eda['solar'] + caiso_eda['wind']
+        return caiso_eda, quality_report
+
+    def prepare():
+        caiso = pd.read_csv(master_file)
+        caiso.drop('Unnamed: 0', axis=1, inplace=True)
+        # Timestamps are placed on the UTC axis from the clock they were written in, then shown in Pacific time.
+        hour_utc = utc_hours(pd.DatetimeIndex(pd.to_datetime(caiso.pop('INTERVAL_START_PT'))), LEGACY_MASTER_TZ)
+        caiso.insert(0, 'HOUR_UTC', hour_utc)
+        caiso['INTERVAL_END_PT'] = utc_hours_to_local(hour_utc + 1)
+        caiso['date_hour_start'] = utc_hours_to_local(hour_utc)
+        caiso['OPR_DT_PT'] = pd.to_datetime(caiso['OPR_DT_PT'])
+        caiso.index = pd.Index(utc_hours_to_local(hour_utc), name='INTERVAL_START_PT')
+        caiso.rename({'HH_$_million_BTU_not_seasonal_adj': 'HH_$_mill_BTU', 'total_mw':'total_gen'},axis=1, inplace=True)
+        caiso['HH_$_mill_BTU'] = pd.to_numeric(caiso['HH_$_mill_BTU'])
+    
+        caiso_eda, quality_report = impute_caiso_master(caiso, bad_dates, method)
+        caiso_eda['total_re'] = caiso_eda['solar'] + caiso_eda['wind']
+        return caiso_eda, quality_report
+
+    return run_stage('eda', prepare, params={'bad_dates': tuple(bad_dates), 'method': method}, files=[master_file],
+                     code=['src.eda', 'src.import_process_data', 'src.impute', 'src.time_axis'], cache_dir=cache_dir)[0]
+
+def downsample_points(x, y, max_points):
+    '''
+    Thins a dense series for plotting by keeping the lowest and highest point of each of max_points / 2 consecutive
+    buckets, so price spikes and the envelope of the series survive.
+
+    Parameters
+    ----------
+    x : arr
+        Values of the x-axis, e.g. timestamps.
+
+    y : arr
+        Values of the y-axis. Missing values are dropped.
+
+    max_points : int
+        Maximum number of points to keep. Nothing is dropped if None.
+
+    Returns
+    -------
+    x : arr
+        Kept x values.
+
+    y : arr
+        Kept y values.
+    '''
+    y = np.asarray(y, dtype=float)
+    if max_points is None or len(y) <= max_points:
+        return x, y
+    valid = np.flatnonzero(~np.isnan(y))
+    bucket = np.arange(len(valid)) * (max_points // 2) // max(len(valid), 1)
+    order = valid[np.lexsort((y[valid], bucket))]
+    first = np.r_[True, np.diff(bucket) > 0]
+    last = np.r_[np.diff(bucket) > 0, True]
+    keep = np.unique(np.r_[order[first], order[last]])
+    return (x.iloc[keep] if hasattr(x, 'iloc') else x[keep]), y[keep]
+
+def plot_day_ahead_hourly_prices(date_rng, lmp_curve, hub_name, save_path=None, max_points=None):
     '''
     Graphs the hourly price on a scatter plot.
+    The points are rasterized, which keeps saved SVGs small and fast to render when they cover years of hours.
 
     Parameters
     ----------
@@ -54,20 +122,31 @@ def plot_day_ahead_hourly_prices(date_rng, lmp_curve, hub_name):
     lmp_curve: arr
         Comprised of the hourly prices from the selected CAISO hub.
 
+    hub_name : str
+        Name of the CAISO hub or node.
+
+    save_path : str
+        File the chart is saved to, e.g. a PNG or SVG. The chart is shown if None.
+
+    max_points : int
+        Downsamples the prices to at most max_points with downsample_points(). Every hour is plotted if None.
+
     Returns
     -------
 
     '''
-    
-    plt.figure(figsize=(18,7))
-    ax = sns.scatterplot(x=date_rng, y=lmp_curve)
-    ax.set_xlim(date_rng.min(),date_rng.max())
+    x_min, x_max = date_rng.min(), date_rng.max()
+    date_rng, lmp_curve = downsample_points(date_rng, lmp_curve, max_points)
+
+    fig, ax = plt.subplots(figsize=(18,7))
+    ax.scatter(date_rng, lmp_curve, s=36, edgecolors='white', linewidths=0.75, rasterized=True)
+    ax.set_xlim(x_min, x_max)
     ax.set_ylabel('$ / MWh', fontsize=12)
     ax.set_title(f'{hub_name} Day-Ahead Hourly Prices', fontsize=24, fontweight='bold')
     plt.tight_layout()
-    plt.show();
+    show_or_save(fig, save_path)
 
-def plot_price_curve_box_plot(hours_day, lmp_curve, df):
+def plot_price_curve_box_plot(hours_day, lmp_curve, df, hub_name='NP-15', save_path=None):
     """
     Shows the distribution of hourly prices for each our of the day for the provided duration.
 
@@ -82,22 +161,28 @@ def plot_price_curve_box_plot(hours_day, lmp_curve, df):
     df : dataframe
         Dataframe that contains historic electricity prices.
 
+    hub_name : str
+        Name of the CAISO hub or node.
+
+    save_path : str
+        File the chart is saved to. The chart is shown if None.
+
     Return
     -------
 
     """
 
-    plt.figure(figsize=(20,8))
+    fig, ax = plt.subplots(figsize=(20,8))
 
-    ax = sns.boxplot(x=hours_day, y=lmp_curve, palette='Set3', data=df)
-    ax.set_title('Distribution of NP-15 Wholesale Electricity Prices', fontsize=24, fontweight='bold')
+    sns.boxplot(x=hours_day, y=lmp_curve, palette='Set3', data=df, ax=ax)
+    ax.set_title(f'Distribution of {hub_name} Wholesale Electricity Prices', fontsize=24, fontweight='bold')
     ax.set_ylabel('$ / MWh', fontsize=12)
     ax.set_xlabel('Hour Ending', fontsize=16)
     ax.set_xlim(-0.5, 23.5)
     plt.tight_layout()
-    plt.show();
+    show_or_save(fig, save_path)
 
-def draw_lag_plots(lmp_curves_list, hub_names, lag=24):
+def draw_lag_plots(lmp_curves_list, hub_names, lag=24, save_path=None):
     """
     Plots the lag plot to evaluate the time-series data's autocorrelation.
 
@@ -112,57 +197,67 @@ def draw_lag_plots(lmp_curves_list, hub_names, lag=24):
     lag : int
         The difference in time of the two datapoints that are being evaluated for correlation.
 
+    save_path : str
+        File the chart is saved to. The chart is shown if None.
+
     """
     
-    fig, axs = plt.subplots(nrows=1, ncols=len(hub_names), sharey=True, figsize=(20,6))
+    fig, axs = plt.subplots(nrows=1, ncols=len(hub_names), sharey=True, figsize=(20,6), squeeze=False)
 
     for i, curve, h in zip(range(len(hub_names)), lmp_curves_list, hub_names):
-        lag_plot(curve, ax=axs[i], c='green', alpha=0.5, lag=24)
-        axs[i].set_title(f"{h} Lag Plot - 24 Hours", fontsize=16, fontweight='bold')
+        # Same axes as pandas' lag_plot, drawn as one rasterized scatter.
+        curve = np.asarray(curve, dtype=float)
+        axs[0, i].scatter(curve[:-lag], curve[lag:], c='green', alpha=0.5, rasterized=True)
+        axs[0, i].set_xlabel('y(t)')
+        axs[0, i].set_ylabel(f'y(t + {lag})')
+        axs[0, i].set_title(f"{h} Lag Plot - {lag} Hours", fontsize=16, fontweight='bold')
 
     plt.tight_layout()
-    plt.show();
+    show_or_save(fig, save_path)
 
 
-def plot_prcnt_re_gen_moving_avg(caiso_data, num_days=14):
+def plot_prcnt_re_gen_moving_avg(caiso_daily, num_days=14, save_path=None):
     """
     Plots the percentage of energy derived from renewable resources and the moving average based on selected number of days.
 
     Parameters
     ----------
-    caiso_data : dataframe
-        CAISO dataframe generated from import_process_data_for_eda().
+    caiso_daily : dataframe
+        Daily CAISO rollup from read_rollup(), which must include 'solar__sum', 'wind__sum' and 'total_gen__sum'.
 
     num_days : int
         Number of days to use to calculate the moving average.
 
+    save_path : str
+        File the chart is saved to. The chart is shown if None.
+
     Return
     -------
     """
-    caiso_daily = caiso_data.groupby('OPR_DT_PT').agg(func='sum').reset_index()
-    caiso_daily['total_re_gen'] = caiso_daily['solar'] + caiso_daily['wind'] 
-    caiso_daily['daily_prcnt_re_gen'] = caiso_daily['total_re_gen'] / caiso_daily['total_gen']
+    total_re_gen = caiso_daily['solar__sum'] + caiso_daily['wind__sum']
+    daily_prcnt_re_gen = total_re_gen / caiso_daily['total_gen__sum']
       
-    re_gen_rolling= caiso_daily['total_re_gen'].rolling(num_days).mean()
-    total_gen_rolling = caiso_daily['total_gen'].rolling(num_days).mean()
+    re_gen_rolling, total_gen_rolling = rolling_mean(np.column_stack([total_re_gen, caiso_daily['total_gen__sum']]),
+                                                     num_days).T
     prcnt_re_gen_rolling = re_gen_rolling / total_gen_rolling
-    days_arr = caiso_daily['OPR_DT_PT']
+    days_arr = caiso_daily.index
 
     fig, ax = plt.subplots(figsize=(20,8))
     
-    ax.plot(days_arr, caiso_daily['daily_prcnt_re_gen'], color='lightgrey', label='Actual')
+    ax.plot(days_arr, daily_prcnt_re_gen, color='lightgrey', label='Actual')
     ax.plot(days_arr, prcnt_re_gen_rolling, color='green', linewidth=3, label=f'{num_days}-day Moving Avg')
     ax.set_ylabel('% of Total Generation', fontsize=12)
     ax.set_title('Energy Generation Derived from Renewable Resources', fontsize=22, fontweight='bold')
     ax.set_xlim(days_arr.min(), days_arr.max())
     ax.legend()
     plt.tight_layout()
-    plt.show();
+    show_or_save(fig, save_path)
    
     
 if __name__ == '__main__':
 
-    caiso = import_process_data_for_eda()
+    caiso, quality_report = import_process_data_for_eda()
+    print(quality_report)
     date_arr = caiso.index
     np15_lmp = caiso['$_MWH_np15']
     sp15_lmp = caiso['$_MWH_sp15']
@@ -179,5 +274,6 @@ if __name__ == '__main__':
     draw_lag_plots(all_lmp, hub_names, 24)
     
     # Energy generation
-    plot_prcnt_re_gen_moving_avg(caiso, 14)
+    caiso_daily = read_rollup('caiso_master', 'daily', ['solar__sum', 'wind__sum', 'total_gen__sum'])
+    plot_prcnt_re_gen_moving_avg(caiso_daily, 14)
     
\ No newline at end of file
@@ -0,0 +1,360 @@
+import numpy as np
+import pandas as pd
+
+from src.store import STORE_DIR, list_partitions, write_partition, read_columns, read_dataset
+from src.time_axis import CAISO_TZ, utc_hours_to_local
+
+
+ENSEMBLE_METHODS = ('equal', 'inverse_rmse', 'stacking')
+MEMBER_DATASET = 'ensemble_members'
+
+
+def save_member_fcst(name, origins, fcst, hub_names, dataset=MEMBER_DATASET, store_dir=STORE_DIR):
+    """
+    Caches the forecasts of one ensemble member in the columnar store, one partition per member.
+    Saving a member again replaces its forecasts, so members can be added or refreshed without touching the others.
+
+    Parameters
+    ----------
+    name : str
+        Name of the member, e.g. 'arima' or 'lstm_warm'.
+
+    origins : arr
+        Index of the first forecasted hour for each origin.
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    hub_names : list of strings
+        Name of each hub, e.g. ['NP15', 'SP15', 'ZP26'].
+
+    dataset : str
+        Name of the member cache in the store.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    """
+    fcst = np.asarray(fcst, dtype=float)
+    n_origins, n_periods_fcst, n_hubs = fcst.shape
+    if n_hubs != len(hub_names):
+        raise ValueError('fcst must have one column per hub.')
+    cache = pd.DataFrame(fcst.reshape(n_origins * n_periods_fcst, n_hubs), columns=list(hub_names))
+    cache.insert(0, 'origin', np.repeat(np.asarray(origins, dtype=np.int64), n_periods_fcst))
+    cache.insert(1, 'horizon', np.tile(np.arange(n_periods_fcst, dtype=np.int64), n_origins))
+    write_partition(cache, dataset, name, store_dir)
+
+def list_members(dataset=MEMBER_DATASET, store_dir=STORE_DIR):
+    return list_partitions(dataset, store_dir)
+
+def load_member_fcsts(members=None, hub_names=None, dataset=MEMBER_DATASET, store_dir=STORE_DIR):
+    """
+    Loads cached member forecasts into one array, keeping only the origins and horizons that every member covers.
+
+    Parameters
+    ----------
+    members : list of strings
+        Members to load. All cached members are loaded if None.
+
+    hub_names : list of strings
+        Hubs to load. Defaults to the hubs of the first member.
+
+    dataset : str
+        Name of the member cache in the store.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    member_fcsts : arr
+        Forecasted prices with shape (n_members, n_origins, n_periods_fcst, n_hubs).
+
+    origins : arr
+        Index of the first forecasted hour for each origin.
+
+    members : list of strings
+        Name of each member, in the order of the first axis.
+    """
+    if members is None:
+        members = list_members(dataset, store_dir)
+    if hub_names is None:
+        hub_names = [col for col in read_dataset(dataset, partitions=members[:1], store_dir=store_dir).columns
+                     if col not in ('origin', 'horizon')]
+
+    caches = [read_columns(dataset, ['origin', 'horizon'] + list(hub_names), [member], store_dir) for member in members]
+    n_periods_fcst = min(int(cache['horizon'].max()) + 1 for cache in caches)
+    origins = np.unique(caches[0]['origin'])
+    for cache in caches[1:]:
+        origins = np.intersect1d(origins, cache['origin'])
+
+    member_fcsts = np.full((len(members), len(origins), n_periods_fcst, len(hub_names)), np.nan)
+    for m, cache in enumerate(caches):
+        # Scatter each cached row to its (origin, horizon) cell, so members may cover origins in any order.
+        pos = np.searchsorted(origins, cache['origin'])
+        pos = np.minimum(pos, len(origins) - 1)
+        keep = (origins[pos] == cache['origin']) & (cache['horizon'] < n_periods_fcst)
+        for j, hub in enumerate(hub_names):
+            member_fcsts[m, pos[keep], cache['horizon'][keep], j] = cache[hub][keep]
+    return member_fcsts, origins, list(members)
+
+def hour_of_day_groups(origins, n_periods_fcst, hour_utc=None, tz=CAISO_TZ):
+    """
+    Labels every forecasted hour with its local hour of day, for per-hour combination weights.
+
+    Parameters
+    ----------
+    origins : arr
+        Index of the first forecasted hour for each origin.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    hour_utc : arr
+        HOUR_UTC of every row of the price matrix. Rows are assumed to start at midnight if None.
+
+    tz : str
+        Timezone of the market.
+
+    Returns
+    -------
+
+    groups : arr
+        Hour of day from 0 to 23 with shape (n_origins, n_periods_fcst).
+    """
+    target_idx = np.asarray(origins)[:, None] + np.arange(n_periods_fcst)
+    if hour_utc is None:
+        return target_idx % 24
+    return utc_hours_to_local(np.asarray(hour_utc)[target_idx.ravel()], tz).hour.values.reshape(target_idx.shape)
+
+def _group_codes(groups, shape):
+    if groups is None:
+        return np.zeros(shape, dtype=np.int64), 1
+    groups = np.asarray(groups, dtype=np.int64)
+    return np.broadcast_to(groups, shape), int(groups.max()) + 1
+
+def _group_sums(codes, n_groups, values):
+    # Sums values of shape (n_origins, n_periods_fcst, n_cols) by group in one bincount over (group, column) pairs.
+    n_cols = values.shape[-1]
+    flat_codes = (codes.reshape(-1, 1) * n_cols + np.arange(n_cols)).ravel()
+    return np.bincount(flat_codes, weights=values.ravel(), minlength=n_groups * n_cols).reshape(n_groups, n_cols)
+
+def inverse_rmse_weights(y_true, member_fcsts, groups=None, power=1.0):
+    """
+    Weights every member by its inverse RMSE, computed separately for each hub and group.
+
+    Parameters
+    ----------
+    y_true : arr
+        Actual prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    member_fcsts : arr
+        Forecasted prices with shape (n_members, n_origins, n_periods_fcst, n_hubs).
+
+    groups : arr
+        Integer group of every forecasted hour with shape (n_origins, n_periods_fcst), e.g. from hour_of_day_groups().
+        One set of weights per hub if None.
+
+    power : float
+        Exponent applied to the inverse RMSE. 2 weights members by inverse MSE.
+
+    Returns
+    -------
+
+    weights : arr
+        Weights with shape (n_groups, n_members, n_hubs) that sum to one over members.
+    """
+    n_members, n_origins, n_periods_fcst, n_hubs = member_fcsts.shape
+    codes, n_groups = _group_codes(groups, (n_origins, n_periods_fcst))
+    errors = member_fcsts - y_true
+    observed = ~np.isnan(errors).any(axis=0)
+
+    # Stack members along the last axis so that a single bincount handles every member and hub.
+    sq_errors = np.where(observed, errors ** 2, 0.0).transpose(1, 2, 0, 3).reshape(n_origins, n_periods_fcst, -1)
+    counts = np.repeat(observed[:, :, None, :], n_members, axis=2).reshape(n_origins, n_periods_fcst, -1)
+    sse = _group_sums(codes, n_groups, sq_errors).reshape(n_groups, n_members, n_hubs)
+    n_obs = _group_sums(codes, n_groups, counts.astype(float)).reshape(n_groups, n_members, n_hubs)
+
+    # Groups without observations fall back to equal weights.
+    score = np.where(n_obs > 0, (n_obs / np.maximum(sse, 1e-12)) ** (power / 2), 1.0)
+    return score / score.sum(axis=1, keepdims=True)
+
+def _simplex_lstsq(gram, cross, max_iter=100):
+    # Primal active-set method for min w'Gw - 2c'w subject to w >= 0 and sum(w) = 1, starting from equal weights.
+    # Members in the active set are held at zero and the rest solve the equality constrained problem exactly.
+    n_members = len(cross)
+    weights = np.full(n_members, 1.0 / n_members)
+    at_zero = np.zeros(n_members, dtype=bool)
+    for _ in range(max_iter):
+        free = np.flatnonzero(~at_zero)
+        kkt = np.zeros((len(free) + 1, len(free) + 1))
+        kkt[:-1, :-1] = gram[np.ix_(free, free)]
+        kkt[:-1, -1] = kkt[-1, :-1] = 1.0
+        solution = np.linalg.solve(kkt, np.append(cross[free], 1.0))
+        step = np.zeros(n_members)
+        step[free] = solution[:-1] - weights[free]
+
+        if np.abs(step).max() <= 1e-12:
+            # Multipliers of the members held at zero. A negative one means the loss falls if the member is freed.
+            multipliers = gram @ weights - cross + solution[-1]
+            multipliers[~at_zero] = np.inf
+            if multipliers.min() >= -1e-12:
+                break
+            at_zero[np.argmin(multipliers)] = False
+            continue
+
+        # Move towards the equality constrained solution until the first weight hits zero.
+        shrinking = np.flatnonzero(step < 0)
+        ratios = -weights[shrinking] / step[shrinking]
+        fraction = min(1.0, ratios.min()) if len(shrinking) > 0 else 1.0
+        weights = weights + fraction * step
+        if fraction < 1.0:
+            blocking = shrinking[np.argmin(ratios)]
+            weights[blocking] = 0.0
+            at_zero[blocking] = True
+    return np.maximum(weights, 0.0) / np.maximum(weights, 0.0).sum()
+
+def stacking_weights(y_true, member_fcsts, groups=None, ridge=1e-6, nonneg=True):
+    """
+    Learns combination weights by least squares regression of the actual prices on the member forecasts,
+    separately for each hub and group. The normal equations of every hub and group are built in one pass.
+
+    Parameters
+    ----------
+    y_true : arr
+        Actual prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    member_fcsts : arr
+        Forecasted prices with shape (n_members, n_origins, n_periods_fcst, n_hubs).
+
+    groups : arr
+        Integer group of every forecasted hour with shape (n_origins, n_periods_fcst).
+
+    ridge : float
+        Ridge penalty relative to the mean diagonal of the normal equations, for members that are nearly collinear.
+
+    nonneg : bool
+        Restricts weights to be non-negative and to sum to one, which keeps the combination interpretable. The
+        least squares problem is then solved exactly on the simplex rather than by rescaling unconstrained weights.
+
+    Returns
+    -------
+
+    weights : arr
+        Weights with shape (n_groups, n_members, n_hubs).
+    """
+    n_members, n_origins, n_periods_fcst, n_hubs = member_fcsts.shape
+    codes, n_groups = _group_codes(groups, (n_origins, n_periods_fcst))
+    observed = ~(np.isnan(member_fcsts).any(axis=0) | np.isnan(y_true))
+    X = np.where(observed, member_fcsts, 0.0)
+    y = np.where(observed, y_true, 0.0)
+
+    # Cross products of every pair of members and of every member with the actual prices, summed by group.
+    gram_terms = np.einsum('aoph,boph->opabh', X, X).reshape(n_origins, n_periods_fcst, -1)
+    cross_terms = np.einsum('aoph,oph->opah', X, y).reshape(n_origins, n_periods_fcst, -1)
+    gram = _group_sums(codes, n_groups, gram_terms).reshape(n_groups, n_members, n_members, n_hubs)
+    cross = _group_sums(codes, n_groups, cross_terms).reshape(n_groups, n_members, n_hubs)
+
+    gram = gram.transpose(0, 3, 1, 2)
+    cross = cross.transpose(0, 2, 1)
+    penalty = ridge * np.maximum(np.trace(gram, axis1=2, axis2=3) / n_members, 1e-12)
+    gram = gram + penalty[:, :, None, None] * np.eye(n_members)
+
+    if not nonneg:
+        weights = np.linalg.solve(gram, cross[..., None])[..., 0]
+    else:
+        weights = np.empty_like(cross)
+        for g in range(n_groups):
+            for h in range(n_hubs):
+                weights[g, h] = _simplex_lstsq(gram[g, h], cross[g, h])
+    return weights.transpose(0, 2, 1)
+
+def fit_ensemble_weights(y_true, member_fcsts, method='inverse_rmse', groups=None):
+    """
+    Learns combination weights with one of ENSEMBLE_METHODS.
+
+    Parameters
+    ----------
+    y_true : arr
+        Actual prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    member_fcsts : arr
+        Forecasted prices with shape (n_members, n_origins, n_periods_fcst, n_hubs).
+
+    method : str
+        'equal', 'inverse_rmse' or 'stacking'.
+
+    groups : arr
+        Integer group of every forecasted hour, e.g. from hour_of_day_groups(), for per-group weights.
+
+    Returns
+    -------
+
+    weights : arr
+        Weights with shape (n_groups, n_members, n_hubs).
+    """
+    if method not in ENSEMBLE_METHODS:
+        raise ValueError(f'method must be one of {ENSEMBLE_METHODS}.')
+    if method == 'inverse_rmse':
+        return inverse_rmse_weights(y_true, member_fcsts, groups)
+    if method == 'stacking':
+        return stacking_weights(y_true, member_fcsts, groups)
+    n_groups = 1 if groups is None else int(np.max(groups)) + 1
+    n_members, n_hubs = member_fcsts.shape[0], member_fcsts.shape[-1]
+    return np.full((n_groups, n_members, n_hubs), 1.0 / n_members)
+
+def combine_member_fcsts(member_fcsts, weights, groups=None):
+    """
+    Combines member forecasts with learned weights for every origin at once.
+
+    Parameters
+    ----------
+    member_fcsts : arr
+        Forecasted prices with shape (n_members, n_origins, n_periods_fcst, n_hubs).
+
+    weights : arr
+        Output of fit_ensemble_weights().
+
+    groups : arr
+        Integer group of every forecasted hour. Must match the groups the weights were fit with.
+
+    Returns
+    -------
+
+    fcst : arr
+        Combined forecasts with shape (n_origins, n_periods_fcst, n_hubs).
+    """
+    n_origins, n_periods_fcst = member_fcsts.shape[1:3]
+    codes, _ = _group_codes(groups, (n_origins, n_periods_fcst))
+    # weights[codes] has shape (n_origins, n_periods_fcst, n_members, n_hubs).
+    return np.einsum('moph,opmh->oph', member_fcsts, weights[codes])
+
+
+if __name__ == '__main__':
+
+    from src.import_process_data import import_caiso_dataset
+    from src.baseline import (backtest_origins, stack_fcst_targets, seasonal_naive_fcst, profile_mean_fcst,
+                              ewm_profile_fcst, calc_baseline_rmse)
+
+    caiso = import_caiso_dataset('caiso_master')
+    hub_names = ['NP15', 'SP15', 'ZP26']
+    lmp_matrix = caiso[['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26']].values
+
+    origins = backtest_origins(len(lmp_matrix), 24, 60)
+    save_member_fcst('seasonal_naive', origins, seasonal_naive_fcst(lmp_matrix, origins, 24), hub_names)
+    save_member_fcst('profile_mean', origins, profile_mean_fcst(lmp_matrix, origins, 24), hub_names)
+    save_member_fcst('ewm_profile', origins, ewm_profile_fcst(lmp_matrix, origins, 24), hub_names)
+
+    member_fcsts, origins, members = load_member_fcsts()
+    y_true = stack_fcst_targets(lmp_matrix, origins, 24)
+    groups = hour_of_day_groups(origins, 24)
+
+    # Learn weights on the first 30 origins and evaluate on the rest.
+    for method in ENSEMBLE_METHODS:
+        weights = fit_ensemble_weights(y_true[:30], member_fcsts[:, :30], method, groups[:30])
+        fcst = combine_member_fcsts(member_fcsts[:, 30:], weights, groups[30:])
+        print(method, calc_baseline_rmse(y_true[30:], fcst))
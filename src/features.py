@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, Holiday, USMemorialDay, USLaborDay, USThanksgivingDay,
+                                    sunday_to_monday)
+
+from src.store import STORE_DIR, list_partitions, write_partition, read_columns, read_dataset
+from src.time_axis import hourly_axis, align_to_axis
+from src.kernels import lag_stack, rolling_mean, rolling_std
+
+
+PRICE_COLUMNS = ['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26']
+FEATURE_LAGS = (24, 48, 168)
+ROLLING_WINDOWS = (24, 168)
+# Rolling windows end at the day-ahead lag, so every feature of an hour is known when its price is forecast.
+ROLLING_LAG = 24
+# MMBtu of gas burned per MWh by a typical combined cycle plant.
+HEAT_RATE = 7.0
+# Hours of history needed before the first hour whose features are computed.
+FEATURE_HISTORY = max(max(FEATURE_LAGS), ROLLING_LAG + max(ROLLING_WINDOWS) - 1)
+MASTER_COLUMNS = ['HOUR_UTC', 'OPR_DT_PT', 'OPR_HR_PT', 'solar', 'wind', 'load_MW', 'HH_$_mill_BTU']
+
+
+class NERCHolidayCalendar(AbstractHolidayCalendar):
+    # The six NERC holidays are traded as off-peak days. Sunday holidays move to Monday, Saturday ones are not moved.
+    rules = [Holiday('New Years Day', month=1, day=1, observance=sunday_to_monday),
+             USMemorialDay,
+             Holiday('Independence Day', month=7, day=4, observance=sunday_to_monday),
+             USLaborDay,
+             USThanksgivingDay,
+             Holiday('Christmas Day', month=12, day=25, observance=sunday_to_monday)]
+
+
+def lag_matrix(values, lags=FEATURE_LAGS):
+    """
+    Stacks lagged copies of every column at once.
+
+    Parameters
+    ----------
+    values : arr
+        Hourly values on a complete time axis with shape (n_hours, n_cols).
+
+    lags : tuple of ints
+        Lags in hours.
+
+    Returns
+    -------
+
+    lagged : arr
+        Array with shape (n_hours, n_cols, len(lags)). Hours before the start of the series are NaN.
+    """
+    return lag_stack(values, lags)
+
+def rolling_mean_std(values, window):
+    """
+    Computes trailing rolling means and standard deviations of every column.
+    A window with any missing hour is NaN, as with pandas rolling windows.
+
+    Parameters
+    ----------
+    values : arr
+        Hourly values on a complete time axis with shape (n_hours, n_cols).
+
+    window : int
+        Window length in hours, including the current hour.
+
+    Returns
+    -------
+
+    mean : arr
+        Rolling means with shape (n_hours, n_cols).
+
+    std : arr
+        Rolling sample standard deviations with shape (n_hours, n_cols).
+    """
+    return rolling_mean(values, window), rolling_std(values, window)
+
+def calendar_features(opr_dt, opr_hr):
+    """
+    Encodes the hour of day, day of week, month and NERC holidays of every hour.
+    Hours and days are also encoded on the unit circle so that hour 24 sits next to hour 1.
+
+    Parameters
+    ----------
+    opr_dt : arr
+        Operating date of every hour.
+
+    opr_hr : arr
+        Hour ending of every hour, 1 to 25.
+
+    Returns
+    -------
+
+    calendar : dataframe
+        One row per hour.
+    """
+    opr_dt = pd.DatetimeIndex(pd.to_datetime(opr_dt)).normalize()
+    opr_hr = np.asarray(opr_hr, dtype=np.int64)
+    holidays = NERCHolidayCalendar().holidays(opr_dt.min(), opr_dt.max()) if len(opr_dt) > 0 else pd.DatetimeIndex([])
+    day_week = opr_dt.weekday.to_numpy()
+    hour_angle = 2 * np.pi * (np.minimum(opr_hr, 24) - 1) / 24
+    return pd.DataFrame({'hour': opr_hr,
+                         'hour_sin': np.sin(hour_angle),
+                         'hour_cos': np.cos(hour_angle),
+                         'day_week': day_week,
+                         'day_week_sin': np.sin(2 * np.pi * day_week / 7),
+                         'day_week_cos': np.cos(2 * np.pi * day_week / 7),
+                         'month': opr_dt.month.to_numpy(),
+                         'is_weekend': (day_week >= 5).astype(np.int64),
+                         'is_holiday': opr_dt.isin(holidays).astype(np.int64)})
+
+def compute_features(master, price_columns=PRICE_COLUMNS, lags=FEATURE_LAGS, windows=ROLLING_WINDOWS,
+                     rolling_lag=ROLLING_LAG, heat_rate=HEAT_RATE, n_history=0):
+    """
+    Computes lagged, rolling, calendar, net load and spark spread features for every hub in vectorized blocks.
+    Rows are placed on a complete hourly axis first, so lags and windows count hours even across gaps.
+
+    Parameters
+    ----------
+    master : dataframe or dict
+        Hourly CAISO data with HOUR_UTC, OPR_DT_PT, OPR_HR_PT, solar, wind, load_MW, HH_$_mill_BTU and the price
+        columns, sorted by HOUR_UTC.
+
+    price_columns : list of strings
+        Hub prices to derive features from.
+
+    lags : tuple of ints
+        Price lags in hours.
+
+    windows : tuple of ints
+        Rolling window lengths in hours.
+
+    rolling_lag : int
+        Lag of the last hour of each rolling window.
+
+    heat_rate : float
+        MMBtu per MWh used for the spark spread.
+
+    n_history : int
+        Leading rows that only serve as history and get no features.
+
+    Returns
+    -------
+
+    features : dataframe
+        One row per hour after the history with HOUR_UTC, OPR_DT_PT and '<column>__<feature>' columns.
+    """
+    hours = np.asarray(master['HOUR_UTC'], dtype=np.int64)
+    axis = hourly_axis(hours[0], hours[-1])
+    pos = hours[n_history:] - axis[0]
+    prices = align_to_axis(axis, hours, np.column_stack([np.asarray(master[col], dtype=float) for col in price_columns]))
+
+    blocks = {}
+    lagged = lag_matrix(prices, lags)
+    for k, lag in enumerate(lags):
+        blocks.update({f'{col}__lag{lag}': lagged[pos, j, k] for j, col in enumerate(price_columns)})
+
+    shifted = lag_matrix(prices, (rolling_lag,))[:, :, 0]
+    for window in windows:
+        mean, std = rolling_mean_std(shifted, window)
+        blocks.update({f'{col}__mean{window}': mean[pos, j] for j, col in enumerate(price_columns)})
+        blocks.update({f'{col}__std{window}': std[pos, j] for j, col in enumerate(price_columns)})
+
+    rows = slice(n_history, None)
+    solar, wind, load = (np.asarray(master[col], dtype=float)[rows] for col in ['solar', 'wind', 'load_MW'])
+    gas = np.asarray(master['HH_$_mill_BTU'], dtype=float)[rows]
+    blocks['net_load_MW'] = load - solar - wind
+    blocks.update({f'{col}__spark_spread': prices[pos, j] - heat_rate * gas for j, col in enumerate(price_columns)})
+
+    opr_dt = np.asarray(master['OPR_DT_PT'])[rows]
+    features = pd.DataFrame({'HOUR_UTC': hours[rows], 'OPR_DT_PT': pd.to_datetime(opr_dt)})
+    calendar = calendar_features(opr_dt, np.asarray(master['OPR_HR_PT'])[rows])
+    return pd.concat([features, calendar, pd.DataFrame(blocks)], axis=1)
+
+def feature_dataset(name):
+    return f'{name}_features'
+
+def _first_hour(name, partition, store_dir):
+    return read_columns(name, ['HOUR_UTC'], [partition], store_dir)['HOUR_UTC'].min()
+
+def update_features(name='caiso_master', price_columns=PRICE_COLUMNS, store_dir=STORE_DIR):
+    """
+    Writes or refreshes the feature store of a master dataset, partitioned by operating month.
+    As with the rollups, only the last stored month and any newer ones are recomputed, reading just enough earlier
+    hours to fill their lags and windows, so appending new hours costs at most one month.
+
+    Parameters
+    ----------
+    name : str
+        Name of the hourly master dataset in the store. Features are stored as '<name>_features'.
+
+    price_columns : list of strings
+        Hub prices to derive features from.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    months : list of strings
+        Partitions that were written.
+    """
+    partitions = list_partitions(name, store_dir)
+    existing = list_partitions(feature_dataset(name), store_dir)
+    # Master partitions are operating months. Only those from the last stored feature month on are recomputed, and
+    # earlier partitions are read only until they reach FEATURE_HISTORY hours back.
+    tail = 0 if len(existing) == 0 else int(np.searchsorted(partitions, existing[-1], side='left'))
+    if tail >= len(partitions):
+        return []
+    first_hour = _first_hour(name, partitions[tail], store_dir)
+    while tail > 0 and _first_hour(name, partitions[tail], store_dir) > first_hour - FEATURE_HISTORY:
+        tail -= 1
+
+    master = read_columns(name, MASTER_COLUMNS + list(price_columns), partitions[tail:], store_dir)
+    order = np.argsort(master['HOUR_UTC'], kind='stable')
+    master = {col: np.asarray(values)[order] for col, values in master.items()}
+    months = pd.DatetimeIndex(master['OPR_DT_PT']).to_period('M').astype(str).to_numpy()
+
+    start = 0 if len(existing) == 0 else np.searchsorted(months, existing[-1], side='left')
+    if start >= len(months):
+        return []
+
+    # Earlier hours are read only as history for the lags and windows of the recomputed months.
+    first = np.searchsorted(master['HOUR_UTC'], master['HOUR_UTC'][start] - FEATURE_HISTORY, side='left')
+    history = {col: values[first:] for col, values in master.items()}
+    features = compute_features(history, price_columns, n_history=start - first)
+    for month, chunk in features.groupby(months[start:]):
+        write_partition(chunk.reset_index(drop=True), feature_dataset(name), month, store_dir)
+    return sorted(set(months[start:]))
+
+def read_features(name='caiso_master', columns=None, months=None, store_dir=STORE_DIR):
+    """
+    Reads features from the feature store.
+
+    Parameters
+    ----------
+    name : str
+        Name of the master dataset.
+
+    columns : list of strings
+        Features to read. HOUR_UTC is always read. All features are read if None.
+
+    months : list of strings
+        Operating months to read. All months are read if None.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    features : dataframe
+        One row per hour.
+    """
+    if columns is not None:
+        columns = ['HOUR_UTC'] + [col for col in columns if col != 'HOUR_UTC']
+    return read_dataset(feature_dataset(name), columns, months, store_dir)
+
+
+if __name__ == '__main__':
+
+    print(update_features('caiso_master'))
+    print(read_features('caiso_master').describe().T)
@@ -0,0 +1,236 @@
+import os
+import time
+
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor
+from threadpoolctl import threadpool_limits
+
+try:
+    import lightgbm
+except ImportError:
+    lightgbm = None
+
+try:
+    import xgboost
+except ImportError:
+    xgboost = None
+
+from src.baseline import HOURS_DAY, HOURS_WEEK, seasonal_naive_fcst
+from src.kernels import rolling_mean, rolling_std
+from src.time_axis import CAISO_TZ, utc_hours_to_local
+
+
+GBM_BACKENDS = ('auto', 'lightgbm', 'xgboost', 'sklearn')
+# Shared names of the hyperparameters every backend has. Each backend maps them to its own names.
+DEFAULT_GBM_PARAMS = {'n_estimators': 300, 'learning_rate': 0.05, 'max_leaves': 31, 'min_samples_leaf': 20}
+PRICE_FEATURES = ['last', 'mean24', 'mean168', 'std168', 'naive24', 'naive168']
+CALENDAR_FEATURES = ['horizon', 'hour', 'day_week']
+
+
+def _resolve_backend(backend):
+    if backend not in GBM_BACKENDS:
+        raise ValueError(f'backend must be one of {GBM_BACKENDS}.')
+    if backend == 'auto':
+        return 'lightgbm' if lightgbm is not None else 'xgboost' if xgboost is not None else 'sklearn'
+    if (backend == 'lightgbm' and lightgbm is None) or (backend == 'xgboost' and xgboost is None):
+        raise ImportError(f'{backend} is not installed.')
+    return backend
+
+def _make_regressor(backend, params, n_threads, seed):
+    params = {**DEFAULT_GBM_PARAMS, **(params or {})}
+    n_estimators, learning_rate = params.pop('n_estimators'), params.pop('learning_rate')
+    max_leaves, min_samples_leaf = params.pop('max_leaves'), params.pop('min_samples_leaf')
+    if backend == 'lightgbm':
+        return lightgbm.LGBMRegressor(n_estimators=n_estimators, learning_rate=learning_rate, num_leaves=max_leaves,
+                                      min_child_samples=min_samples_leaf, n_jobs=n_threads, random_state=seed,
+                                      verbose=-1, **params)
+    if backend == 'xgboost':
+        return xgboost.XGBRegressor(n_estimators=n_estimators, learning_rate=learning_rate, max_leaves=max_leaves,
+                                    min_child_weight=min_samples_leaf, tree_method='hist', grow_policy='lossguide',
+                                    max_depth=0, n_jobs=n_threads, random_state=seed, **params)
+    return HistGradientBoostingRegressor(max_iter=n_estimators, learning_rate=learning_rate, max_leaf_nodes=max_leaves,
+                                         min_samples_leaf=min_samples_leaf, early_stopping=False, random_state=seed,
+                                         **params)
+
+def _target_calendar(target_idx, hour_utc, tz):
+    # Rows are assumed to start at midnight on a Monday if hour_utc is None.
+    if hour_utc is None:
+        return target_idx % 24, (target_idx // 24) % 7
+    local = utc_hours_to_local(np.asarray(hour_utc)[target_idx.ravel()], tz)
+    return local.hour.values.reshape(target_idx.shape), local.dayofweek.values.reshape(target_idx.shape)
+
+def gbm_feature_matrix(lmp_matrix, origins, n_periods_fcst, exog=None, hour_utc=None, tz=CAISO_TZ):
+    """
+    Builds the features of every origin, forecasted hour and hub at once.
+    Price features only use hours before the origin. Calendar and exogenous features belong to the forecasted hour, so
+    in a backtest the actual exogenous values stand in for their forecasts, as with arimax_predict().
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Regular hourly prices with one column per hub, i.e. shape (n_hours, n_hubs).
+
+    origins : arr
+        Index of the first forecasted hour for each origin. Every origin needs at least 168 hours of history.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    exog : arr
+        Hourly exogenous variables with shape (n_hours, n_exog), e.g. from load_exog_matrix(). None for no exogenous
+        features.
+
+    hour_utc : arr
+        HOUR_UTC of every row of the price matrix. Rows are assumed to start at midnight on a Monday if None.
+
+    tz : str
+        Timezone of the market.
+
+    Returns
+    -------
+
+    features : arr
+        Array with shape (n_origins, n_periods_fcst, n_hubs, n_features). Features are ordered as CALENDAR_FEATURES,
+        PRICE_FEATURES and then the exogenous columns.
+    """
+    lmp_matrix = np.asarray(lmp_matrix, dtype=float)
+    lmp_matrix = lmp_matrix[:, None] if lmp_matrix.ndim == 1 else lmp_matrix
+    origins = np.asarray(origins)
+    target_idx = origins[:, None] + np.arange(n_periods_fcst)
+    shape = target_idx.shape + (lmp_matrix.shape[1],)
+
+    hour, day_week = _target_calendar(target_idx, hour_utc, tz)
+    calendar = [np.broadcast_to(np.arange(n_periods_fcst)[None, :, None], shape),
+                np.broadcast_to(hour[..., None], shape),
+                np.broadcast_to(day_week[..., None], shape)]
+
+    # Rolling statistics at origin - 1 describe the last day and week before each origin.
+    prior = origins - 1
+    prices = [np.broadcast_to(lmp_matrix[prior][:, None], shape),
+              np.broadcast_to(rolling_mean(lmp_matrix, HOURS_DAY)[prior][:, None], shape),
+              np.broadcast_to(rolling_mean(lmp_matrix, HOURS_WEEK)[prior][:, None], shape),
+              np.broadcast_to(rolling_std(lmp_matrix, HOURS_WEEK)[prior][:, None], shape),
+              seasonal_naive_fcst(lmp_matrix, origins, n_periods_fcst, HOURS_DAY),
+              seasonal_naive_fcst(lmp_matrix, origins, n_periods_fcst, HOURS_WEEK)]
+
+    features = np.empty(shape + (len(calendar) + len(prices) + (0 if exog is None else np.shape(exog)[1]),))
+    for k, feature in enumerate(calendar + prices):
+        features[..., k] = feature
+    if exog is not None:
+        features[..., len(calendar) + len(prices):] = np.asarray(exog, dtype=float)[target_idx][:, :, None]
+    return features
+
+def gbm_fcst(lmp_matrix, origins, n_periods_fcst, exog=None, hour_utc=None, backend='auto', horizon_buckets=None,
+             train_step=HOURS_DAY, max_train_origins=None, params=None, n_threads=None, seed=0, tz=CAISO_TZ):
+    """
+    Forecasts every hub with gradient-boosted trees trained on engineered price, calendar and exogenous features.
+    Each hub gets a direct multi-horizon model that learns every forecasted hour at once with the horizon as a feature,
+    or one model per horizon bucket. Models are fit once on origins before the first forecast origin, whose targets
+    all fall before it, and trees are built on all cores, so every hub trains in seconds to minutes on a CPU.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Regular hourly prices with one column per hub, i.e. shape (n_hours, n_hubs).
+
+    origins : arr
+        Index of the first forecasted hour for each origin, e.g. from backtest_origins().
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    exog : arr
+        Hourly exogenous variables with shape (n_hours, n_exog), e.g. from load_exog_matrix().
+
+    hour_utc : arr
+        HOUR_UTC of every row of the price matrix, for the hour of day and day of week of every forecasted hour.
+
+    backend : str
+        'lightgbm', 'xgboost', 'sklearn' for HistGradientBoostingRegressor, or 'auto' for the first one installed.
+
+    horizon_buckets : tuple of ints
+        First horizon of each bucket, e.g. (0, 24, 72), to fit one model per bucket. One model covers every horizon
+        if None.
+
+    train_step : int
+        Number of hours between consecutive training origins. Training origins share the phase of the first origin.
+
+    max_train_origins : int
+        Only the most recent training origins are used. All origins with a week of history are used if None.
+
+    params : dict
+        Hyperparameters overriding DEFAULT_GBM_PARAMS. Other keys are passed to the backend's regressor.
+
+    n_threads : int
+        Number of threads per model. Defaults to the number of cores.
+
+    seed : int
+        Seed of the regressor.
+
+    tz : str
+        Timezone of the market.
+
+    Returns
+    -------
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    fit_seconds : arr
+        Training time of each hub.
+    """
+    backend = _resolve_backend(backend)
+    n_threads = n_threads or os.cpu_count() or 1
+    lmp_matrix = np.asarray(lmp_matrix, dtype=float)
+    lmp_matrix = lmp_matrix[:, None] if lmp_matrix.ndim == 1 else lmp_matrix
+    origins = np.asarray(origins)
+
+    train_origins = np.arange(origins[0] - train_step, HOURS_WEEK - 1, -train_step)[::-1]
+    if max_train_origins is not None:
+        train_origins = train_origins[-max_train_origins:]
+    if len(train_origins) == 0:
+        raise ValueError(f'The first origin needs more than {HOURS_WEEK + train_step} hours of history.')
+
+    x_train = gbm_feature_matrix(lmp_matrix, train_origins, n_periods_fcst, exog, hour_utc, tz)
+    x_fcst = gbm_feature_matrix(lmp_matrix, origins, n_periods_fcst, exog, hour_utc, tz)
+    # Hours from the first forecast origin on are never trained on.
+    target_idx = np.minimum(train_origins[:, None] + np.arange(n_periods_fcst), origins[0] - 1)
+    y_train = np.where((train_origins[:, None] + np.arange(n_periods_fcst) < origins[0])[..., None],
+                       lmp_matrix[target_idx], np.nan)
+
+    edges = np.unique(np.append(0, horizon_buckets if horizon_buckets is not None else []))
+    bucket = np.searchsorted(edges, np.arange(n_periods_fcst), side='right') - 1
+
+    fcst = np.full(x_fcst.shape[:3], np.nan)
+    fit_seconds = np.zeros(lmp_matrix.shape[1])
+    with threadpool_limits(n_threads):
+        for hub in range(lmp_matrix.shape[1]):
+            for b in range(len(edges)):
+                X, y = x_train[:, bucket == b, hub].reshape(-1, x_train.shape[-1]), y_train[:, bucket == b, hub].ravel()
+                keep = ~np.isnan(y)
+                start = time.perf_counter()
+                regressor = _make_regressor(backend, params, n_threads, seed).fit(X[keep], y[keep])
+                fit_seconds[hub] += time.perf_counter() - start
+                x_bucket = x_fcst[:, bucket == b, hub]
+                fcst[:, bucket == b, hub] = regressor.predict(x_bucket.reshape(-1, x_bucket.shape[-1])).reshape(
+                    x_bucket.shape[:2])
+    return fcst, fit_seconds
+
+
+if __name__ == '__main__':
+
+    from src.model import EXOG_COLUMNS, calc_rmse, load_exog_matrix
+    from src.store import read_column_matrix
+    from src.baseline import backtest_origins, stack_fcst_targets
+
+    hub_names = ['NP15', 'SP15', 'ZP26']
+    lmp_matrix = read_column_matrix('caiso_master', ['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26'])
+    hour_utc = read_column_matrix('caiso_master', ['HOUR_UTC'])[:, 0].astype(np.int64)
+    exog = load_exog_matrix('caiso_master', EXOG_COLUMNS)
+
+    # Ten-day forecasts from the last 30 days of origins, as for the baselines.
+    origins = backtest_origins(len(lmp_matrix), 240, 30)
+    y_true = stack_fcst_targets(lmp_matrix, origins, 240)
+    fcst, fit_seconds = gbm_fcst(lmp_matrix, origins, 240, exog, hour_utc, horizon_buckets=(0, 24, 72))
+    for j, hub in enumerate(hub_names):
+        print(hub, round(calc_rmse(y_true[..., j].ravel(), fcst[..., j].ravel()), 3), f'{fit_seconds[j]:.1f}s')
@@ -0,0 +1,211 @@
+import numpy as np
+
+from src.walk_forward import DEFAULT_LSTM_CONFIG
+
+
+def node_normalization(lmp_cube, train_end):
+    """
+    Computes the level and scale of every node from the hours before train_end, so that one model can share its
+    weights across nodes whose prices differ in level and volatility.
+
+    Parameters
+    ----------
+    lmp_cube : arr
+        Regular hourly prices with one column per node, i.e. shape (n_hours, n_nodes).
+
+    train_end : int
+        Index of the first hour that is not trained on.
+
+    Returns
+    -------
+
+    center : arr
+        Mean price of every node.
+
+    scale : arr
+        Standard deviation of every node's prices, 1 for constant or empty nodes.
+    """
+    history = np.asarray(lmp_cube, dtype=float)[:train_end]
+    with np.errstate(invalid='ignore'):
+        center = np.nan_to_num(np.nanmean(history, axis=0))
+        scale = np.nanstd(history, axis=0)
+    return center, np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+def _sample_windows(scaled, n_prev, n_periods_fcst, n_samples, train_end, rng):
+    # Draws (node, hour) pairs uniformly from the cube. Windows or targets with a missing hour are dropped.
+    nodes = rng.integers(0, scaled.shape[1], n_samples)
+    starts = rng.integers(n_prev, train_end - n_periods_fcst + 1, n_samples)
+    x = scaled[starts[:, None] + np.arange(-n_prev, 0), nodes[:, None]]
+    y = scaled[starts[:, None] + np.arange(n_periods_fcst), nodes[:, None]]
+    keep = ~(np.isnan(x).any(axis=1) | np.isnan(y).any(axis=1))
+    return x[keep, :, None], nodes[keep], y[keep]
+
+def build_global_lstm(n_prev, n_periods_fcst, n_series, embedding_dim=8, n_nodes=32, n_layers=1, dropout=0.0):
+    """
+    Builds and compiles an LSTM shared by every pricing node. Each node learns an embedding that is fed to the LSTM at
+    every time step next to its normalized prices, and every forecasted hour has its own output.
+
+    Parameters
+    ----------
+    n_prev : int
+        The number of values that comprise a sequence/window.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each window.
+
+    n_series : int
+        Number of pricing nodes.
+
+    embedding_dim : int
+        Length of each node's embedding.
+
+    n_nodes : int
+        Number of nodes at each LSTM layer.
+
+    n_layers : int
+        Number of stacked LSTM layers.
+
+    dropout : float
+        Dropout rate applied after each LSTM layer. 0 disables dropout.
+
+    Returns
+    -------
+
+    global_lstm : object
+        A compiled, untrained model taking [windows, node ids].
+    """
+    import tensorflow as tf
+    keras = tf.keras
+
+    window = keras.Input(shape=(n_prev, 1))
+    node_id = keras.Input(shape=(1,), dtype='int32')
+    embedding = keras.layers.Flatten()(keras.layers.Embedding(n_series, embedding_dim)(node_id))
+    x = keras.layers.Concatenate()([window, keras.layers.RepeatVector(n_prev)(embedding)])
+    for layer in range(n_layers):
+        x = keras.layers.LSTM(n_nodes, return_sequences=(layer < n_layers - 1))(x)
+        if dropout > 0:
+            x = keras.layers.Dropout(dropout)(x)
+    global_lstm = keras.Model([window, node_id], keras.layers.Dense(n_periods_fcst, activation='linear')(x))
+    global_lstm.compile(optimizer='adam', loss='mse')
+    return global_lstm
+
+def fit_global_lstm(lmp_cube, train_end=None, n_periods_fcst=24, config=None, embedding_dim=8, n_epochs=20,
+                    steps_per_epoch=100, seed=0):
+    """
+    Trains one LSTM over every pricing node on batches drawn at random from the node x hour cube.
+    An epoch is a fixed number of batches rather than a pass over every node, so training costs the same for ten
+    nodes as for five hundred, and hundreds of per-node fits are replaced by one.
+
+    Parameters
+    ----------
+    lmp_cube : arr
+        Regular hourly prices with one column per node, i.e. shape (n_hours, n_nodes).
+
+    train_end : int
+        Index of the first hour that is not trained on, e.g. the first forecast origin. Every hour is used if None.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each window.
+
+    config : dict
+        LSTM hyperparameters - n_layers, n_nodes, dropout, window, batch_size. Missing keys use DEFAULT_LSTM_CONFIG.
+
+    embedding_dim : int
+        Length of each node's embedding.
+
+    n_epochs : int
+        Number of epochs.
+
+    steps_per_epoch : int
+        Number of batches per epoch.
+
+    seed : int
+        Seed for the weight initialization and the sampled batches.
+
+    Returns
+    -------
+
+    global_lstm : object
+        The trained model.
+
+    normalization : tuple of arrs
+        Level and scale of every node from node_normalization().
+    """
+    import tensorflow as tf
+
+    config = {**DEFAULT_LSTM_CONFIG, **(config or {})}
+    lmp_cube = np.asarray(lmp_cube, dtype=float)
+    lmp_cube = lmp_cube[:, None] if lmp_cube.ndim == 1 else lmp_cube
+    train_end = len(lmp_cube) if train_end is None else train_end
+    if train_end < config['window'] + n_periods_fcst:
+        raise ValueError(f'Training needs at least {config["window"] + n_periods_fcst} hours.')
+
+    center, scale = node_normalization(lmp_cube, train_end)
+    scaled = (lmp_cube - center) / scale
+
+    tf.keras.utils.set_random_seed(seed)
+    rng = np.random.default_rng(seed)
+    global_lstm = build_global_lstm(config['window'], n_periods_fcst, lmp_cube.shape[1], embedding_dim,
+                                    config['n_nodes'], config['n_layers'], config['dropout'])
+    for epoch in range(n_epochs):
+        x, nodes, y = _sample_windows(scaled, config['window'], n_periods_fcst,
+                                      steps_per_epoch * config['batch_size'], train_end, rng)
+        global_lstm.fit([x, nodes], y, batch_size=config['batch_size'], epochs=epoch + 1, initial_epoch=epoch, verbose=0)
+    return global_lstm, (center, scale)
+
+def global_lstm_fcst(global_lstm, normalization, lmp_cube, origins, batch_size=4096):
+    """
+    Forecasts every node from every origin with a single batched inference call.
+    Missing hours in a window are filled with the node's mean.
+
+    Parameters
+    ----------
+    global_lstm : object
+        Model from fit_global_lstm().
+
+    normalization : tuple of arrs
+        Level and scale of every node from fit_global_lstm().
+
+    lmp_cube : arr
+        Regular hourly prices with one column per node, i.e. shape (n_hours, n_nodes).
+
+    origins : arr
+        Index of the first forecasted hour for each origin. Only hours before the origin are used.
+
+    batch_size : int
+        Number of windows per inference batch.
+
+    Returns
+    -------
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_nodes).
+    """
+    center, scale = normalization
+    lmp_cube = np.asarray(lmp_cube, dtype=float)
+    lmp_cube = lmp_cube[:, None] if lmp_cube.ndim == 1 else lmp_cube
+    n_prev = global_lstm.input_shape[0][1]
+    origins = np.asarray(origins)
+    n_series = lmp_cube.shape[1]
+
+    # Windows have shape (n_origins, n_prev, n_nodes) and are flattened origin-major so the output reshapes directly.
+    windows = (lmp_cube[origins[:, None] + np.arange(-n_prev, 0)] - center) / scale
+    x = np.nan_to_num(windows.transpose(0, 2, 1).reshape(-1, n_prev, 1))
+    nodes = np.tile(np.arange(n_series), len(origins))
+    fcst = global_lstm.predict([x, nodes], batch_size=batch_size, verbose=0)
+    return fcst.reshape(len(origins), n_series, -1).transpose(0, 2, 1) * scale + center
+
+
+if __name__ == '__main__':
+
+    from src.store import read_column_matrix
+    from src.baseline import backtest_origins, stack_fcst_targets, calc_baseline_rmse
+
+    hub_names = ['NP15', 'SP15', 'ZP26']
+    lmp_cube = read_column_matrix('caiso_master', ['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26'])
+
+    # Day-ahead forecasts from the last 30 days of origins, trained on the hours before the first origin.
+    origins = backtest_origins(len(lmp_cube), 24, 30)
+    global_lstm, normalization = fit_global_lstm(lmp_cube, origins[0], 24)
+    fcst = global_lstm_fcst(global_lstm, normalization, lmp_cube, origins)
+    print(dict(zip(hub_names, calc_baseline_rmse(stack_fcst_targets(lmp_cube, origins, 24), fcst).round(3).tolist())))
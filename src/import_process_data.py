@@ -1,10 +1,47 @@
+import os
+import shutil
+
 import pandas as pd
 import numpy as np
 import pyiso
 
-def create_price_curves():
+from src.store import write_partition, list_partitions
+from src.rollup import ROLLUP_FREQS, update_rollups
+from src.features import feature_dataset, update_features
+from src.impute import impute_hourly_gaps
+from src.time_axis import CAISO_TZ, utc_hours, utc_hours_to_local, hour_ending_labels
+from src.instrument import instrumented
+
+TIME_LABEL_COLUMNS = ['HOUR_UTC', 'INTERVAL_END_PT', 'date_hour_start', 'OPR_DT_PT', 'OPR_HR_PT', 'day_week', 'OPR_INTERVAL']
+
+# Monthly day-ahead LMP files exported from CAISO OASIS.
+LMP_FILES = ['../data/caiso_lmp_nodes/20190201_20190301_PRC_LMP_DAM_20200603_09_30_31_v1.csv',
+             '../data/caiso_lmp_nodes/20190301_20190401_PRC_LMP_DAM_20200603_09_21_36_v1.csv',
+             '../data/caiso_lmp_nodes/20190401_20190501_PRC_LMP_DAM_20200602_22_44_57_v1.csv',
+             '../data/caiso_lmp_nodes/20190501_20190601_PRC_LMP_DAM_20200602_22_54_16_v1.csv',
+             '../data/caiso_lmp_nodes/20190601_20190701_PRC_LMP_DAM_20200602_23_04_24_v1.csv',
+             '../data/caiso_lmp_nodes/20190701_20190801_PRC_LMP_DAM_20200602_23_20_18_v1.csv',
+             '../data/caiso_lmp_nodes/20190801_20190901_PRC_LMP_DAM_20200602_23_29_55_v1.csv',
+             '../data/caiso_lmp_nodes/20190901_20191001_PRC_LMP_DAM_20200602_23_46_12_v1.csv',
+             '../data/caiso_lmp_nodes/20191001_20191101_PRC_LMP_DAM_20200603_00_13_44_v1.csv',
+             '../data/caiso_lmp_nodes/20191101_20191201_PRC_LMP_DAM_20200603_00_24_23_v1.csv',
+             '../data/caiso_lmp_nodes/20191201_20200101_PRC_LMP_DAM_20200603_00_33_09_v1.csv',
+             '../data/caiso_lmp_nodes/20200101_20200201_PRC_LMP_DAM_20200603_08_11_05_v1.csv',
+             '../data/caiso_lmp_nodes/20200201_20200301_PRC_LMP_DAM_20200603_08_31_18_v1.csv',
+             '../data/caiso_lmp_nodes/20200301_20200401_PRC_LMP_DAM_20200603_08_32_02_v1.csv',
+             '../data/caiso_lmp_nodes/20200401_20200501_PRC_LMP_DAM_20200603_08_42_03_v1.csv',
+             '../data/caiso_lmp_nodes/20200501_20200601_PRC_LMP_DAM_20200603_08_45_10_v1.csv']
+
+@instrumented
+def create_price_curves(lmp_files=LMP_FILES):
     """
     Acquires and cleans the hourly LMP prices for the three CAISO hubs - NP15, SP15, ZP26 - from csv files that were produced using CAISO OATI system.
+    Hours are keyed by HOUR_UTC, i.e. int64 hours since 1970-01-01 UTC, which is unambiguous across daylight saving time.
+
+    Parameters
+    ----------
+    lmp_files : list of strings
+        Paths of the monthly OASIS LMP csv files.
 
     Returns
     -------
@@ -20,37 +57,15 @@ def create_price_curves():
 
     """
     # Import monthly csv files from CAISO website.
-    lmp_feb19 = pd.read_csv('../data/caiso_lmp_nodes/20190201_20190301_PRC_LMP_DAM_20200603_09_30_31_v1.csv')
-    lmp_mar19 = pd.read_csv('../data/caiso_lmp_nodes/20190301_20190401_PRC_LMP_DAM_20200603_09_21_36_v1.csv')
-    lmp_apr19 = pd.read_csv('../data/caiso_lmp_nodes/20190401_20190501_PRC_LMP_DAM_20200602_22_44_57_v1.csv')
-    lmp_may19 = pd.read_csv('../data/caiso_lmp_nodes/20190501_20190601_PRC_LMP_DAM_20200602_22_54_16_v1.csv')
-    lmp_jun19 = pd.read_csv('../data/caiso_lmp_nodes/20190601_20190701_PRC_LMP_DAM_20200602_23_04_24_v1.csv')
-    lmp_jul19 = pd.read_csv('../data/caiso_lmp_nodes/20190701_20190801_PRC_LMP_DAM_20200602_23_20_18_v1.csv')
-    lmp_aug19 = pd.read_csv('../data/caiso_lmp_nodes/20190801_20190901_PRC_LMP_DAM_20200602_23_29_55_v1.csv')
-    lmp_sep19 = pd.read_csv('../data/caiso_lmp_nodes/20190901_20191001_PRC_LMP_DAM_20200602_23_46_12_v1.csv')
-    lmp_oct19 = pd.read_csv('../data/caiso_lmp_nodes/20191001_20191101_PRC_LMP_DAM_20200603_00_13_44_v1.csv')
-    lmp_nov19 = pd.read_csv('../data/caiso_lmp_nodes/20191101_20191201_PRC_LMP_DAM_20200603_00_24_23_v1.csv')
-    lmp_dec19 = pd.read_csv('../data/caiso_lmp_nodes/20191201_20200101_PRC_LMP_DAM_20200603_00_33_09_v1.csv')
-    lmp_jan20 = pd.read_csv('../data/caiso_lmp_nodes/20200101_20200201_PRC_LMP_DAM_20200603_08_11_05_v1.csv')
-    lmp_feb20 = pd.read_csv('../data/caiso_lmp_nodes/20200201_20200301_PRC_LMP_DAM_20200603_08_31_18_v1.csv')
-    lmp_mar20 = pd.read_csv('../data/caiso_lmp_nodes/20200301_20200401_PRC_LMP_DAM_20200603_08_32_02_v1.csv')
-    lmp_apr20 = pd.read_csv('../data/caiso_lmp_nodes/20200401_20200501_PRC_LMP_DAM_20200603_08_42_03_v1.csv')
-    lmp_may20 = pd.read_csv('../data/caiso_lmp_nodes/20200501_20200601_PRC_LMP_DAM_20200603_08_45_10_v1.csv')
-
-
-    all_lmp_price = [lmp_feb19, lmp_mar19, lmp_apr19, lmp_may19, lmp_jun19, lmp_jul19, lmp_aug19, lmp_sep19, lmp_oct19, lmp_nov19, lmp_dec19,
-                 lmp_jan20, lmp_feb20, lmp_mar20, lmp_apr20, lmp_may20]
+    all_lmp_price = [pd.read_csv(lmp_file) for lmp_file in lmp_files]
 
     lmp_19_20 = pd.concat(all_lmp_price, axis=0).reset_index()
     lmp_19_20 = lmp_19_20[lmp_19_20['LMP_TYPE'] == 'LMP'].copy()
     lmp_19_20.columns=lmp_19_20.columns.str.strip()
-    lmp_19_20['interval_start'] =  lmp_19_20['OPR_DT'].apply(lambda x: datetime.strptime(x, '%Y-%m-%d'))
-    lmp_19_20.sort_values(by=['OPR_DT','OPR_HR'], inplace=True)
-    lmp_19_20['INTERVALSTARTTIME_GMT'] = pd.to_datetime(lmp_19_20['INTERVALSTARTTIME_GMT'])
-    lmp_19_20['INTERVALENDTIME_GMT'] = pd.to_datetime(lmp_19_20['INTERVALENDTIME_GMT'])
-    lmp_19_20['INTERVAL_START_PT'] = lmp_19_20['INTERVALSTARTTIME_GMT'] - timedelta(hours=7)
-    lmp_19_20['INTERVAL_END_PT'] = lmp_19_20['INTERVALENDTIME_GMT'] - timedelta(hours=7)
-    lmp_19_20_sub = lmp_19_20[['OPR_DT','OPR_HR', 'OPR_INTERVAL', 'NODE_ID', 'GROUP', 'POS', 'MW', 'INTERVAL_START_PT', 'INTERVAL_END_PT']].copy().reset_index()
+    # The GMT interval start is the only unambiguous timestamp in the files. Local time is derived later for display only.
+    lmp_19_20['HOUR_UTC'] = utc_hours(lmp_19_20['INTERVALSTARTTIME_GMT'])
+    lmp_19_20.sort_values(by='HOUR_UTC', inplace=True)
+    lmp_19_20_sub = lmp_19_20[['HOUR_UTC', 'OPR_DT','OPR_HR', 'OPR_INTERVAL', 'NODE_ID', 'GROUP', 'POS', 'MW']].copy().reset_index()
     lmp_19_20_sub.drop('index', axis=1, inplace=True)
     lmp_19_20_sub.rename({'OPR_DT':'OPR_DT_PT', 'OPR_HR': 'OPR_HR_PT', 'MW':'$_MWH'}, axis=1, inplace=True)
 
@@ -62,6 +77,7 @@ def create_price_curves():
 
 
 
+@instrumented
 def scrape_process_caiso_load_data(iso_class, oasis_start, oasis_end):
     """
     Uses pyiso library (created by WattTime) to scrape and parse the hourly energy consumption data from CAISO OASIS system.
@@ -84,8 +100,11 @@ def scrape_process_caiso_load_data(iso_class, oasis_start, oasis_end):
 
     load_pivot : dataframe
         Dataframe comprised of hourly consumption figures for all people/entities that live/operate within California and a portion of Nevada.
+        Hours are keyed by HOUR_UTC.
 
     """
+    caiso_load_dict = {}
+
     for start, end in zip(oasis_start, oasis_end):
         caiso_load_dict[start] = iso_class.get_load(start_at=start, end_at=end)
 
@@ -99,13 +118,14 @@ def scrape_process_caiso_load_data(iso_class, oasis_start, oasis_end):
     caiso_load_df = caiso_load_df.reset_index()
     caiso_load_df.drop(['index', 'ba_name'], axis=1, inplace=True)
 
-    caiso_load_df['date_hour_start'] = caiso_load_df['timestamp'].apply(lambda x: x.replace(microsecond=0,second=0, minute=0))
-    load_pivot = caiso_load_df.pivot_table(index='date_hour_start', values='load_MW', aggfunc='sum').reset_index()
-    load_pivot['date_hour_start'] = load_pivot['date_hour_start'].apply(lambda x: x.replace(tzinfo=None))
-    load_19_20['date_hour_start'] = pd.to_datetime(load_19_20['date_hour_start']).apply(lambda x: x.replace(tzinfo=None))
+    # Concatenating onto the empty frame above leaves object columns, which would not be summed as numbers.
+    caiso_load_df['load_MW'] = pd.to_numeric(caiso_load_df['load_MW'])
+    caiso_load_df['HOUR_UTC'] = utc_hours(caiso_load_df['timestamp'])
+    load_pivot = caiso_load_df.pivot_table(index='HOUR_UTC', values='load_MW', aggfunc='sum').reset_index()
 
     return load_pivot
 
+@instrumented
 def scrape_process_caiso_generation_data(iso_class, oasis_start, oasis_end) :
     """
     Uses pyiso library (created by WattTime) to scrape and parse the hourly energy consumption data from CAISO OASIS system.
@@ -128,8 +148,9 @@ def scrape_process_caiso_generation_data(iso_class, oasis_start, oasis_end) :
 
     gen_pivot : dataframe
         Dataframe comprised of hourly generation data of power facilities within in CAISO.
-        Generation is broken down by fuel sources, i.e. solar, wind, and other.
+        Generation is broken down by fuel sources, i.e. solar, wind, and other. Hours are keyed by HOUR_UTC.
     """
+    caiso_gen_dict = {}
 
     for start, end in zip(oasis_start, oasis_end):
         caiso_gen_dict[start] = iso_class.get_generation(start_at=start, end_at=end)
@@ -143,15 +164,16 @@ def scrape_process_caiso_generation_data(iso_class, oasis_start, oasis_end) :
     caiso_gen_df = caiso_gen_df.reset_index()
     caiso_gen_df.drop(['index', 'ba_name'], axis=1, inplace=True)
 
-    caiso_gen_df['date_hour_start'] = caiso_gen_df['timestamp'].apply(lambda x: x.replace(microsecond=0,second=0, minute=0))
-    gen_pivot = caiso_gen_df.pivot_table(index='date_hour_start', columns='fuel_name', values='gen_MW', aggfunc='sum').reset_index()
-    gen_pivot['date_hour_start'] = gen_pivot['date_hour_start'].apply(lambda x: x.replace(tzinfo=None))
+    caiso_gen_df['gen_MW'] = pd.to_numeric(caiso_gen_df['gen_MW'])
+    caiso_gen_df['HOUR_UTC'] = utc_hours(caiso_gen_df['timestamp'])
+    gen_pivot = caiso_gen_df.pivot_table(index='HOUR_UTC', columns='fuel_name', values='gen_MW', aggfunc='sum').reset_index()
+    gen_pivot.columns.name = None
     gen_pivot['total_mw'] = gen_pivot['other'] + gen_pivot['solar'] + gen_pivot['wind']
-    gen_pivot['date_hour_start'] = pd.to_datetime(gen_pivot['date_hour_start']).apply(lambda x: x.replace(tzinfo=None))
-    gen_pivot.sort_values(by='date_hour_start', inplace=True)
+    gen_pivot.sort_values(by='HOUR_UTC', inplace=True)
 
     return gen_pivot
 
+@instrumented
 def scrape_process_caiso_net_ex_data(iso_class, oasis_start, oasis_end) :
     """
     Uses pyiso library (created by WattTime) to scrape and parse the hourly net export (exports less imports) data from CAISO OASIS system.
@@ -174,7 +196,7 @@ def scrape_process_caiso_net_ex_data(iso_class, oasis_start, oasis_end) :
     -------
 
     gen_pivot : dataframe
-        Dataframe comprised of hourly net export data and corresponding time parameters.
+        Dataframe comprised of hourly net export data keyed by HOUR_UTC.
     """
 
     caiso_ex_im_dict = {}
@@ -192,19 +214,25 @@ def scrape_process_caiso_net_ex_data(iso_class, oasis_start, oasis_end) :
     caiso_net_ex_df = caiso_net_ex_df.reset_index()
     caiso_net_ex_df.drop(['index', 'ba_name'], axis=1, inplace=True)
 
-    caiso_net_ex_df['date_hour_start'] = caiso_net_ex_df['timestamp'].apply(lambda x: x.replace(microsecond=0,second=0, minute=0))
-    net_ex_pivot = caiso_net_ex_df.pivot_table(index='date_hour_start', values='net_exp_MW', aggfunc='sum').reset_index()
-    net_ex_pivot['date_hour_start'] = net_ex_pivot['date_hour_start'].apply(lambda x: x.replace(tzinfo=None))
-    net_ex_pivot.sort_values(by='date_hour_start', inplace=True)
+    caiso_net_ex_df['net_exp_MW'] = pd.to_numeric(caiso_net_ex_df['net_exp_MW'])
+    caiso_net_ex_df['HOUR_UTC'] = utc_hours(caiso_net_ex_df['timestamp'])
+    net_ex_pivot = caiso_net_ex_df.pivot_table(index='HOUR_UTC', values='net_exp_MW', aggfunc='sum').reset_index()
+    net_ex_pivot.sort_values(by='HOUR_UTC', inplace=True)
 
     return net_ex_pivot
 
-def obtain_format_hh_natgas_to_df():
+@instrumented
+def obtain_format_hh_natgas_to_df(natgas_file='../data/natgas_jan_19_may_20.csv'):
     """
     Acquire and cleans daily (not adjusted for season) Henry Hub daily natural gas prices.
 
     Data source: FRED
 
+    Parameters
+    ----------
+    natgas_file : str
+        Path of the FRED csv file.
+
     Returns
     -------
 
@@ -212,12 +240,13 @@ def obtain_format_hh_natgas_to_df():
         Dataframe comprise of daily prices and correpsonding dates.
     """
 
-    natgas = pd.read_csv('../data/natgas_jan_19_may_20.csv', names=['date', 'HH_$_million_BTU_not_seasonal_adj'], skiprows=1)
-    natgas['date'] = natgas_19_20['date'].apply(lambda x: datetime.strptime(x, '%Y-%m-%d'))
-    natgas['HH_$_million_BTU_not_seasonal_adj'] = np.where((natgas_19_20['HH_$_million_BTU_not_seasonal_adj'] == '.'),
-                                                           np.nan, natgas_19_20['HH_$_million_BTU_not_seasonal_adj'])
+    natgas = pd.read_csv(natgas_file, names=['date', 'HH_$_million_BTU_not_seasonal_adj'], skiprows=1)
+    natgas['date'] = pd.to_datetime(natgas['date'], format='%Y-%m-%d')
+    natgas['HH_$_million_BTU_not_seasonal_adj'] = np.where((natgas['HH_$_million_BTU_not_seasonal_adj'] == '.'),
+                                                           np.nan, natgas['HH_$_million_BTU_not_seasonal_adj'])
     return natgas
 
+@instrumented
 def create_caiso_master_df(np15, sp15, zp26, gen, load, net_ex, natgas):
     """
     Merges and process the provided dataframe.
@@ -254,69 +283,176 @@ def create_caiso_master_df(np15, sp15, zp26, gen, load, net_ex, natgas):
 
     caiso_final : dataframe
         A dataset that almagamated and cleaned all the provided parameters.
+        Indexed by timezone-aware Pacific time, with the HOUR_UTC column as the canonical time axis.
 
     """
 
-    all_lmp = pd.merge(np15, sp15, how='left', on='INTERVAL_START_PT', suffixes=('_np15','_sp15'))
-    all_lmp = pd.merge(all_lmp, zp26, how='left', on ='INTERVAL_START_PT')
-    all_lmp = all_lmp_19_20[['INTERVAL_START_PT', 'INTERVAL_END_PT', 'OPR_DT_PT', 'OPR_HR_PT', 'OPR_INTERVAL', '$_MWH_np15', '$_MWH_sp15', '$_MWH']].copy()
-    all_lmp['INTERVAL_START_PT'] = pd.to_datetime(all_lmp['INTERVAL_START_PT']).apply(lambda x: x.replace(tzinfo=None))
-    all_lmp['INTERVAL_END_PT'] = pd.to_datetime(all_lmp['INTERVAL_END_PT']).apply(lambda x: x.replace(tzinfo=None))
-
+    all_lmp = np15[['HOUR_UTC', 'OPR_DT_PT', 'OPR_HR_PT', 'OPR_INTERVAL', '$_MWH']].rename({'$_MWH': '$_MWH_np15'}, axis=1)
+    all_lmp = pd.merge(all_lmp, sp15[['HOUR_UTC', '$_MWH']].rename({'$_MWH': '$_MWH_sp15'}, axis=1), how='left', on='HOUR_UTC')
+    all_lmp = pd.merge(all_lmp, zp26[['HOUR_UTC', '$_MWH']].rename({'$_MWH': '$_MWH_zp26'}, axis=1), how='left', on='HOUR_UTC')
 
-    # Merge LMPs and generation/consumption data.
-    caiso = pd.merge(all_lmp, gen, how='left', left_on='INTERVAL_START_PT', right_on ='date_hour_start')
-    caiso = pd.merge(caiso, load, how='left', left_on ='INTERVAL_START_PT', right_on = 'date_hour_start')
-    caiso = pd.merge(caiso_draft, net_ex, how='left', left_on ='INTERVAL_START_PT', right_on = 'date_hour_start', suffixes=('_load', '_net_ex'))
-    caiso['OPR_DT_PT'] = pd.to_datetime(caiso_draft['OPR_DT_PT'])
+    # Merge LMPs and generation/consumption data on the integer UTC hour.
+    caiso = pd.merge(all_lmp, gen, how='left', on='HOUR_UTC')
+    caiso = pd.merge(caiso, load, how='left', on='HOUR_UTC')
+    caiso = pd.merge(caiso, net_ex, how='left', on='HOUR_UTC')
+    caiso['OPR_DT_PT'] = pd.to_datetime(caiso['OPR_DT_PT'])
 
     # Monday = 0
     # Natural gas prices are not provided on Saturdays and Sundays.
-    caiso['day_week'] = caiso_draft['OPR_DT_PT'].apply(lambda x: x.weekday())
+    caiso['day_week'] = caiso['OPR_DT_PT'].dt.weekday
     caiso = pd.merge(caiso, natgas, how='left', left_on='OPR_DT_PT', right_on='date', validate='m:1')
 
     # Clean/organize data.
-    caiso_filled = caiso.copy()
-    caiso_filled['HH_$_million_BTU_not_seasonal_adj'] = caiso_draft_filled['HH_$_million_BTU_not_seasonal_adj'].fillna(method='ffill')
-    caiso_final = caiso_filled[['INTERVAL_START_PT', 'INTERVAL_END_PT', 'date_hour_start', 'OPR_DT_PT', 'OPR_HR_PT', 'day_week', 'OPR_INTERVAL', '$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26',
-                                  'other', 'solar', 'wind', 'total_mw', 'net_exp_MW', 'load_MW', 'HH_$_million_BTU_not_seasonal_adj']].copy()
+    caiso['HH_$_million_BTU_not_seasonal_adj'] = pd.to_numeric(caiso['HH_$_million_BTU_not_seasonal_adj']).ffill()
 
-    caiso.rename({'HH_$_million_BTU_not_seasonal_adj': 'HH_$_mill_BTU', 'total_mw':'total_gen'},axis=1, inplace=True)
-    caiso['HH_$_mill_BTU'] = pd.to_numeric(caiso['HH_$_mill_BTU'])
-    caiso['date_hour_start'] = pd.to_datetime(caiso['date_hour_start']).apply(lambda x: x.replace(tzinfo=None))
+    # Pacific time is derived from the UTC axis, so it is correct on both sides of daylight saving time.
+    caiso['INTERVAL_START_PT'] = utc_hours_to_local(caiso['HOUR_UTC'].values)
+    caiso['INTERVAL_END_PT'] = utc_hours_to_local(caiso['HOUR_UTC'].values + 1)
+    caiso_final = caiso[['INTERVAL_START_PT', 'INTERVAL_END_PT', 'HOUR_UTC', 'OPR_DT_PT', 'OPR_HR_PT', 'day_week', 'OPR_INTERVAL', '$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26',
+                         'other', 'solar', 'wind', 'total_mw', 'net_exp_MW', 'load_MW', 'HH_$_million_BTU_not_seasonal_adj']].copy()
 
-    caiso['INTERVAL_START_PT'] = pd.to_datetime(caiso['INTERVAL_START_PT']).apply(lambda x: x.replace(tzinfo=None))
-    caiso['INTERVAL_END_PT'] = pd.to_datetime(caiso['INTERVAL_END_PT']).apply(lambda x: x.replace(tzinfo=None))
-    caiso['date_hour_start'] = pd.to_datetime(caiso['date_hour_start']).apply(lambda x: x.replace(tzinfo=None))
-    caiso['OPR_DT_PT'] = pd.to_datetime(caiso['OPR_DT_PT']).apply(lambda x: x.replace(tzinfo=None))
-    caiso.rename({'HH_$_million_BTU_not_seasonal_adj': 'HH_$_mill_BTU', 'total_mw':'total_gen'},axis=1, inplace=True)
-    caiso['HH_$_mill_BTU'] = pd.to_numeric(caiso['HH_$_mill_BTU'])
-    
     caiso_final.set_index('INTERVAL_START_PT', inplace=True)
     caiso_final.sort_index(inplace = True)
     
     return caiso_final
 
+def _check_operating_days(opr_dt):
+    # A clock read in the wrong timezone shows up as 22 or 26 hour days around daylight saving time.
+    # The first and last day may be cut off by the data range.
+    hours_per_day = pd.Series(pd.to_datetime(opr_dt)).value_counts().sort_index().iloc[1:-1]
+    bad_days = hours_per_day[~hours_per_day.isin([23, 24, 25])]
+    if len(bad_days) > 0:
+        raise ValueError(f'Operating days must have 23, 24 or 25 hours, got {bad_days.to_dict()}.')
+
+@instrumented
+def impute_caiso_master(caiso, bad_dates=(), method='seasonal'):
+    """
+    Places the CAISO dataset on a complete hourly index and imputes missing and duplicate hours.
+    Prices, generation, load, net export and gas prices are imputed. Time labels of new hours follow the hour-ending convention used by OASIS.
+    The index is completed on the UTC axis, so daylight saving days keep their 23 or 25 hours.
+
+    Parameters
+    ----------
+    caiso : dataframe
+        CAISO dataset indexed by the timezone-aware INTERVAL_START_PT.
+
+    bad_dates : tuple of strings
+        Operating dates whose values should be discarded and imputed, e.g. days with known OASIS errors.
+
+    method : str
+        Imputation method - 'seasonal' (same hour last week), 'linear' or 'profile'.
+
+    Returns
+    -------
+
+    caiso_filled : dataframe
+        CAISO dataset with one row per hour.
+
+    quality_report : dataframe
+        One row for each run of missing, duplicate or incomplete hours that was imputed.
+    """
+    if pd.DatetimeIndex(caiso.index).tz is None:
+        # A naive clock is ambiguous: the legacy csv, for one, is a fixed GMT-7 rather than Pacific time.
+        raise ValueError('The index must be timezone-aware. Localize naive timestamps to the clock they were written in.')
+    caiso = caiso.copy()
+    # Every other column is a value. Numbers read as objects are converted, anything else is an error, not dropped.
+    value_cols = [col for col in caiso.columns if col not in TIME_LABEL_COLUMNS]
+    for col in value_cols:
+        try:
+            caiso[col] = pd.to_numeric(caiso[col])
+        except (ValueError, TypeError) as err:
+            raise ValueError(f'Column {col} of the CAISO dataset is not numeric.') from err
+    if len(bad_dates) > 0:
+        caiso.loc[pd.to_datetime(caiso['OPR_DT_PT']).isin(pd.to_datetime(list(bad_dates))), value_cols] = np.nan
+    caiso_filled, quality_report = impute_hourly_gaps(caiso, value_cols, method=method)
+
+    label_cols = [col for col in TIME_LABEL_COLUMNS if col in caiso.columns]
+    labels = caiso.loc[~caiso.index.duplicated(), label_cols].reindex(caiso_filled.index)
+    hours = caiso_filled.index[labels['OPR_DT_PT'].isna().values]
+    hours_utc = utc_hours(hours)
+    opr_dt, opr_hr = hour_ending_labels(hours_utc, CAISO_TZ)
+    new_labels = pd.DataFrame({'HOUR_UTC': hours_utc,
+                               'INTERVAL_END_PT': hours + pd.Timedelta(hours=1),
+                               'date_hour_start': hours,
+                               'OPR_DT_PT': opr_dt,
+                               'OPR_HR_PT': opr_hr,
+                               'day_week': opr_dt.dayofweek,
+                               'OPR_INTERVAL': 0}, index=hours)
+    labels.loc[hours, label_cols] = new_labels[label_cols]
+    for col in ['HOUR_UTC', 'OPR_HR_PT', 'day_week', 'OPR_INTERVAL']:
+        if col in label_cols:
+            labels[col] = labels[col].astype(int)
+
+    _check_operating_days(labels['OPR_DT_PT'])
+    return pd.concat([labels, caiso_filled], axis=1), quality_report
+
 def save_caiso_df_to_csv(dataset, file_name):
-    path_csv_name = 'data/' + file_name + '.csv'
+    path_csv_name = '../data/' + file_name + '.csv'
     dataset.to_csv(path_csv_name)
     
+@instrumented
+def save_caiso_df_to_store(dataset, name, store_dir='../data/store', rebuild=False):
+    """
+    Writes the CAISO dataset to the columnar store so that models can memory-map individual columns.
+    Columns are renamed to the names used in EDA and modeling.
+    The dataset is partitioned by operating month and, as with the rollups, only the last stored month and any newer
+    ones are written, so appending new hours touches at most one existing partition.
+    The daily and monthly rollups used by EDA and the feature store used by modeling are refreshed at the same time.
+
+    Parameters
+    ----------
+    dataset : dataframe
+        CAISO dataset generated by create_caiso_master_df(), sorted by time. It can span the full history.
+
+    name : str
+        Name of the dataset in the store.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    rebuild : bool
+        Deletes the stored dataset, its rollups and its features first, e.g. when older hours have changed.
+
+    Returns
+    -------
+
+    """
+    caiso = dataset.rename({'HH_$_million_BTU_not_seasonal_adj': 'HH_$_mill_BTU', 'total_mw':'total_gen'}, axis=1)
+    caiso['HH_$_mill_BTU'] = pd.to_numeric(caiso['HH_$_mill_BTU'])
+    months = pd.DatetimeIndex(pd.to_datetime(caiso['OPR_DT_PT'])).to_period('M').astype(str).to_numpy()
+
+    existing = list_partitions(name, store_dir)
+    # Datasets stored before they were partitioned by month hold everything in one 'all' partition.
+    if rebuild or existing[-1:] == ['all']:
+        derived = [name] if not rebuild else [name, feature_dataset(name)] + [f'{name}_{label}' for label in ROLLUP_FREQS]
+        for stored in derived:
+            shutil.rmtree(os.path.join(store_dir, stored), ignore_errors=True)
+        existing = []
+
+    start = 0 if len(existing) == 0 else np.searchsorted(months, existing[-1], side='left')
+    for month, chunk in caiso.iloc[start:].groupby(months[start:]):
+        write_partition(chunk, name, month, store_dir, index_name=caiso.index.name)
+    update_rollups(caiso, name, store_dir)
+    update_features(name, store_dir=store_dir)
+
 def import_caiso_dataset(version_name):
     path_csv_name = '../data/' + version_name + '.csv'
     return pd.read_csv(path_csv_name)
 
 if __name__ == '__main__':
     
+    from src.build_cache import build_caiso_pipeline
+
     oasis_start = pd.date_range(start='2019-01-15', end='2020-05-31', freq='14D')
     oasis_end = pd.date_range(start='2019-01-30', end='2020-06-05', freq='14D')
     
-    np15_lmp, sp15_lmp, zp26_lmp = create_price_curve()
-    
-    caiso = client_factory('CAISO', timeout_seconds=60)
-    load_data = scrape_process_caiso_load_data(caiso, oasis_start, oasis_end)
-    gen_data = scrape_process_caiso_generation_data(caiso, oasis_start, oasis_end)
-    net_ex_data = scrape_process_caiso_net_ex_data(caiso, oasis_start, oasis_end)
-    nat_gas = obtain_format_hh_natgas_to_df()
-    caiso_master = create_caiso_master_df(np15_lmp, sp15_lmp, zp26_lmp, gen_data, load_data, net_ex_data, nat_gas)
+    # Stages whose input files, code and parameters are unchanged are loaded from the build cache instead of rebuilt.
+    caiso = pyiso.client_factory('CAISO', timeout_seconds=60)
+    outputs, build_report = build_caiso_pipeline(iso_class=caiso, oasis_start=oasis_start, oasis_end=oasis_end,
+                                                 bad_dates=['2020-05-05'], name='caiso_master')
+    print(build_report)
     
-    save_caiso_df_to_csv(caiso_master, 'caiso_master_v02')
\ No newline at end of file
+    # The master is kept in the store and the build cache. EDA reads the cached master stage, so the raw
+    # ../data/caiso_master.csv is left as it was scraped.
+    caiso_master, quality_report = outputs['master']
+    print(quality_report)
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from src.time_axis import utc_hours, NS_PER_HOUR
+
+
+IMPUTE_METHODS = ('seasonal', 'linear', 'profile')
+
+# Issue codes recorded for each hour of the complete hourly grid.
+_ISSUES = {1: 'missing_hour', 2: 'duplicate_hour', 3: 'missing_value'}
+
+
+def _hours_to_timestamps(hours, tz, was_aware):
+    timestamps = pd.DatetimeIndex(pd.to_datetime(hours * NS_PER_HOUR, unit='ns'))
+    if tz is None:
+        return timestamps
+    timestamps = timestamps.tz_localize('UTC').tz_convert(tz)
+    return timestamps if was_aware else timestamps.tz_localize(None)
+
+def _grid_means(pos, n_hours, values):
+    # Averages duplicate hours and places every row on the grid in one bincount over (hour, column) pairs.
+    n_cols = values.shape[1]
+    observed = ~np.isnan(values)
+    flat_codes = (pos[:, None] * n_cols + np.arange(n_cols)).ravel()
+    sums = np.bincount(flat_codes, weights=np.where(observed, values, 0.0).ravel(), minlength=n_hours * n_cols)
+    counts = np.bincount(flat_codes, weights=observed.ravel(), minlength=n_hours * n_cols)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).reshape(n_hours, n_cols)
+
+def _fill_seasonal(grid, season):
+    # Folding the grid by season lines up the same hour of every week, so a forward fill along the folded axis
+    # copies the same hour from the most recent week that has a value.
+    n_hours, n_cols = grid.shape
+    n_seasons = -(-n_hours // season)
+    folded = np.full((n_seasons * season, n_cols), np.nan)
+    folded[:n_hours] = grid
+    folded = pd.DataFrame(folded.reshape(n_seasons, season * n_cols)).ffill().bfill().values
+    return folded.reshape(n_seasons * season, n_cols)[:n_hours]
+
+def _fill_profile(grid, phase, season):
+    profile = _grid_means(phase, season, grid)
+    return np.where(np.isnan(grid), profile[phase], grid)
+
+def impute_hourly_gaps(df, columns=None, method='seasonal', season=168, tz=None):
+    """
+    Places a dataset on a complete hourly grid and fills missing hours and values in one pass.
+    Duplicate hours are averaged. Missing values are filled with the same hour from the most recent prior season
+    ('seasonal'), linear interpolation ('linear') or the hour-of-week profile mean ('profile').
+
+    Parameters
+    ----------
+    df : dataframe
+        Hourly data with a DatetimeIndex.
+
+    columns : list of strings
+        Numeric columns to impute. Defaults to every numeric column.
+
+    method : str
+        One of 'seasonal', 'linear' or 'profile'.
+
+    season : int
+        Season length in hours for the 'seasonal' and 'profile' methods.
+
+    tz : str
+        Timezone of naive timestamps, e.g. 'US/Pacific'. Naive timestamps are treated as a regular hourly grid if None.
+
+    Returns
+    -------
+
+    filled : dataframe
+        The imputed columns on the complete hourly grid, with the same kind of index as df.
+
+    quality_report : dataframe
+        One row for each run of consecutive missing hours, duplicate hours or hours with missing values.
+    """
+    if method not in IMPUTE_METHODS:
+        raise ValueError(f'method must be one of {IMPUTE_METHODS}.')
+    if columns is None:
+        columns = list(df.select_dtypes('number').columns)
+
+    was_aware = pd.DatetimeIndex(df.index).tz is not None
+    out_tz = pd.DatetimeIndex(df.index).tz if was_aware else tz
+    hours = utc_hours(pd.DatetimeIndex(df.index), tz)
+    first_hour = hours.min()
+    pos = hours - first_hour
+    n_hours = pos.max() + 1
+
+    values = df[columns].apply(pd.to_numeric).to_numpy(dtype=float)
+    grid = _grid_means(pos, n_hours, values)
+    row_counts = np.bincount(pos, minlength=n_hours)
+
+    grid_hours = first_hour + np.arange(n_hours)
+    grid_index = _hours_to_timestamps(grid_hours, out_tz, was_aware)
+
+    issues = np.zeros(n_hours, dtype=np.int8)
+    issues[np.isnan(grid).any(axis=1)] = 3
+    issues[row_counts > 1] = 2
+    issues[row_counts == 0] = 1
+
+    if method == 'seasonal':
+        filled = _fill_seasonal(grid, season)
+    elif method == 'linear':
+        filled = pd.DataFrame(grid).interpolate(limit_direction='both').values
+    else:
+        # Profiles follow the local clock, so DST does not shift the hour of week.
+        if 168 % season == 0:
+            phase = (grid_index.dayofweek.values * 24 + grid_index.hour.values) % season
+        else:
+            phase = grid_hours % season
+        filled = _fill_profile(grid, phase, season)
+
+    filled = pd.DataFrame(filled, index=grid_index, columns=columns)
+    filled.index.name = df.index.name
+    return filled, _quality_report(issues, grid_index, method)
+
+def _quality_report(issues, grid_index, method):
+    # Finds runs of consecutive hours with the same issue without looping over hours.
+    change = np.flatnonzero(np.diff(issues) != 0) + 1
+    starts = np.concatenate([[0], change])
+    ends = np.concatenate([change, [len(issues)]]) - 1
+    keep = issues[starts] != 0
+    starts, ends = starts[keep], ends[keep]
+
+    return pd.DataFrame({'start': grid_index[starts],
+                         'end': grid_index[ends],
+                         'n_hours': ends - starts + 1,
+                         'issue': [_ISSUES[code] for code in issues[starts]],
+                         'method': method})
+
+def detect_hourly_gaps(timestamps, tz=None):
+    """
+    Reports runs of missing and duplicate hours against a complete hourly index.
+
+    Parameters
+    ----------
+    timestamps : arr
+        Hourly timestamps.
+
+    tz : str
+        Timezone of naive timestamps, e.g. 'US/Pacific'.
+
+    Returns
+    -------
+
+    quality_report : dataframe
+        One row for each run of consecutive missing or duplicate hours.
+    """
+    timestamps = pd.DatetimeIndex(timestamps)
+    marker = pd.DataFrame({'row': np.zeros(len(timestamps))}, index=timestamps)
+    _, quality_report = impute_hourly_gaps(marker, ['row'], method='linear', tz=tz)
+    return quality_report.drop(columns='method')
@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import functools
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then not recorded.
+    resource = None
+
+
+INSTRUMENT_LOG = '../data/instrument/stages.jsonl'
+PROFILE_DIR = '../data/instrument/profiles'
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# Setting LMP_INSTRUMENT to a log path turns instrumentation on for a whole run, e.g. the nightly pipeline.
+# LMP_PROFILE additionally selects a profiler.
+INSTRUMENT_ENV = 'LMP_INSTRUMENT'
+PROFILE_ENV = 'LMP_PROFILE'
+
+_CONFIG = {'enabled': False, 'log_path': INSTRUMENT_LOG, 'profile': None, 'profile_dir': PROFILE_DIR, 'stack': []}
+
+
+def enable_instrumentation(log_path=INSTRUMENT_LOG, profile=None, profile_dir=PROFILE_DIR):
+    """
+    Turns on stage instrumentation. Each instrumented stage appends one JSON record to the log.
+
+    Parameters
+    ----------
+    log_path : str
+        JSON lines file that stage records are appended to.
+
+    profile : str
+        'cprofile' or 'pyinstrument' to also dump a profile of every outermost stage. No profiling if None.
+
+    profile_dir : str
+        Directory that profiles are written to.
+
+    Returns
+    -------
+
+    """
+    if profile is not None and profile not in PROFILERS:
+        raise ValueError(f'profile must be one of {PROFILERS}.')
+    _CONFIG.update(enabled=True, log_path=log_path, profile=profile, profile_dir=profile_dir)
+
+def disable_instrumentation():
+    _CONFIG['enabled'] = False
+
+def peak_rss_mb():
+    # On Linux, ru_maxrss of a process started from a larger parent reports the parent's peak, while VmHWM is the
+    # process's own.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def current_rss_mb():
+    # Memory in use now, unlike peak_rss_mb(), which never falls once a process has peaked.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        # Without /proc or psutil the peak is the closest upper bound available.
+        return peak_rss_mb()
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+def _count_rows(obj):
+    # Tuples of outputs, e.g. (filled, quality_report), are counted by their first element.
+    if isinstance(obj, tuple) and len(obj) > 0:
+        obj = obj[0]
+    shape = getattr(obj, 'shape', None)
+    if shape is not None and len(shape) > 0:
+        return int(shape[0])
+    if isinstance(obj, (list, dict)):
+        return len(obj)
+    return None
+
+def _start_profiler(profile):
+    if profile == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+    return profiler
+
+def _dump_profile(profiler, profile, name, started):
+    os.makedirs(_CONFIG['profile_dir'], exist_ok=True)
+    stem = os.path.join(_CONFIG['profile_dir'], f"{name}_{started.strftime('%Y%m%dT%H%M%S')}")
+    if profile == 'cprofile':
+        profiler.disable()
+        path = stem + '.prof'
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = stem + '.html'
+        with open(path, 'w') as f:
+            f.write(profiler.output_html())
+    return path
+
+def _write_record(record):
+    log_dir = os.path.dirname(_CONFIG['log_path'])
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    with open(_CONFIG['log_path'], 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+@contextmanager
+def instrument_stage(name, rows=None):
+    """
+    Records wall time, CPU time, peak RSS and row count of a block of code.
+    Does nothing but yield when instrumentation is disabled.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, e.g. 'create_caiso_master_df'.
+
+    rows : int
+        Number of rows processed. Can also be set inside the block with record['rows'] = n.
+
+    Returns
+    -------
+
+    record : dict
+        The stage record, written to the log when the block exits.
+    """
+    record = {'stage': name, 'rows': rows}
+    if not _CONFIG['enabled']:
+        yield record
+        return
+
+    stack = _CONFIG['stack']
+    record['parent'] = stack[-1] if stack else None
+    # Profilers cannot be nested, so only the outermost stage is profiled.
+    profile = _CONFIG['profile'] if not stack else None
+    started = datetime.now(timezone.utc)
+    rss_before = peak_rss_mb()
+    profiler = _start_profiler(profile) if profile is not None else None
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+    stack.append(name)
+    status = 'ok'
+    try:
+        yield record
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        stack.pop()
+        wall_s, cpu_s = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        rss_after = peak_rss_mb()
+        record.update(started=started.isoformat(), wall_s=wall_s, cpu_s=cpu_s, peak_rss_mb=rss_after,
+                      rss_growth_mb=None if rss_after is None else rss_after - rss_before,
+                      status=status, pid=os.getpid())
+        if profiler is not None:
+            record['profile'] = _dump_profile(profiler, profile, name, started)
+        _write_record(record)
+
+def instrumented(func=None, name=None):
+    """
+    Decorates a pipeline function so that every call is recorded with instrument_stage().
+    Rows are counted from the result, or from the first argument when the result has no length, e.g. a fitted model.
+    When instrumentation is disabled the only overhead is one dictionary lookup per call.
+
+    Parameters
+    ----------
+    func : function
+        Function to decorate. Allows the decorator to be used with or without arguments.
+
+    name : str
+        Name of the stage. Defaults to the function name.
+
+    Returns
+    -------
+
+    wrapper : function
+        The instrumented function.
+    """
+    if func is None:
+        return functools.partial(instrumented, name=name)
+    stage = name if name is not None else func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _CONFIG['enabled']:
+            return func(*args, **kwargs)
+        with instrument_stage(stage) as record:
+            result = func(*args, **kwargs)
+            rows = _count_rows(result)
+            record['rows'] = rows if rows is not None or len(args) == 0 else _count_rows(args[0])
+        return result
+
+    return wrapper
+
+def read_stage_log(log_path=INSTRUMENT_LOG):
+    """
+    Reads the stage records of every instrumented run, e.g. to compare nightly runs for regressions.
+
+    Parameters
+    ----------
+    log_path : str
+        JSON lines file written by instrument_stage().
+
+    Returns
+    -------
+
+    stages : dataframe
+        One row per stage call.
+    """
+    stages = pd.read_json(log_path, lines=True)
+    if 'started' in stages.columns:
+        stages['started'] = pd.to_datetime(stages['started'], utc=True)
+    return stages
+
+
+if os.environ.get(INSTRUMENT_ENV):
+    enable_instrumentation(os.environ[INSTRUMENT_ENV], os.environ.get(PROFILE_ENV) or None)
@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from src.instrument import current_rss_mb
+from src.store import (STORE_DIR, write_partition, write_partition_columns, read_schema, read_columns, read_dataset,
+                       list_partitions)
+
+
+# Interval length in minutes of each CAISO market. FMM files carry the market run id RTPD.
+INTERVAL_MINUTES = {'DAM': 60, 'FMM': 15, 'RTM': 5}
+MARKET_RUN_IDS = {'DAM': 'DAM', 'RTPD': 'FMM', 'RTM': 'RTM'}
+# The price column is MW in DAM files, PRC in FMM files and VALUE in RTM files.
+PRICE_COLUMNS = ('MW', 'PRC', 'VALUE')
+HUB_COLUMNS = {'NP15SLAK_5_N001': '$_MWH_np15', 'SP26SLAK_5_N001': '$_MWH_sp15', 'ZP26SLAK_5_N001': '$_MWH_zp26'}
+HOURLY_STATS = ('mean', 'min', 'max', 'std', 'count')
+# A parsed chunk takes up to this many times its final size while the C parser builds it, plus the filtered copy.
+CHUNK_OVERHEAD = 4
+MIN_CHUNK_MEMORY_MB = 32
+
+
+def interval_dataset(market):
+    return f'caiso_{market.lower()}_lmp'
+
+def _read_lmp_chunks(lmp_file, nodes, chunk_rows=None):
+    header = pd.read_csv(lmp_file, nrows=0).columns.str.strip()
+    price_col = next(col for col in PRICE_COLUMNS if col in header)
+    wanted = {'INTERVALSTARTTIME_GMT', 'OPR_DT', 'NODE_ID', 'MARKET_RUN_ID', 'LMP_TYPE', price_col}
+    reader = pd.read_csv(lmp_file, usecols=lambda col: col.strip() in wanted, chunksize=chunk_rows,
+                         dtype={'NODE_ID': 'category', 'LMP_TYPE': 'category', 'MARKET_RUN_ID': 'category'})
+
+    for raw in ([reader] if chunk_rows is None else reader):
+        raw.columns = raw.columns.str.strip()
+        raw = raw[(raw['LMP_TYPE'] == 'LMP') & raw['NODE_ID'].isin(list(nodes))]
+
+        # Every interval repeats once per node, so parse the distinct start times and broadcast them back.
+        codes, starts = pd.factorize(raw['INTERVALSTARTTIME_GMT'])
+        start_minutes = pd.DatetimeIndex(pd.to_datetime(starts, utc=True, format='ISO8601')).as_unit('ns').asi8 // (60 * 10**9)
+        yield pd.DataFrame({'MINUTE_UTC': start_minutes[codes],
+                            'OPR_DT': raw['OPR_DT'].values,
+                            'NODE_ID': raw['NODE_ID'].astype(str).values,
+                            'MARKET': raw['MARKET_RUN_ID'].astype(str).map(MARKET_RUN_IDS).values,
+                            'PRICE': raw[price_col].to_numpy(dtype=float)})
+
+def read_interval_lmp_csv(lmp_file, nodes=HUB_COLUMNS):
+    """
+    Reads the LMPs of the requested nodes from an OASIS csv file of any market, reading only the columns needed.
+    Timestamps are parsed once per distinct interval rather than once per row.
+
+    Parameters
+    ----------
+    lmp_file : str
+        Path of an OASIS LMP csv file, e.g. PRC_INTVL_LMP (RTM), PRC_RTPD_LMP (FMM) or PRC_LMP (DAM).
+
+    nodes : dict
+        Maps node ids to output column names.
+
+    Returns
+    -------
+
+    intervals : dataframe
+        One row per node and interval with MINUTE_UTC, i.e. int64 minutes since 1970-01-01 UTC, OPR_DT, NODE_ID,
+        MARKET and the price in $/MWh.
+    """
+    return next(_read_lmp_chunks(lmp_file, nodes))
+
+def _chunk_rows(lmp_file, max_memory_mb):
+    # Sizes chunks from the parsed size of a sample, leaving room for the parser buffers and the filtered copies.
+    sample = pd.read_csv(lmp_file, nrows=10000, dtype={'NODE_ID': 'category', 'LMP_TYPE': 'category',
+                                                       'MARKET_RUN_ID': 'category'})
+    bytes_per_row = sample.memory_usage(deep=True).sum() / max(len(sample), 1)
+    in_use_mb = current_rss_mb()
+    available_mb = max_memory_mb - in_use_mb
+    if available_mb < MIN_CHUNK_MEMORY_MB:
+        raise ValueError(f'The RAM ceiling of {max_memory_mb} MB leaves less than {MIN_CHUNK_MEMORY_MB} MB '
+                         f'above the {in_use_mb:.0f} MB already in use.')
+    return max(1000, int(available_mb * 1024 ** 2 / (CHUNK_OVERHEAD * bytes_per_row)))
+
+def pivot_interval_lmp(intervals, nodes=HUB_COLUMNS):
+    """
+    Pivots long interval prices into one row per interval and one column per node by direct indexing.
+    When an interval appears more than once, the last value wins.
+
+    Parameters
+    ----------
+    intervals : dataframe
+        Output of read_interval_lmp_csv().
+
+    nodes : dict
+        Maps node ids to output column names.
+
+    Returns
+    -------
+
+    wide : dataframe
+        MINUTE_UTC, HOUR_UTC, OPR_DT_PT and one price column per node, sorted by MINUTE_UTC.
+    """
+    minute_axis, row = np.unique(intervals['MINUTE_UTC'].values, return_inverse=True)
+    node_ids = list(nodes)
+    col = pd.Categorical(intervals['NODE_ID'], categories=node_ids).codes
+
+    prices = np.full((len(minute_axis), len(node_ids)), np.nan)
+    prices[row, col] = intervals['PRICE'].values
+    opr_dt = np.empty(len(minute_axis), dtype=object)
+    opr_dt[row] = intervals['OPR_DT'].values
+
+    wide = pd.DataFrame(prices, columns=[nodes[node_id] for node_id in node_ids])
+    wide.insert(0, 'MINUTE_UTC', minute_axis)
+    wide.insert(1, 'HOUR_UTC', minute_axis // 60)
+    wide.insert(2, 'OPR_DT_PT', pd.to_datetime(opr_dt))
+    return wide
+
+def _staging_dataset(dataset):
+    return f'{dataset}_staging'
+
+def _merge_staged_month(dataset, month, pieces, store_dir):
+    # Yields the columns of a month one at a time. Every staged chunk holds some intervals of some nodes, and the last
+    # observed price of each node and interval wins, as when a file is read whole.
+    staging = _staging_dataset(dataset)
+    minutes = read_columns(staging, ['MINUTE_UTC'], pieces, store_dir)['MINUTE_UTC']
+    minute_axis, row = np.unique(minutes, return_inverse=True)
+    yield 'MINUTE_UTC', minute_axis
+    yield 'HOUR_UTC', minute_axis // 60
+
+    columns = [col['name'] for col in read_schema(staging, pieces[0], store_dir)['columns']]
+    for col in columns[2:]:
+        values = read_columns(staging, [col], pieces, store_dir)[col]
+        if col == 'OPR_DT_PT':
+            merged = np.full(len(minute_axis), np.datetime64('NaT'), dtype=values.dtype)
+        else:
+            merged = np.full(len(minute_axis), np.nan)
+        observed = ~np.isnan(values) if col != 'OPR_DT_PT' else ~np.isnat(values)
+        merged[row[observed]] = values[observed]
+        yield col, merged
+
+def ingest_interval_lmp(lmp_files, market='RTM', nodes=HUB_COLUMNS, store_dir=STORE_DIR, max_memory_mb=None):
+    """
+    Ingests OASIS interval LMP files at their native resolution into the columnar store, one partition per
+    operating month. Re-ingesting a month replaces its partition, so files can be added as they are published.
+
+    With a RAM ceiling, each file is streamed in chunks sized to the memory left under the ceiling. Every chunk keeps
+    only the rows of the requested nodes, is pivoted and goes straight into a staging partition of its month, so no
+    more than one chunk is held at a time. Each month is then merged from its staged chunks one column at a time, so
+    memory stays bounded whatever the size of the files and the number of nodes.
+
+    Parameters
+    ----------
+    lmp_files : list of strings
+        Paths of OASIS LMP csv files of one market.
+
+    market : str
+        'RTM' for 5-minute, 'FMM' for 15-minute or 'DAM' for hourly prices.
+
+    nodes : dict
+        Maps node ids to output column names.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    max_memory_mb : float
+        Resident memory of the process the ingest may reach. Files are read whole if None.
+
+    Returns
+    -------
+
+    months : list of strings
+        Partitions that were written.
+    """
+    if market not in INTERVAL_MINUTES:
+        raise ValueError(f'market must be one of {tuple(INTERVAL_MINUTES)}.')
+    dataset = interval_dataset(market)
+    staging = _staging_dataset(dataset)
+    shutil.rmtree(os.path.join(store_dir, staging), ignore_errors=True)
+
+    staged = {}
+    for lmp_file in lmp_files:
+        chunk_rows = None if max_memory_mb is None else _chunk_rows(lmp_file, max_memory_mb)
+        for intervals in _read_lmp_chunks(lmp_file, nodes, chunk_rows):
+            found = set(intervals['MARKET'].dropna().unique())
+            if found - {market}:
+                raise ValueError(f'Files contain {sorted(found)} prices, not {market}.')
+            if len(intervals) == 0:
+                continue
+            wide = pivot_interval_lmp(intervals, nodes)
+            months = wide['OPR_DT_PT'].dt.to_period('M').astype(str)
+            for month, chunk in wide.groupby(months.values):
+                pieces = staged.setdefault(month, [])
+                pieces.append(f'{month}_{len(pieces):06d}')
+                write_partition(chunk.reset_index(drop=True), staging, pieces[-1], store_dir)
+
+    for month, pieces in staged.items():
+        write_partition_columns(_merge_staged_month(dataset, month, pieces, store_dir), dataset, month, store_dir)
+    shutil.rmtree(os.path.join(store_dir, staging), ignore_errors=True)
+    return sorted(staged)
+
+_PEAK_RSS_SCRIPT = """
+import sys, json
+from src.instrument import peak_rss_mb
+from src.interval_ingest import ingest_interval_lmp
+ingest_interval_lmp(**json.loads(sys.argv[1]))
+print(peak_rss_mb())
+"""
+
+def measure_ingest_peak_rss(lmp_files, market='RTM', nodes=HUB_COLUMNS, store_dir=STORE_DIR, max_memory_mb=None):
+    """
+    Runs ingest_interval_lmp() in a fresh interpreter and measures its peak resident memory, which is not affected by
+    anything the calling process has imported or allocated.
+
+    Parameters
+    ----------
+    lmp_files : list of strings
+        Paths of OASIS LMP csv files of one market.
+
+    market : str
+        'RTM', 'FMM' or 'DAM'.
+
+    nodes : dict
+        Maps node ids to output column names.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    max_memory_mb : float
+        RAM ceiling of the ingest. Files are read whole if None.
+
+    Returns
+    -------
+
+    peak_mb : float
+        Peak resident memory of the ingest process in MB.
+    """
+    kwargs = {'lmp_files': list(lmp_files), 'market': market, 'nodes': nodes, 'store_dir': store_dir,
+              'max_memory_mb': max_memory_mb}
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([repo_dir, os.environ.get('PYTHONPATH', '')]))
+    done = subprocess.run([sys.executable, '-c', _PEAK_RSS_SCRIPT, json.dumps(kwargs)], capture_output=True, text=True,
+                          env=env)
+    if done.returncode != 0:
+        raise RuntimeError(f'The ingest failed:\n{done.stderr}')
+    return float(done.stdout.strip().splitlines()[-1])
+
+def read_interval_lmp(market='RTM', columns=None, months=None, store_dir=STORE_DIR):
+    """
+    Reads interval prices at native resolution from the columnar store.
+
+    Parameters
+    ----------
+    market : str
+        'RTM', 'FMM' or 'DAM'.
+
+    columns : list of strings
+        Price columns to read. MINUTE_UTC and HOUR_UTC are always read. All columns are read if None.
+
+    months : list of strings
+        Operating months to read, e.g. ['2020-01', '2020-02']. All months are read if None.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    intervals : dataframe
+        One row per interval.
+    """
+    if columns is not None:
+        columns = ['MINUTE_UTC', 'HOUR_UTC'] + [col for col in columns if col not in ('MINUTE_UTC', 'HOUR_UTC')]
+    return read_dataset(interval_dataset(market), columns, months, store_dir)
+
+def interval_hourly_rollup(minute_utc, prices, columns, stats=HOURLY_STATS):
+    """
+    Summarizes interval prices by hour in one pass. Intervals must be sorted by time, as stored by ingest_interval_lmp().
+    Missing intervals are skipped.
+
+    Parameters
+    ----------
+    minute_utc : arr
+        int64 start minute of every interval.
+
+    prices : arr
+        Interval prices with shape (n_intervals, n_cols).
+
+    columns : list of strings
+        Name of each price column.
+
+    stats : tuple of strings
+        Any of 'mean', 'min', 'max', 'std' and 'count'.
+
+    Returns
+    -------
+
+    rollup : dataframe
+        One row per hour indexed by HOUR_UTC, with '<column>__<stat>' columns as in the daily and monthly rollups.
+    """
+    prices = np.asarray(prices, dtype=float)
+    hours = np.asarray(minute_utc) // 60
+    hour_axis, starts = np.unique(hours, return_index=True)
+    observed = ~np.isnan(prices)
+    values = np.where(observed, prices, 0.0)
+
+    # Hours are contiguous runs of rows, so every statistic is a reduction over the same run boundaries.
+    count = np.add.reduceat(observed, starts, axis=0).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.add.reduceat(values, starts, axis=0) / count
+        sumsq = np.add.reduceat(values ** 2, starts, axis=0)
+        results = {'mean': mean,
+                   'min': np.fmin.reduceat(prices, starts, axis=0),
+                   'max': np.fmax.reduceat(prices, starts, axis=0),
+                   'std': np.sqrt(np.maximum(sumsq - count * mean ** 2, 0) / (count - 1)),
+                   'count': count}
+
+    rollup = pd.DataFrame({f'{col}__{stat}': results[stat][:, j] for j, col in enumerate(columns) for stat in stats},
+                          index=pd.Index(hour_axis, name='HOUR_UTC'))
+    return rollup
+
+def read_hourly_rollup(market='RTM', columns=None, months=None, stats=HOURLY_STATS, store_dir=STORE_DIR):
+    """
+    Computes hourly statistics of stored interval prices on demand, e.g. to join real-time volatility to the hourly
+    master dataset on HOUR_UTC. Columns are memory-mapped, so only the requested prices are read.
+
+    Parameters
+    ----------
+    market : str
+        'RTM' or 'FMM'.
+
+    columns : list of strings
+        Price columns to summarize. Defaults to every hub.
+
+    months : list of strings
+        Operating months to summarize. All months are summarized if None.
+
+    stats : tuple of strings
+        Any of 'mean', 'min', 'max', 'std' and 'count'.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    rollup : dataframe
+        One row per hour indexed by HOUR_UTC.
+    """
+    if columns is None:
+        columns = list(HUB_COLUMNS.values())
+    if months is None:
+        months = list_partitions(interval_dataset(market), store_dir)
+    data = read_columns(interval_dataset(market), ['MINUTE_UTC'] + list(columns), months, store_dir)
+    prices = np.column_stack([data[col] for col in columns])
+    return interval_hourly_rollup(data['MINUTE_UTC'], prices, columns, stats)
+
+
+if __name__ == '__main__':
+
+    import glob
+
+    ingest_interval_lmp(sorted(glob.glob('../data/caiso_lmp_rtm/*PRC_INTVL_LMP*.csv')), 'RTM')
+    ingest_interval_lmp(sorted(glob.glob('../data/caiso_lmp_fmm/*PRC_RTPD_LMP*.csv')), 'FMM')
+    print(read_hourly_rollup('RTM').head())
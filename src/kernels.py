@@ -0,0 +1,346 @@
+import numpy as np
+from scipy import signal
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+KERNEL_BACKENDS = ('auto', 'numba', 'numpy')
+# Memory the NumPy rolling quantile may use for its sliding windows at once.
+QUANTILE_CHUNK_MB = 256
+# Series per parallel block of the numba kernels.
+KERNEL_BLOCK = 64
+
+
+def _resolve_backend(backend):
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError(f'backend must be one of {KERNEL_BACKENDS}.')
+    if backend == 'numba' and numba is None:
+        raise ImportError('numba is not installed.')
+    return 'numba' if backend == 'auto' and numba is not None else backend if backend != 'auto' else 'numpy'
+
+def _as_series_major(values):
+    # The rolling quantile walks each series on its own, so every series is made contiguous.
+    values = np.asarray(values, dtype=float)
+    return np.ascontiguousarray(values.reshape(len(values), -1).T)
+
+def _restore_shape(out, values):
+    return np.ascontiguousarray(out.T).reshape(np.shape(values))
+
+def _as_hour_major(values):
+    values = np.asarray(values, dtype=float)
+    return np.ascontiguousarray(values.reshape(len(values), -1))
+
+
+if numba is not None:
+
+    # Hours are walked in order by every kernel. Series are split into blocks of columns that run in parallel, so each
+    # hour reads one contiguous run of a row and the (n_hours, n_series) layout needs no transposed copy.
+    @numba.njit(parallel=True, cache=True)
+    def _rolling_moments_nb(x, window, want_std, block):
+        n_hours, n_series = x.shape
+        out = np.full((n_hours, n_series), np.nan)
+        for b in numba.prange((n_series + block - 1) // block):
+            lo, hi = b * block, min((b + 1) * block, n_series)
+            # Centring on the first observation keeps the running sums of squares from cancelling.
+            centre = np.zeros(hi - lo)
+            for j in range(hi - lo):
+                for t in range(n_hours):
+                    if not np.isnan(x[t, lo + j]):
+                        centre[j] = x[t, lo + j]
+                        break
+            total, total_sq = np.zeros(hi - lo), np.zeros(hi - lo)
+            n_missing = np.zeros(hi - lo, dtype=np.int64)
+            for t in range(n_hours):
+                for j in range(hi - lo):
+                    v = x[t, lo + j]
+                    if np.isnan(v):
+                        n_missing[j] += 1
+                    else:
+                        total[j] += v - centre[j]
+                        total_sq[j] += (v - centre[j]) ** 2
+                    if t >= window:
+                        old = x[t - window, lo + j]
+                        if np.isnan(old):
+                            n_missing[j] -= 1
+                        else:
+                            total[j] -= old - centre[j]
+                            total_sq[j] -= (old - centre[j]) ** 2
+                    if t >= window - 1 and n_missing[j] == 0:
+                        mean = total[j] / window
+                        if want_std:
+                            if window > 1:
+                                out[t, lo + j] = np.sqrt(max(total_sq[j] - window * mean ** 2, 0.0) / (window - 1))
+                        else:
+                            out[t, lo + j] = mean + centre[j]
+        return out
+
+    @numba.njit(parallel=True, cache=True)
+    def _rolling_quantile_nb(x, window, q):
+        n_series, n_hours = x.shape
+        out = np.full((n_series, n_hours), np.nan)
+        pos = q * (window - 1)
+        lo = int(np.floor(pos))
+        hi = min(lo + 1, window - 1)
+        frac = pos - lo
+        for s in numba.prange(n_series):
+            # The window is kept sorted, with missing hours sorted last, by inserting and removing one value per hour.
+            ordered = np.empty(window)
+            size, n_missing = 0, 0
+            for t in range(n_hours):
+                v = x[s, t]
+                if t >= window:
+                    old = x[s, t - window]
+                    if np.isnan(old):
+                        n_missing -= 1
+                        size -= 1
+                    else:
+                        i = np.searchsorted(ordered[:size - n_missing], old)
+                        ordered[i:size - 1] = ordered[i + 1:size].copy()
+                        size -= 1
+                if np.isnan(v):
+                    ordered[size] = np.nan
+                    n_missing += 1
+                else:
+                    i = np.searchsorted(ordered[:size - n_missing], v)
+                    ordered[i + 1:size + 1] = ordered[i:size].copy()
+                    ordered[i] = v
+                size += 1
+                if t >= window - 1 and n_missing == 0:
+                    out[s, t] = ordered[lo] + frac * (ordered[hi] - ordered[lo])
+        return out
+
+    @numba.njit(parallel=True, cache=True)
+    def _ewma_nb(x, alpha, block):
+        n_hours, n_series = x.shape
+        out = np.empty((n_hours, n_series))
+        for b in numba.prange((n_series + block - 1) // block):
+            lo, hi = b * block, min((b + 1) * block, n_series)
+            level = np.full(hi - lo, np.nan)
+            for t in range(n_hours):
+                for j in range(hi - lo):
+                    v = x[t, lo + j]
+                    if not np.isnan(v):
+                        level[j] = v if np.isnan(level[j]) else alpha * v + (1 - alpha) * level[j]
+                    out[t, lo + j] = level[j]
+        return out
+
+    @numba.njit(parallel=True, cache=True)
+    def _lag_stack_nb(x, lags):
+        n_hours, n_series = x.shape
+        out = np.empty((n_hours, n_series, len(lags)))
+        for t in numba.prange(n_hours):
+            for s in range(n_series):
+                for k in range(len(lags)):
+                    out[t, s, k] = x[t - lags[k], s] if t >= lags[k] else np.nan
+        return out
+
+
+def _rolling_moments_np(values, window):
+    observed = ~np.isnan(values)
+    # Centring each series first keeps the sums of squares from cancelling.
+    n_observed = observed.sum(axis=0)
+    centre = np.where(observed, values, 0.0).sum(axis=0) / np.maximum(n_observed, 1)
+    centred = np.where(observed, values - centre, 0.0)
+
+    def window_sums(x):
+        sums = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)])
+        return sums[window:] - sums[:-window]
+
+    mean = np.full(values.shape, np.nan)
+    std = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        full = window_sums(observed.astype(float)) == window
+        window_mean = window_sums(centred) / window
+        mean[window - 1:] = np.where(full, window_mean + centre, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = np.maximum(window_sums(centred ** 2) - window * window_mean ** 2, 0) / (window - 1)
+        std[window - 1:] = np.where(full, np.sqrt(var), np.nan)
+    return mean, std
+
+def _center(out, window, center):
+    # Centred windows are labelled at their middle hour, as in pandas.
+    if not center:
+        return out
+    shift = (window - 1) // 2
+    centred = np.full(out.shape, np.nan)
+    centred[:len(out) - shift] = out[shift:]
+    return centred
+
+def rolling_mean(values, window, center=False, backend='auto'):
+    """
+    Computes rolling means of every series at once. A window with any missing hour is NaN, as with pandas rolling windows.
+
+    Parameters
+    ----------
+    values : arr
+        Values with shape (n_hours,) or (n_hours, n_series), e.g. one column per node.
+
+    window : int
+        Window length, including the current hour.
+
+    center : bool
+        Labels each window at its middle hour instead of its last.
+
+    backend : str
+        'numba', 'numpy', or 'auto' for numba when it is installed.
+
+    Returns
+    -------
+
+    mean : arr
+        Rolling means with the shape of values.
+    """
+    values = np.asarray(values, dtype=float)
+    if _resolve_backend(backend) == 'numba':
+        mean = _rolling_moments_nb(_as_hour_major(values), window, False, KERNEL_BLOCK).reshape(values.shape)
+    else:
+        mean = _rolling_moments_np(values, window)[0]
+    return _center(mean, window, center)
+
+def rolling_std(values, window, center=False, backend='auto'):
+    """
+    Computes rolling sample standard deviations of every series at once. A window with any missing hour is NaN.
+
+    Parameters
+    ----------
+    values : arr
+        Values with shape (n_hours,) or (n_hours, n_series).
+
+    window : int
+        Window length, including the current hour.
+
+    center : bool
+        Labels each window at its middle hour instead of its last.
+
+    backend : str
+        'numba', 'numpy', or 'auto' for numba when it is installed.
+
+    Returns
+    -------
+
+    std : arr
+        Rolling standard deviations with the shape of values.
+    """
+    values = np.asarray(values, dtype=float)
+    if _resolve_backend(backend) == 'numba':
+        std = _rolling_moments_nb(_as_hour_major(values), window, True, KERNEL_BLOCK).reshape(values.shape)
+    else:
+        std = _rolling_moments_np(values, window)[1]
+    return _center(std, window, center)
+
+def rolling_quantile(values, window, q, center=False, backend='auto'):
+    """
+    Computes rolling quantiles of every series at once, interpolating linearly as pandas does.
+    A window with any missing hour is NaN. The NumPy path works through the hours in chunks to bound its memory.
+
+    Parameters
+    ----------
+    values : arr
+        Values with shape (n_hours,) or (n_hours, n_series).
+
+    window : int
+        Window length, including the current hour.
+
+    q : float
+        Quantile between 0 and 1.
+
+    center : bool
+        Labels each window at its middle hour instead of its last.
+
+    backend : str
+        'numba', 'numpy', or 'auto' for numba when it is installed.
+
+    Returns
+    -------
+
+    quantile : arr
+        Rolling quantiles with the shape of values.
+    """
+    values = np.asarray(values, dtype=float)
+    if _resolve_backend(backend) == 'numba':
+        out = _restore_shape(_rolling_quantile_nb(_as_series_major(values), window, q), values)
+        return _center(out, window, center)
+
+    flat = values.reshape(len(values), -1)
+    out = np.full(flat.shape, np.nan)
+    if len(flat) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(flat, window, axis=0)
+        chunk = max(1, int(QUANTILE_CHUNK_MB * 1024 ** 2 // (8 * window * flat.shape[1] * 2)))
+        for start in range(0, len(windows), chunk):
+            out[window - 1 + start:window - 1 + start + chunk] = np.quantile(windows[start:start + chunk], q, axis=-1)
+    return _center(out.reshape(values.shape), window, center)
+
+def ewma(values, alpha, backend='auto'):
+    """
+    Computes exponentially weighted moving averages of every series at once, i.e. level = alpha * value +
+    (1 - alpha) * previous level. Missing hours keep the previous level, as with pandas ewm(adjust=False, ignore_na=True).
+
+    Parameters
+    ----------
+    values : arr
+        Values with shape (n_hours,) or (n_hours, n_series).
+
+    alpha : float
+        Smoothing factor between 0 and 1.
+
+    backend : str
+        'numba', 'numpy', or 'auto' for numba when it is installed.
+
+    Returns
+    -------
+
+    level : arr
+        Moving averages with the shape of values. Hours before the first observation are NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    if _resolve_backend(backend) == 'numba':
+        return _ewma_nb(_as_hour_major(values), alpha, KERNEL_BLOCK).reshape(values.shape)
+
+    flat = values.reshape(len(values), -1)
+    if not np.isnan(flat).any():
+        # A first-order recursive filter seeded with the first value.
+        zi = ((1 - alpha) * flat[0])[None]
+        return signal.lfilter([alpha], [1, -(1 - alpha)], flat, axis=0, zi=zi)[0].reshape(values.shape)
+
+    level = np.full(flat.shape, np.nan)
+    current = np.full(flat.shape[1], np.nan)
+    for t in range(len(flat)):
+        observed = ~np.isnan(flat[t])
+        current = np.where(observed, np.where(np.isnan(current), flat[t], alpha * flat[t] + (1 - alpha) * current),
+                           current)
+        level[t] = current
+    return level.reshape(values.shape)
+
+def lag_stack(values, lags, backend='auto'):
+    """
+    Stacks lagged copies of every series at once.
+
+    Parameters
+    ----------
+    values : arr
+        Values with shape (n_hours, n_series) on a complete time axis.
+
+    lags : tuple of ints
+        Lags in hours.
+
+    backend : str
+        'numba', 'numpy', or 'auto' for numba when it is installed.
+
+    Returns
+    -------
+
+    lagged : arr
+        Array with shape (n_hours, n_series, len(lags)). Hours before the start of the series are NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    if _resolve_backend(backend) == 'numba':
+        lagged = _lag_stack_nb(_as_hour_major(values), np.asarray(lags, dtype=np.int64))
+        return lagged.reshape(values.shape + (len(lags),))
+
+    lagged = np.full(values.shape + (len(lags),), np.nan)
+    for k, lag in enumerate(lags):
+        lagged[lag:, ..., k] = values[:len(values) - lag]
+    return lagged
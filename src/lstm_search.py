@@ -0,0 +1,255 @@
+import os
+import math
+import shutil
+import sqlite3
+import tempfile
+import itertools
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_LSTM_SEARCH_SPACE = {
+    'n_layers': [1, 2, 3],
+    'n_nodes': [16, 32, 64],
+    'dropout': [0.0, 0.1, 0.2],
+    'window': [24, 48, 72, 168],
+    'batch_size': [32, 64],
+}
+
+# Populated once per worker process by _init_search_worker so the price curve is not pickled with every trial.
+_WORKER_DATA = {}
+
+
+def sample_lstm_configs(param_grid, n_configs, seed=0):
+    """
+    Draws distinct LSTM configurations from the provided grid without replacement.
+
+    Parameters
+    ----------
+    param_grid : dict
+        Maps each hyperparameter name to a list of candidate values.
+
+    n_configs : int
+        Number of configurations to draw. All configurations are returned if the grid is smaller.
+
+    seed : int
+        Seed for the random number generator.
+
+    Returns
+    -------
+
+    configs : list of dicts
+        Hyperparameter configurations.
+    """
+    names = list(param_grid.keys())
+    all_configs = list(itertools.product(*[param_grid[name] for name in names]))
+    rng = np.random.default_rng(seed)
+    n_configs = min(n_configs, len(all_configs))
+    picks = rng.choice(len(all_configs), size=n_configs, replace=False)
+    return [dict(zip(names, all_configs[i])) for i in picks]
+
+def _create_trial_table(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS lstm_trials (
+                        search_id TEXT, trial_id INTEGER, rung INTEGER, n_epochs INTEGER,
+                        n_layers INTEGER, n_nodes INTEGER, dropout REAL, window INTEGER, batch_size INTEGER,
+                        valid_rmse REAL, fit_seconds REAL, status TEXT, logged_at TEXT)""")
+    conn.commit()
+
+def _log_trial(conn, search_id, rung, result, status):
+    row = [search_id, result['trial_id'], rung, result['n_epochs'], result['n_layers'], result['n_nodes'],
+           result['dropout'], result['window'], result['batch_size'], result['valid_rmse'],
+           result['fit_seconds'], status, datetime.now().isoformat(timespec='seconds')]
+    conn.execute(f"INSERT INTO lstm_trials VALUES ({', '.join(['?'] * len(row))})", row)
+    conn.commit()
+
+def load_lstm_search_results(db_path, search_id=None):
+    """
+    Reads logged LSTM trials from the SQLite results table.
+
+    Parameters
+    ----------
+    db_path : str
+        Path to the SQLite database written by search_lstm_hyperparameters().
+
+    search_id : str
+        Only return trials from this search. All searches are returned if None.
+
+    Returns
+    -------
+
+    trials : dataframe
+        One row per trial and rung.
+    """
+    with sqlite3.connect(db_path) as conn:
+        if search_id is None:
+            return pd.read_sql_query('SELECT * FROM lstm_trials', conn)
+        return pd.read_sql_query('SELECT * FROM lstm_trials WHERE search_id = ?', conn, params=(search_id,))
+
+def pin_worker_threads(n_threads):
+    """
+    Caps the thread pools of a worker process so that parallel workers do not oversubscribe the cores.
+    Must run before TensorFlow runs its first op, e.g. in a process pool initializer.
+
+    Parameters
+    ----------
+    n_threads : int
+        Number of intra-op threads.
+
+    Returns
+    -------
+
+    """
+    for var in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS']:
+        os.environ[var] = str(n_threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(n_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def _init_search_worker(n_threads, lmp_curve, fraction_valid, checkpoint_dir):
+    pin_worker_threads(n_threads)
+    _WORKER_DATA['lmp_curve'] = lmp_curve
+    _WORKER_DATA['fraction_valid'] = fraction_valid
+    _WORKER_DATA['checkpoint_dir'] = checkpoint_dir
+
+def _run_lstm_trial(trial_id, config, initial_epoch, n_epochs):
+    from src.model import keras, build_lstm_uni_var, split_and_windowize, calc_rmse
+
+    start = datetime.now()
+    lmp_curve = _WORKER_DATA['lmp_curve']
+    x_train, x_valid, y_train, y_valid = split_and_windowize(lmp_curve, config['window'], _WORKER_DATA['fraction_valid'])
+
+    # Min-max scale on the training window only, as recommended in the README.
+    lmp_min, lmp_max = y_train.min(), y_train.max()
+    scale = lmp_max - lmp_min if lmp_max > lmp_min else 1.0
+
+    # Trials that survive a rung resume from their own checkpoint rather than starting over. The whole model is saved,
+    # so Adam's moment estimates carry over with the weights and training continues as one uninterrupted run.
+    model_path = os.path.join(_WORKER_DATA['checkpoint_dir'], f'trial_{trial_id}.keras')
+    if initial_epoch > 0 and os.path.exists(model_path):
+        lstm_uni = keras.models.load_model(model_path)
+    else:
+        lstm_uni = build_lstm_uni_var(config['window'], 1, config['n_nodes'], config['n_layers'], config['dropout'])
+
+    lstm_uni.fit((x_train - lmp_min) / scale, (y_train - lmp_min) / scale, batch_size=config['batch_size'],
+                 epochs=n_epochs, initial_epoch=initial_epoch, verbose=0)
+    lstm_uni.save(model_path)
+
+    pred = lstm_uni.predict((x_valid - lmp_min) / scale, verbose=0).ravel() * scale + lmp_min
+
+    result = dict(config)
+    result['trial_id'] = trial_id
+    result['n_epochs'] = n_epochs
+    result['valid_rmse'] = float(calc_rmse(y_valid, pred))
+    result['fit_seconds'] = (datetime.now() - start).total_seconds()
+    return result
+
+def search_lstm_hyperparameters(lmp_curve, n_configs=100, param_grid=None, fraction_valid=0.1, min_epochs=2,
+                                max_epochs=20, eta=2, n_workers=None, threads_per_worker=1,
+                                db_path='../data/lstm_search.sqlite', seed=0):
+    """
+    Searches LSTM layers, nodes, dropout and window length using successive halving.
+    Every surviving configuration is trained for a growing epoch budget in a pool of worker processes.
+    After each rung only the best 1/eta of the configurations continue, so eta=2 stops every trial below the median.
+    Each trial and rung is logged to a local SQLite table.
+
+    Parameters
+    ----------
+    lmp_curve : arr
+        Historic hourly prices for one of the hubs.
+
+    n_configs : int
+        Number of configurations sampled from param_grid.
+
+    param_grid : dict
+        Maps each hyperparameter name - n_layers, n_nodes, dropout, window, batch_size - to candidate values.
+        Defaults to DEFAULT_LSTM_SEARCH_SPACE.
+
+    fraction_valid : float
+        The percentage of the dataset that is used to score each trial.
+
+    min_epochs : int
+        Epoch budget of the first rung.
+
+    max_epochs : int
+        Maximum epoch budget of the last rung.
+
+    eta : int
+        Reduction factor. The epoch budget is multiplied by eta and the number of trials is divided by eta after each rung.
+
+    n_workers : int
+        Number of worker processes. Defaults to the number of cores divided by threads_per_worker.
+
+    threads_per_worker : int
+        Number of TensorFlow intra-op threads in each worker.
+
+    db_path : str
+        Path to the SQLite database that stores trial results.
+
+    seed : int
+        Seed used to sample configurations.
+
+    Returns
+    -------
+
+    search_id : str
+        Identifier of this search in the results table.
+
+    best_trials : dataframe
+        Trials that reached the final rung, sorted by validation RMSE.
+    """
+    if param_grid is None:
+        param_grid = DEFAULT_LSTM_SEARCH_SPACE
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+    configs = sample_lstm_configs(param_grid, n_configs, seed)
+    survivors = list(enumerate(configs))
+    search_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+    checkpoint_dir = tempfile.mkdtemp(prefix='lstm_search_')
+
+    conn = sqlite3.connect(db_path)
+    _create_trial_table(conn)
+
+    # Spawn rather than fork so that workers never inherit an initialised TensorFlow runtime.
+    mp_context = multiprocessing.get_context('spawn')
+    lmp_curve = np.asarray(lmp_curve, dtype=np.float32)
+
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context, initializer=_init_search_worker,
+                                 initargs=(threads_per_worker, lmp_curve, fraction_valid, checkpoint_dir)) as pool:
+            rung, prev_epochs, n_epochs = 0, 0, min(min_epochs, max_epochs)
+            while True:
+                futures = [pool.submit(_run_lstm_trial, trial_id, config, prev_epochs, n_epochs)
+                           for trial_id, config in survivors]
+                results = sorted([f.result() for f in futures], key=lambda r: r['valid_rmse'])
+
+                is_last_rung = n_epochs >= max_epochs or len(results) <= 1
+                n_keep = len(results) if is_last_rung else max(1, math.ceil(len(results) / eta))
+                for i, result in enumerate(results):
+                    status = 'complete' if is_last_rung else ('promoted' if i < n_keep else 'pruned')
+                    _log_trial(conn, search_id, rung, result, status)
+
+                if is_last_rung:
+                    break
+
+                survivors = [(r['trial_id'], configs[r['trial_id']]) for r in results[:n_keep]]
+                rung, prev_epochs, n_epochs = rung + 1, n_epochs, min(n_epochs * eta, max_epochs)
+    finally:
+        conn.close()
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    best_trials = pd.DataFrame(results)[['trial_id'] + list(param_grid.keys()) + ['n_epochs', 'valid_rmse', 'fit_seconds']]
+    return search_id, best_trials
+
+
+if __name__ == '__main__':
+
+    from src.import_process_data import import_caiso_dataset
+
+    caiso = import_caiso_dataset('caiso_master')
+    search_id, best_trials = search_lstm_hyperparameters(caiso['$_MWH_np15'].values, n_configs=100)
+    print(best_trials.head(10))
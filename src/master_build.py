@@ -0,0 +1,227 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.store import STORE_DIR, write_partition, read_columns, read_dataset, list_partitions
+from src.time_axis import utc_hours_to_local, hour_ending_labels
+from src.interval_ingest import interval_dataset
+
+
+NODE_MASTER_DATASET = 'node_master'
+MASTER_BACKENDS = ('serial', 'process')
+SYSTEM_COLUMNS = ['other', 'solar', 'wind', 'total_gen', 'net_exp_MW', 'load_MW']
+
+# Populated once per worker process by _init_master_worker so the system data is not pickled with every task.
+_WORKER_DATA = {}
+
+
+def _system_frame(gen, load, net_ex):
+    # Generation, load and net export are system-wide, so they are joined once and shared by every node.
+    system = gen.rename({'total_mw': 'total_gen'}, axis=1).set_index('HOUR_UTC')
+    system = system.join(load.set_index('HOUR_UTC'), how='outer').join(net_ex.set_index('HOUR_UTC'), how='outer')
+    return system[SYSTEM_COLUMNS].apply(pd.to_numeric).sort_index()
+
+def _natgas_series(natgas):
+    natgas = natgas.set_index('date')['HH_$_million_BTU_not_seasonal_adj']
+    return pd.to_numeric(natgas).dropna().sort_index()
+
+def _hour_frame(hours, opr_dt, system, natgas):
+    # Everything but the price depends only on the hour, so it is shared by every node of a month.
+    hours = np.asarray(hours, dtype=np.int64)
+    opr_dt = pd.DatetimeIndex(pd.to_datetime(opr_dt))
+    hour_frame = pd.DataFrame({'INTERVAL_END_PT': utc_hours_to_local(hours + 1),
+                               'HOUR_UTC': hours,
+                               'OPR_DT_PT': opr_dt,
+                               'OPR_HR_PT': hour_ending_labels(hours)[1],
+                               'day_week': opr_dt.weekday},
+                              index=pd.Index(utc_hours_to_local(hours), name='INTERVAL_START_PT'))
+    hour_frame = hour_frame.join(system.reindex(hours).set_index(hour_frame.index))
+    # Weekends and holidays have no gas price, so the last published price applies.
+    hour_frame['HH_$_mill_BTU'] = natgas.asof(opr_dt).to_numpy() if len(natgas) > 0 else np.nan
+    order = np.argsort(hours, kind='stable')
+    return hour_frame.iloc[order], order
+
+def _add_price(hour_frame, order, prices):
+    node_master = hour_frame.copy()
+    node_master.insert(5, '$_MWH', np.asarray(prices, dtype=float)[order])
+    return node_master
+
+def create_node_master_df(lmp, system, natgas):
+    """
+    Builds the master dataset of one pricing node: its hourly LMPs with system generation, load, net export and
+    Henry Hub gas prices, in the layout the hub master takes in the store.
+    Gas prices are carried forward from the last published day, which only depends on the date of each hour, so any
+    slice of hours gives the same rows as the full history.
+
+    Parameters
+    ----------
+    lmp : dataframe
+        Hourly prices of the node with HOUR_UTC, OPR_DT_PT and $_MWH.
+
+    system : dataframe
+        System generation, load and net export indexed by HOUR_UTC, from _system_frame().
+
+    natgas : series
+        Daily gas prices indexed by date without missing values, from _natgas_series().
+
+    Returns
+    -------
+
+    node_master : dataframe
+        One row per hour indexed by timezone-aware Pacific time, with HOUR_UTC as the canonical time axis.
+    """
+    hour_frame, order = _hour_frame(lmp['HOUR_UTC'].values, lmp['OPR_DT_PT'].values, system, natgas)
+    return _add_price(hour_frame, order, lmp['$_MWH'].values)
+
+def _init_master_worker(system, natgas, lmp_dataset, dataset, store_dir):
+    _WORKER_DATA['system'] = system
+    _WORKER_DATA['natgas'] = natgas
+    _WORKER_DATA['lmp_dataset'] = lmp_dataset
+    _WORKER_DATA['dataset'] = dataset
+    _WORKER_DATA['store_dir'] = store_dir
+    _WORKER_DATA['hour_frames'] = {}
+
+def _build_master_partition(task):
+    node_id, month = task
+    store_dir, lmp_dataset = _WORKER_DATA['store_dir'], _WORKER_DATA['lmp_dataset']
+    hour_frames = _WORKER_DATA['hour_frames']
+    if month not in hour_frames:
+        # Tasks arrive month by month, so only the current month is kept.
+        hour_frames.clear()
+        data = read_columns(lmp_dataset, ['HOUR_UTC', 'OPR_DT_PT'], [month], store_dir)
+        hour_frames[month] = _hour_frame(data['HOUR_UTC'], data['OPR_DT_PT'], _WORKER_DATA['system'],
+                                         _WORKER_DATA['natgas'])
+
+    prices = read_columns(lmp_dataset, [node_id], [month], store_dir)[node_id]
+    node_master = _add_price(*hour_frames[month], prices)
+    write_partition(node_master, _WORKER_DATA['dataset'], f'{node_id}_{month}', store_dir,
+                    index_name=node_master.index.name)
+    return len(node_master)
+
+def build_node_masters(node_ids, gen, load, net_ex, natgas, months=None, backend='process', n_workers=None,
+                       lmp_dataset=interval_dataset('DAM'), dataset=NODE_MASTER_DATASET, store_dir=STORE_DIR):
+    """
+    Builds the master dataset of every node, partitioned by node and operating month.
+    Every partition only needs its own month of prices, so partitions are built independently, either one after the
+    other or spread over worker processes. Both backends run the same code per partition and write identical output.
+
+    Parameters
+    ----------
+    node_ids : list of strings
+        Nodes to build. Each must be a price column of lmp_dataset, e.g. ingested with
+        ingest_interval_lmp(lmp_files, 'DAM', nodes={node_id: node_id for node_id in node_ids}).
+
+    gen : dataframe
+        Hourly CAISO generation data from scrape_process_caiso_generation_data().
+
+    load : dataframe
+        Hourly CAISO consumption data from scrape_process_caiso_load_data().
+
+    net_ex : dataframe
+        Hourly CAISO net export data from scrape_process_caiso_net_ex_data().
+
+    natgas : dataframe
+        Daily Henry Hub gas prices from obtain_format_hh_natgas_to_df().
+
+    months : list of strings
+        Operating months to build. Every month of lmp_dataset is built if None.
+
+    backend : str
+        'serial' builds partitions in this process. 'process' builds them in a pool of worker processes.
+
+    n_workers : int
+        Number of worker processes. Defaults to the number of cores.
+
+    lmp_dataset : str
+        Store dataset of hourly node prices partitioned by month.
+
+    dataset : str
+        Store dataset the node masters are written to.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    built : dataframe
+        One row per partition with node_id, month and the number of hours.
+    """
+    if backend not in MASTER_BACKENDS:
+        raise ValueError(f'backend must be one of {MASTER_BACKENDS}.')
+    if months is None:
+        months = list_partitions(lmp_dataset, store_dir)
+    tasks = [(node_id, month) for month in months for node_id in node_ids]
+    init_args = (_system_frame(gen, load, net_ex), _natgas_series(natgas), lmp_dataset, dataset, store_dir)
+
+    if backend == 'serial':
+        _init_master_worker(*init_args)
+        n_hours = [_build_master_partition(task) for task in tasks]
+    else:
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        # Tasks are handed out in chunks so that the cost of a round trip, and of the hours of a month, is shared by
+        # several partitions.
+        chunksize = max(1, len(tasks) // (4 * n_workers))
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context, initializer=_init_master_worker,
+                                 initargs=init_args) as pool:
+            n_hours = list(pool.map(_build_master_partition, tasks, chunksize=chunksize))
+
+    return pd.DataFrame({'node_id': [task[0] for task in tasks], 'month': [task[1] for task in tasks], 'n_hours': n_hours})
+
+def read_node_master(node_id, months=None, dataset=NODE_MASTER_DATASET, store_dir=STORE_DIR):
+    """
+    Reads the master dataset of one node from the store.
+
+    Parameters
+    ----------
+    node_id : str
+        Node to read.
+
+    months : list of strings
+        Operating months to read. All months are read if None.
+
+    dataset : str
+        Store dataset written by build_node_masters().
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    node_master : dataframe
+        One row per hour indexed by INTERVAL_START_PT.
+    """
+    # Partitions are named '<node_id>_<YYYY-MM>'.
+    partitions = [p for p in list_partitions(dataset, store_dir)
+                  if p[:-8] == node_id and (months is None or p[-7:] in months)]
+    if len(partitions) == 0:
+        raise FileNotFoundError(f'{node_id} has no partitions in {dataset}.')
+    return read_dataset(dataset, partitions=partitions, store_dir=store_dir, index_col='INTERVAL_START_PT')
+
+
+if __name__ == '__main__':
+
+    import glob
+    import pyiso
+    from src.interval_ingest import ingest_interval_lmp
+    from src.import_process_data import (scrape_process_caiso_load_data, scrape_process_caiso_generation_data,
+                                         scrape_process_caiso_net_ex_data, obtain_format_hh_natgas_to_df)
+
+    node_ids = ['NP15SLAK_5_N001', 'SP26SLAK_5_N001', 'ZP26SLAK_5_N001']
+    ingest_interval_lmp(sorted(glob.glob('../data/caiso_lmp_nodes/*PRC_LMP_DAM*.csv')), 'DAM',
+                        nodes={node_id: node_id for node_id in node_ids})
+
+    oasis_start = pd.date_range(start='2019-01-15', end='2020-05-31', freq='14D')
+    oasis_end = pd.date_range(start='2019-01-30', end='2020-06-05', freq='14D')
+    caiso = pyiso.client_factory('CAISO', timeout_seconds=60)
+    built = build_node_masters(node_ids, scrape_process_caiso_generation_data(caiso, oasis_start, oasis_end),
+                               scrape_process_caiso_load_data(caiso, oasis_start, oasis_end),
+                               scrape_process_caiso_net_ex_data(caiso, oasis_start, oasis_end),
+                               obtain_format_hh_natgas_to_df())
+    print(built.groupby('node_id')['n_hours'].sum())
@@ -1,13 +1,22 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-%matplotlib inline
+#%matplotlib inline
+from scipy import stats
 from sklearn.metrics import mean_squared_error
 from statsmodels.tsa.arima_model import ARIMA
+from statsmodels.tsa.statespace.sarimax import SARIMAX
 import tensorflow as tf
 keras = tf.keras
 from datetime import datetime
 
+from src.store import read_column_matrix
+from src.instrument import instrumented
+from src.plotting import show_or_save
+from src.splits import time_split, fraction_split, split_windows
+
+EXOG_COLUMNS = ['solar', 'wind', 'total_gen', 'load_MW', 'net_exp_MW', 'HH_$_mill_BTU']
+
 def calc_rmse(actual, pred):
     """
     Calculates the root mean squared error.
@@ -64,8 +73,9 @@ def arima_uni_var_train_valid_split(lmp_curve, date_rng, train_split_idx):
     date_rng : arr
         Values are hourly timestamps that correspond to hourly prices
 
-    train_split_index : int
-        The index that is used to split the univarite time series into train and validation datasets.
+    train_split_index : int or dict
+        The index that is used to split the univarite time series into train and validation datasets, or a split from
+        time_split() so that ARIMA sees the same folds as the other models.
 
     Returns
     -------
@@ -82,13 +92,14 @@ def arima_uni_var_train_valid_split(lmp_curve, date_rng, train_split_idx):
     date_valid_rng : arr
         Dates used to validate ARIMA model's hourly price forecast.
     """
-
-    lmp_train_curve = lmp_curve[:train_split_idx]
-    lmp_valid_curve = lmp_curve[train_split_idx:]
-    date_train_rng = date_rng[:train_split_idx]
-    date_valid_rng = date_rng[train_split_idx:]
+    split = train_split_idx if isinstance(train_split_idx, dict) else time_split(len(lmp_curve), train_split_idx)
+    lmp_train_curve = lmp_curve[split['train']]
+    lmp_valid_curve = lmp_curve[split['valid']]
+    date_train_rng = date_rng[split['train']]
+    date_valid_rng = date_rng[split['valid']]
     return lmp_train_curve, lmp_valid_curve, date_train_rng, date_valid_rng
 
+@instrumented
 def arima_uni_var_fit(lmp_train, date_rng, p, d, q):
     """
     Fits a univariate ARIMA model
@@ -119,6 +130,7 @@ def arima_uni_var_fit(lmp_train, date_rng, p, d, q):
 
     return ARIMA(endog=lmp_train, dates=date_rng, order=(p, d, q), freq='H').fit()
 
+@instrumented
 def arima_uni_var_predict(model, n_period_fcst):
     """
     Fits a univariate ARIMA model
@@ -140,6 +152,168 @@ def arima_uni_var_predict(model, n_period_fcst):
 
     return model.forecast(steps=n_period_fcst)[0]
 
+# ARIMAX MODEL
+def load_exog_matrix(dataset='caiso_master', exog_columns=EXOG_COLUMNS, store_dir='../data/store'):
+    """
+    Loads the exogenous variables from the columnar store as a single contiguous matrix.
+    Missing values are forward filled, as is done for the natural gas prices, and leading gaps are back filled.
+
+    Parameters
+    ----------
+    dataset : str
+        Name of the CAISO dataset in the store.
+
+    exog_columns : list of strings
+        Exogenous variables, e.g. generation by fuel, load, net export and Henry Hub gas prices.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    exog : arr
+        Hourly exogenous variables with shape (n_hours, len(exog_columns)).
+    """
+    exog = read_column_matrix(dataset, exog_columns, store_dir=store_dir)
+    if np.isnan(exog).any():
+        exog = np.ascontiguousarray(pd.DataFrame(exog).ffill().bfill().values)
+    return exog
+
+@instrumented
+def arimax_fit(lmp_train, exog_train, p, d, q, seasonal_order=(0, 0, 0, 0), maxiter=50):
+    """
+    Fits an ARIMA model with exogenous regressors, i.e. ARIMAX, or SARIMAX when seasonal_order is provided.
+    The model is set up for speed at hourly resolution:
+    the scale is concentrated out of the likelihood and differencing is applied before the Kalman filter runs.
+
+    Parameters
+    ----------
+    lmp_train : arr
+       Prices used to train the model.
+
+    exog_train : arr
+        Exogenous variables with one row per hour in lmp_train.
+
+    p : int
+        The number of lag observations included in the model, commonly referred to as the lag order.
+
+    d : int
+        The number of times that the raw observations are differenced, commonly referred to as the degree of differencing.
+
+    q : int
+        The size of the moving average window.
+
+    seasonal_order : tuple
+        The (P, D, Q, s) order of the seasonal component, e.g. (1, 0, 0, 24).
+
+    maxiter : int
+        Maximum number of optimizer iterations.
+
+    Returns
+    -------
+
+    SARIMAX : object
+        A fitted model to be used for predicting hourly electricity prices.
+    """
+    model = SARIMAX(endog=np.asarray(lmp_train, dtype=float), exog=np.ascontiguousarray(exog_train, dtype=float),
+                    order=(p, d, q), seasonal_order=seasonal_order, concentrate_scale=True,
+                    simple_differencing=True, enforce_stationarity=False, enforce_invertibility=False)
+    return model.fit(disp=False, maxiter=maxiter)
+
+@instrumented
+def arimax_predict(model, exog_fcst):
+    """
+    Forecasts hourly prices with a fitted ARIMAX model.
+
+    Parameters
+    ----------
+    model : object
+       A fitted ARIMAX model.
+
+    exog_fcst : arr
+        Exogenous variables for each forecasted hour.
+
+    Returns
+    --------
+
+    Prediction: arr
+        An array of forecasted electricity prices
+    """
+    exog_fcst = np.ascontiguousarray(exog_fcst, dtype=float)
+    fcst = np.asarray(model.forecast(steps=len(exog_fcst), exog=exog_fcst))
+
+    # With simple differencing the model forecasts the differenced series, so integrate back to price levels.
+    spec = model.model
+    if spec.simple_differencing and (spec.k_diff > 0 or spec.k_seasonal_diff > 0):
+        fcst = _undifference_fcst(spec.orig_endog.ravel(), fcst, spec.k_diff, spec.k_seasonal_diff,
+                                  spec.seasonal_periods)
+    return fcst
+
+def arima_fcst_quantiles(model, n_periods_fcst, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), exog_fcst=None):
+    """
+    Forecasts hourly price quantiles from the analytic forecast error variance of a fitted ARIMA or ARIMAX model.
+    Forecast errors are assumed to be normal. Uncertainty in the estimated coefficients is ignored.
+
+    Parameters
+    ----------
+    model : object
+       A fitted model from arima_uni_var_fit() or arimax_fit().
+
+    n_periods_fcst : int
+        Number of hours to forecast.
+
+    quantiles : tuple of floats
+        Quantiles to forecast.
+
+    exog_fcst : arr
+        Exogenous variables for each forecasted hour, for ARIMAX models.
+
+    Returns
+    --------
+
+    fcst_quantiles : arr
+        Forecasted prices with shape (len(quantiles), n_periods_fcst).
+    """
+    z = stats.norm.ppf(quantiles)
+    if not hasattr(model, 'get_forecast'):
+        # The legacy ARIMA results return the forecast standard error next to the forecast.
+        fcst, stderr = model.forecast(steps=n_periods_fcst)[:2]
+        return np.asarray(fcst) + z[:, None] * np.asarray(stderr)
+
+    if exog_fcst is not None:
+        exog_fcst = np.ascontiguousarray(exog_fcst, dtype=float)
+    prediction = model.get_forecast(steps=n_periods_fcst, exog=exog_fcst)
+    fcst = np.asarray(prediction.predicted_mean)
+    var = np.asarray(prediction.var_pred_mean)
+
+    spec = model.model
+    if spec.simple_differencing and (spec.k_diff > 0 or spec.k_seasonal_diff > 0):
+        # The model forecasts the differenced series. Integrating its MA(infinity) weights gives the weights of the
+        # price levels, whose cumulative sum of squares is the forecast error variance.
+        d, D, s = spec.k_diff, spec.k_seasonal_diff, spec.seasonal_periods
+        fcst = _undifference_fcst(spec.orig_endog.ravel(), fcst, d, D, s)
+        psi = np.asarray(model.impulse_responses(steps=n_periods_fcst - 1)).ravel()[:n_periods_fcst]
+        psi_level = _undifference_fcst(np.zeros(d + D * s + 1), psi, d, D, s)
+        var = model.scale * np.cumsum(psi_level ** 2)
+
+    return fcst + z[:, None] * np.sqrt(var)
+
+def _undifference_fcst(history, fcst_diff, d, D, s):
+    # Rebuild each intermediate differenced series, then undo the differences from the last one applied.
+    lags = [1] * d + [s] * D
+    levels = [np.asarray(history, dtype=float)]
+    for lag in lags[:-1]:
+        levels.append(levels[-1][lag:] - levels[-1][:-lag])
+
+    fcst = fcst_diff
+    for lag, level in zip(lags[::-1], levels[::-1]):
+        extended = np.concatenate([level[-lag:], np.empty(len(fcst))])
+        for i in range(len(fcst)):
+            extended[lag + i] = fcst[i] + extended[i]
+        fcst = extended[lag:]
+    return fcst
+
 # LSTM MODEL
 def windowize_data(data, n_prev):
     """
@@ -168,10 +342,11 @@ def windowize_data(data, n_prev):
     x = data[indices, None]
     return x, y
 
-def split_and_windowize(data, n_prev, fraction_valid):
+def split_and_windowize(data, n_prev, fraction_valid, split=None):
     """
     Splits the dataset into test and validation.
-    Creates the sequences/windows to process for LSTM model.
+    Creates the sequences/windows to process for LSTM model. Windows are views of data, and validation windows may
+    reach back into the training hours so that every validation hour is forecast.
 
     Parameters
     ----------
@@ -184,6 +359,9 @@ def split_and_windowize(data, n_prev, fraction_valid):
     fraction_valid : float
         The percentage of the dataset that should be allocated to the validation data set.
 
+    split : dict
+        Folds from time_split(), e.g. shared with the ARIMA model. Overrides fraction_valid.
+
     Return
     ------
     x_train : arr
@@ -199,20 +377,57 @@ def split_and_windowize(data, n_prev, fraction_valid):
         Dependent variables to be used to assess the LSTM model's predictions.
 
     """
-    n_predictions = len(data) - 2*n_prev
-
-    n_test  = int(fraction_valid * n_predictions)
-    n_train = n_predictions - n_test
+    if split is None:
+        split = fraction_split(len(data), fraction_valid)
 
-    x_train, y_train = windowize_data(data[:n_train], n_prev)
-    x_valid, y_valid = windowize_data(data[n_train:], n_prev)
+    x_train, y_train = split_windows(data, split['train'], n_prev)
+    x_valid, y_valid = split_windows(data, split['valid'], n_prev)
     return x_train, x_valid, y_train, y_valid
 
 
 
-def compile_and_fit_lstm_uni_var(X_train, y_train, batch_size, n_nodes=32, n_epochs=20):
+def build_lstm_uni_var(n_prev, n_features, n_nodes=32, n_layers=3, dropout=0.0):
+    """
+    Builds and compiles a stacked univariate LSTM model.
+
+    Parameters
+    ----------
+    n_prev : int
+        The number of values that comprise a sequence/window.
+
+    n_features : int
+        Number of features at each time step.
+
+    n_nodes : int
+        Number of nodes at each layer.
+
+    n_layers : int
+        Number of stacked LSTM layers.
+
+    dropout : float
+        Dropout rate applied after each LSTM layer. 0 disables dropout.
+
+    Returns
+    -------
+
+    lstm_uni : object
+        A compiled, untrained LSTM model.
     """
-    Compiles and fits a three-layered univariate LSTM model
+    lstm_uni = keras.Sequential()
+    lstm_uni.add(keras.Input(shape=(n_prev, n_features)))
+    for layer in range(n_layers):
+        lstm_uni.add(keras.layers.LSTM(n_nodes, return_sequences=(layer < n_layers - 1)))
+        if dropout > 0:
+            lstm_uni.add(keras.layers.Dropout(dropout))
+    lstm_uni.add(keras.layers.Dense(1, activation='linear'))
+    lstm_uni.compile(optimizer='adam',loss='mse')
+
+    return lstm_uni
+
+@instrumented
+def compile_and_fit_lstm_uni_var(X_train, y_train, batch_size, n_nodes=32, n_epochs=20, n_layers=3, dropout=0.0):
+    """
+    Compiles and fits a stacked univariate LSTM model. Defaults to three layers.
 
     Parameters
     ----------
@@ -231,27 +446,28 @@ def compile_and_fit_lstm_uni_var(X_train, y_train, batch_size, n_nodes=32, n_epo
     n_epocs : int
         Number times that the LSTM model will work through the entire training dataset.
 
+    n_layers : int
+        Number of stacked LSTM layers.
+
+    dropout : float
+        Dropout rate applied after each LSTM layer.
+
     Returns
     -------
 
     lstm_uni : object
         A compiled and trained LSTM model.
     """
+    n_prev = X_train.shape[1]
     n_features = X_train.shape[2]
 
-    lstm_uni = keras.Sequential()
-    lstm_uni.add(keras.layers.LSTM(n_nodes, input_shape=(batch_size, n_features), return_sequences=True))
-    lstm_uni.add(keras.layers.LSTM(n_nodes, return_sequences=True))
-    lstm_uni.add(keras.layers.LSTM(n_nodes, return_sequences=False))
-    lstm_uni.add(keras.layers.Dense(1, activation='linear'))
-    lstm_uni.compile(optimizer='adam',loss='mse')
-
+    lstm_uni = build_lstm_uni_var(n_prev, n_features, n_nodes, n_layers, dropout)
     lstm_uni.fit(X_train, y_train, batch_size, n_epochs)
 
     return lstm_uni
 
 # COMPARATIVE PLOT
-def plot_actual_arima_baselie_lstm(date_rng, y_true, arima_pred, baseline_pred, lstm_pred,  plot_title):
+def plot_actual_arima_baselie_lstm(date_rng, y_true, arima_pred, baseline_pred, lstm_pred,  plot_title, save_path=None):
     """
     Comparative plot of actual and predicted prices for each forecasting method.
 
@@ -275,6 +491,9 @@ def plot_actual_arima_baselie_lstm(date_rng, y_true, arima_pred, baseline_pred,
     plot_title : str
         Title for the plot.
 
+    save_path : str
+        File the chart is saved to, e.g. a PNG or SVG. The chart is shown if None.
+
     Returns
     -------
 
@@ -287,3 +506,5 @@ def plot_actual_arima_baselie_lstm(date_rng, y_true, arima_pred, baseline_pred,
     ax.set_title(plot_title, fontsize=22, fontweight='bold')
     ax.set_ylabel('$/MWh', fontsize=14)
     ax.legend()
+    plt.tight_layout()
+    show_or_save(fig, save_path)
@@ -0,0 +1,25 @@
+import matplotlib.pyplot as plt
+
+
+def show_or_save(fig, save_path=None):
+    """
+    Shows a finished chart, or saves it to a file and closes it.
+    Saved figures are closed right away so that batch rendering, e.g. render_report(), does not accumulate open figures.
+
+    Parameters
+    ----------
+    fig : object
+        Matplotlib figure of the chart.
+
+    save_path : str
+        File the chart is saved to, e.g. a PNG or SVG. The chart is shown if None.
+
+    Returns
+    -------
+
+    """
+    if save_path is None:
+        plt.show()
+    else:
+        fig.savefig(save_path)
+        plt.close(fig)
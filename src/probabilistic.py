@@ -0,0 +1,160 @@
+import numpy as np
+
+
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def _origins_per_chunk(n_paths, n_periods_fcst, n_hubs, memory_budget_mb):
+    # Simulated paths, their index array and the sorted copy np.quantile makes take about three float64 arrays.
+    bytes_per_origin = 3 * 8 * n_paths * n_periods_fcst * n_hubs
+    n_origins = int(memory_budget_mb * 1024 ** 2 // bytes_per_origin)
+    if n_origins < 1:
+        raise ValueError(f'{n_paths} paths of one origin need {bytes_per_origin / 1024 ** 2:.0f} MB, '
+                         f'more than the memory budget of {memory_budget_mb} MB.')
+    return n_origins
+
+def _block_starts(residuals, block_length):
+    # Blocks may only start where block_length consecutive hours all have residuals, so no block spans a data gap.
+    missing = np.concatenate([[0], np.cumsum(np.isnan(residuals).any(axis=1))])
+    return np.flatnonzero(missing[block_length:] == missing[:-block_length])
+
+def _draw_errors(residuals, n_paths, n_origins, n_periods_fcst, block_length, block_starts, rng):
+    if residuals.ndim == 3:
+        # Whole error trajectories keep the growth of errors with the horizon and the correlation between hours.
+        picks = rng.integers(0, len(residuals), size=(n_paths, n_origins))
+        return residuals[picks, :n_periods_fcst]
+
+    # Moving blocks of consecutive residuals keep the autocorrelation within each block.
+    n_blocks = -(-n_periods_fcst // block_length)
+    starts = block_starts[rng.integers(0, len(block_starts), size=(n_paths, n_origins, n_blocks))]
+    idx = (starts[..., None] + np.arange(block_length)).reshape(n_paths, n_origins, -1)[..., :n_periods_fcst]
+    return residuals[idx]
+
+def bootstrap_fcst_quantiles(point_fcst, residuals, quantiles=DEFAULT_QUANTILES, n_paths=2000, block_length=24,
+                             memory_budget_mb=256, seed=0):
+    """
+    Turns point forecasts, e.g. from the baselines or the LSTM, into forecast quantiles by adding resampled
+    residuals to every forecast. All paths of a chunk of origins are drawn in one vectorized operation.
+    Chunks are sized so that the simulated paths stay within the memory budget.
+    Every hub draws the same residual blocks, so the correlation between hubs is kept.
+
+    Parameters
+    ----------
+    point_fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    residuals : arr
+        Either historic residuals in time order with shape (n_residuals, n_hubs), which are resampled in moving blocks,
+        or historic forecast errors with shape (n_error_origins, n_periods_fcst, n_hubs), e.g. y_true - fcst from a
+        backtest, which are resampled as whole trajectories.
+
+    quantiles : tuple of floats
+        Quantiles to forecast.
+
+    n_paths : int
+        Number of simulated paths per origin.
+
+    block_length : int
+        Length of the resampled blocks of time-ordered residuals. Blocks never span an hour without a residual.
+
+    memory_budget_mb : float
+        Approximate memory the simulated paths may use at once.
+
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+
+    fcst_quantiles : arr
+        Forecasted prices with shape (len(quantiles), n_origins, n_periods_fcst, n_hubs).
+    """
+    point_fcst = np.asarray(point_fcst, dtype=float)
+    residuals = np.asarray(residuals, dtype=float)
+    n_origins, n_periods_fcst, n_hubs = point_fcst.shape
+    if residuals.ndim == 3 and residuals.shape[1] < n_periods_fcst:
+        raise ValueError('Forecast error trajectories must cover every forecasted hour.')
+
+    # Hours without a residual, e.g. inside data gaps, are not drawn.
+    if residuals.ndim == 2:
+        block_starts = _block_starts(residuals, block_length)
+        if len(block_starts) == 0:
+            raise ValueError(f'No {block_length} consecutive hours have residuals of every hub.')
+    else:
+        block_starts = None
+        residuals = residuals[~np.isnan(residuals[:, :n_periods_fcst]).any(axis=(1, 2))]
+        if len(residuals) == 0:
+            raise ValueError('No forecast error trajectory covers every forecasted hour of every hub.')
+
+    rng = np.random.default_rng(seed)
+    chunk = _origins_per_chunk(n_paths, n_periods_fcst, n_hubs, memory_budget_mb)
+    fcst_quantiles = np.empty((len(quantiles), n_origins, n_periods_fcst, n_hubs))
+    for start in range(0, n_origins, chunk):
+        stop = min(start + chunk, n_origins)
+        errors = _draw_errors(residuals, n_paths, stop - start, n_periods_fcst, block_length, block_starts, rng)
+        errors += point_fcst[start:stop]
+        fcst_quantiles[:, start:stop] = np.quantile(errors, quantiles, axis=0)
+    return fcst_quantiles
+
+def calc_pinball_loss(y_true, fcst_quantiles, quantiles=DEFAULT_QUANTILES):
+    """
+    Calculates the pinball (quantile) loss of every quantile and hub, the proper score of quantile forecasts.
+
+    Parameters
+    ----------
+    y_true : arr
+        Actual prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    fcst_quantiles : arr
+        Forecasted prices with shape (len(quantiles), n_origins, n_periods_fcst, n_hubs).
+
+    quantiles : tuple of floats
+        Quantile of each forecast.
+
+    Returns
+    -------
+
+    loss : arr
+        Mean pinball loss with shape (len(quantiles), n_hubs).
+    """
+    q = np.asarray(quantiles)[:, None, None, None]
+    diff = y_true - fcst_quantiles
+    return np.nanmean(np.maximum(q * diff, (q - 1) * diff), axis=(1, 2))
+
+def calc_interval_coverage(y_true, fcst_quantiles):
+    """
+    Calculates how often actual prices fall at or below each forecasted quantile, which should be close to the quantile.
+
+    Parameters
+    ----------
+    y_true : arr
+        Actual prices with shape (n_origins, n_periods_fcst, n_hubs).
+
+    fcst_quantiles : arr
+        Forecasted prices with shape (n_quantiles, n_origins, n_periods_fcst, n_hubs).
+
+    Returns
+    -------
+
+    coverage : arr
+        Share of actual prices at or below each quantile with shape (n_quantiles, n_hubs).
+    """
+    observed = ~np.isnan(y_true)
+    return (observed & (y_true <= fcst_quantiles)).sum(axis=(1, 2)) / observed.sum(axis=(0, 1))
+
+
+if __name__ == '__main__':
+
+    from src.import_process_data import import_caiso_dataset
+    from src.baseline import backtest_origins, stack_fcst_targets, ewm_profile_fcst
+
+    caiso = import_caiso_dataset('caiso_master')
+    lmp_matrix = caiso[['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26']].values
+
+    # Errors of the 60 days before the evaluation period calibrate the intervals of the last 30 days.
+    origins = backtest_origins(len(lmp_matrix), 24, 90)
+    y_true = stack_fcst_targets(lmp_matrix, origins, 24)
+    fcst = ewm_profile_fcst(lmp_matrix, origins, 24)
+    fcst_quantiles = bootstrap_fcst_quantiles(fcst[60:], (y_true - fcst)[:60])
+    print(calc_interval_coverage(y_true[60:], fcst_quantiles))
+    print(calc_pinball_loss(y_true[60:], fcst_quantiles))
@@ -0,0 +1,175 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from src.store import STORE_DIR
+from src.master_build import NODE_MASTER_DATASET, read_node_master
+
+
+REPORT_DIR = '../images/report'
+NODE_CHARTS = ('hourly_prices', 'box_plot', 'lag_plot')
+REPORT_FORMATS = ('png', 'svg')
+REPORT_BACKENDS = ('serial', 'process')
+
+# Populated once per worker process by _init_report_worker so the settings and forecasts are not pickled with every task.
+_WORKER_DATA = {}
+
+
+def _init_report_worker(settings):
+    import matplotlib.pyplot as plt
+
+    # Charts are only ever saved, so no worker needs a display or an interactive backend.
+    plt.switch_backend('Agg')
+    plt.rcParams['savefig.dpi'] = settings['dpi']
+    _WORKER_DATA.update(settings)
+
+def _chart_path(key, chart):
+    return os.path.join(_WORKER_DATA['out_dir'], f'{key}_{chart}.{_WORKER_DATA["fmt"]}')
+
+def _render_node(node_id):
+    from src.eda import plot_day_ahead_hourly_prices, plot_price_curve_box_plot, draw_lag_plots
+
+    # Each node is read once and every chart of the node is drawn from it.
+    node_master = read_node_master(node_id, _WORKER_DATA['months'], _WORKER_DATA['dataset'], _WORKER_DATA['store_dir'])
+    draw = {'hourly_prices': lambda path: plot_day_ahead_hourly_prices(node_master.index, node_master['$_MWH'], node_id,
+                                                                       path, _WORKER_DATA['max_points']),
+            'box_plot': lambda path: plot_price_curve_box_plot('OPR_HR_PT', '$_MWH', node_master, node_id, path),
+            'lag_plot': lambda path: draw_lag_plots([node_master['$_MWH']], [node_id], 24, path)}
+
+    rendered = []
+    for chart in _WORKER_DATA['charts']:
+        start = time.perf_counter()
+        draw[chart](_chart_path(node_id, chart))
+        rendered.append({'key': node_id, 'chart': chart, 'path': _chart_path(node_id, chart),
+                         'seconds': time.perf_counter() - start})
+    return rendered
+
+def _render_forecast(node_id):
+    from src.model import plot_actual_arima_baselie_lstm
+
+    start = time.perf_counter()
+    plot_actual_arima_baselie_lstm(**_WORKER_DATA['forecasts'][node_id], plot_title=f'{node_id} Forecast',
+                                   save_path=_chart_path(node_id, 'forecast'))
+    return [{'key': node_id, 'chart': 'forecast', 'path': _chart_path(node_id, 'forecast'),
+             'seconds': time.perf_counter() - start}]
+
+def _render_system(rollup_name):
+    from src.rollup import read_rollup
+    from src.eda import plot_prcnt_re_gen_moving_avg
+
+    start = time.perf_counter()
+    caiso_daily = read_rollup(rollup_name, 'daily', ['solar__sum', 'wind__sum', 'total_gen__sum'],
+                              store_dir=_WORKER_DATA['store_dir'])
+    plot_prcnt_re_gen_moving_avg(caiso_daily, 14, _chart_path(rollup_name, 're_gen_moving_avg'))
+    return [{'key': rollup_name, 'chart': 're_gen_moving_avg', 'path': _chart_path(rollup_name, 're_gen_moving_avg'),
+             'seconds': time.perf_counter() - start}]
+
+def _render_task(task):
+    kind, key = task
+    return {'node': _render_node, 'forecast': _render_forecast, 'system': _render_system}[kind](key)
+
+def render_report(node_ids, out_dir=REPORT_DIR, charts=NODE_CHARTS, fmt='png', rollup_name='caiso_master',
+                  forecasts=None, max_points=5000, dpi=100, backend='process', n_workers=None, months=None,
+                  dataset=NODE_MASTER_DATASET, store_dir=STORE_DIR):
+    """
+    Renders the EDA and forecast charts of every node to image files without a display.
+    Nodes are independent, so they are spread over worker processes that draw with the non-interactive Agg backend,
+    and dense hourly scatters are downsampled and rasterized so that each chart takes a fraction of a second.
+
+    Parameters
+    ----------
+    node_ids : list of strings
+        Nodes to chart. Each must have been built with build_node_masters().
+
+    out_dir : str
+        Directory the charts are written to, as '<node_id>_<chart>.<fmt>'.
+
+    charts : tuple of strings
+        Charts drawn for every node, from NODE_CHARTS.
+
+    fmt : str
+        'png' or 'svg'.
+
+    rollup_name : str
+        Master dataset whose daily rollup feeds the renewable generation chart. The chart is skipped if None.
+
+    forecasts : dict
+        Keyword arguments of plot_actual_arima_baselie_lstm() - date_rng, y_true, arima_pred, baseline_pred and
+        lstm_pred - keyed by node id, for the nodes that get a forecast chart.
+
+    max_points : int
+        Maximum number of points in the hourly price scatter. Every hour is drawn if None.
+
+    dpi : int
+        Resolution of PNGs and of the rasterized parts of SVGs.
+
+    backend : str
+        'serial' renders in this process, switching it to Agg. 'process' renders in a pool of worker processes.
+
+    n_workers : int
+        Number of worker processes. Defaults to the number of cores.
+
+    months : list of strings
+        Operating months to chart. All months are charted if None.
+
+    dataset : str
+        Store dataset of the node masters.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    rendered : dataframe
+        One row per chart with the node or dataset, the chart, the file and the seconds it took to draw.
+    """
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f'fmt must be one of {REPORT_FORMATS}.')
+    if backend not in REPORT_BACKENDS:
+        raise ValueError(f'backend must be one of {REPORT_BACKENDS}.')
+    unknown = set(charts) - set(NODE_CHARTS)
+    if unknown:
+        raise ValueError(f'Unknown charts {sorted(unknown)}, expected a subset of {NODE_CHARTS}.')
+
+    os.makedirs(out_dir, exist_ok=True)
+    forecasts = forecasts or {}
+    settings = {'out_dir': out_dir, 'fmt': fmt, 'charts': tuple(charts), 'forecasts': forecasts,
+                'max_points': max_points, 'dpi': dpi, 'months': months, 'dataset': dataset, 'store_dir': store_dir}
+    tasks = [('node', node_id) for node_id in node_ids] + [('forecast', node_id) for node_id in forecasts]
+    if rollup_name is not None:
+        tasks.append(('system', rollup_name))
+
+    if backend == 'serial':
+        _init_report_worker(settings)
+        rendered = [_render_task(task) for task in tasks]
+    else:
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (4 * n_workers))
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context, initializer=_init_report_worker,
+                                 initargs=(settings,)) as pool:
+            rendered = list(pool.map(_render_task, tasks, chunksize=chunksize))
+
+    return pd.DataFrame([chart for charts_of_task in rendered for chart in charts_of_task])
+
+
+if __name__ == '__main__':
+
+    import argparse
+    from src.store import list_partitions
+
+    parser = argparse.ArgumentParser(description='Renders the nightly chart report of every node.')
+    parser.add_argument('--out-dir', default=REPORT_DIR)
+    parser.add_argument('--fmt', choices=REPORT_FORMATS, default='png')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    # Partitions are named '<node_id>_<YYYY-MM>'.
+    node_ids = sorted({partition[:-8] for partition in list_partitions(NODE_MASTER_DATASET)})
+    rendered = render_report(node_ids, args.out_dir, fmt=args.fmt, n_workers=args.workers)
+    print(rendered.groupby('chart')['seconds'].describe())
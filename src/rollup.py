@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+from src.store import STORE_DIR, list_partitions, write_partition, read_dataset
+
+
+ROLLUP_COLUMNS = ['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26', 'other', 'solar', 'wind', 'total_gen', 'load_MW', 'net_exp_MW']
+ROLLUP_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Maps each rollup to the period it summarizes and the period of the store partitions it is written to.
+ROLLUP_FREQS = {'daily': ('D', 'M'), 'monthly': ('M', 'Y')}
+
+
+def _rollup_dates(caiso, date_col):
+    dates = caiso.index if date_col is None else caiso[date_col]
+    return pd.DatetimeIndex(pd.to_datetime(dates))
+
+def compute_rollup(caiso, freq='D', columns=ROLLUP_COLUMNS, quantiles=ROLLUP_QUANTILES, date_col='OPR_DT_PT'):
+    """
+    Summarizes hourly CAISO data by day or month for every hub and fuel.
+    Each column produces '<column>__<stat>' columns for sum, count, mean, min, max, sum of squares and quantiles.
+    Sums, counts and sums of squares allow exact means and standard deviations across periods.
+
+    Parameters
+    ----------
+    caiso : dataframe
+        Hourly CAISO dataset.
+
+    freq : str
+        'D' for daily and 'M' for monthly periods.
+
+    columns : list of strings
+        Columns to summarize. Columns missing from caiso are skipped.
+
+    quantiles : tuple of floats
+        Quantiles to compute, e.g. 0.5 produces '<column>__q50'.
+
+    date_col : str
+        Column with the operating date of each hour. The index is used if None.
+
+    Returns
+    -------
+
+    rollup : dataframe
+        One row per period, indexed by the start of the period.
+    """
+    columns = [col for col in columns if col in caiso.columns]
+    values = caiso[columns].apply(pd.to_numeric).reset_index(drop=True)
+    period_start = _rollup_dates(caiso, date_col).to_period(freq).to_timestamp()
+    grouped = values.groupby(period_start)
+
+    stats = {'sum': grouped.sum(), 'count': grouped.count(), 'mean': grouped.mean(), 'min': grouped.min(),
+             'max': grouped.max(), 'sumsq': (values ** 2).groupby(period_start).sum()}
+    for q in quantiles:
+        stats[f'q{int(round(q * 100)):02d}'] = grouped.quantile(q)
+
+    rollup = pd.concat(stats, axis=1)
+    rollup.columns = [f'{col}__{stat}' for stat, col in rollup.columns]
+    rollup = rollup[sorted(rollup.columns, key=lambda c: columns.index(c.split('__')[0]))]
+    rollup.index.name = 'period_start'
+    return rollup
+
+def update_rollups(caiso, name, store_dir=STORE_DIR, rollups=('daily', 'monthly'), columns=ROLLUP_COLUMNS,
+                   date_col='OPR_DT_PT'):
+    """
+    Writes or refreshes the daily and monthly rollups of a CAISO dataset in the columnar store.
+    Rollups are partitioned by month (daily) and year (monthly).
+    Only the last stored partition and any newer ones are recomputed, so appending new hours costs at most one partition.
+
+    Parameters
+    ----------
+    caiso : dataframe
+        Hourly CAISO dataset sorted by time. It can span the full history; older partitions are not touched.
+
+    name : str
+        Name of the hourly dataset. Rollups are stored as '<name>_daily' and '<name>_monthly'.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    rollups : tuple of strings
+        Rollups to maintain, i.e. 'daily' and/or 'monthly'.
+
+    columns : list of strings
+        Columns to summarize.
+
+    date_col : str
+        Column with the operating date of each hour. The index is used if None.
+
+    Returns
+    -------
+
+    refreshed : dict
+        Maps each rollup to the partitions that were written.
+    """
+    dates = _rollup_dates(caiso, date_col)
+    refreshed = {}
+    for label in rollups:
+        freq, partition_freq = ROLLUP_FREQS[label]
+        dataset = f'{name}_{label}'
+        partition_keys = dates.to_period(partition_freq).astype(str)
+
+        existing = list_partitions(dataset, store_dir)
+        start = 0 if len(existing) == 0 else np.searchsorted(np.asarray(partition_keys), existing[-1], side='left')
+        if start >= len(caiso):
+            refreshed[label] = []
+            continue
+
+        rollup = compute_rollup(caiso.iloc[start:], freq, columns, date_col=date_col)
+        rollup_keys = rollup.index.to_period(partition_freq).astype(str)
+        for partition, chunk in rollup.groupby(rollup_keys):
+            write_partition(chunk, dataset, partition, store_dir, index_name='period_start')
+        refreshed[label] = sorted(set(rollup_keys))
+    return refreshed
+
+def read_rollup(name, rollup='daily', columns=None, store_dir=STORE_DIR):
+    """
+    Reads a precomputed rollup from the columnar store.
+
+    Parameters
+    ----------
+    name : str
+        Name of the hourly dataset, e.g. 'caiso_master'.
+
+    rollup : str
+        'daily' or 'monthly'.
+
+    columns : list of strings
+        Rollup columns to read, e.g. ['solar__sum', 'wind__sum']. All columns are read if None.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    rollup : dataframe
+        One row per period, indexed by the start of the period.
+    """
+    return read_dataset(f'{name}_{rollup}', columns, store_dir=store_dir, index_col='period_start')
+
+def summarize_rollup(rollup, column):
+    """
+    Combines per-period statistics into statistics over the full history.
+    Mean and standard deviation are exact. The median is the count-weighted median of the period medians.
+
+    Parameters
+    ----------
+    rollup : dataframe
+        Output of compute_rollup() or read_rollup().
+
+    column : str
+        Hourly column to summarize, e.g. '$_MWH_np15'.
+
+    Returns
+    -------
+
+    summary : dict
+        Count, mean, approximate median, standard deviation, min and max.
+    """
+    count = rollup[f'{column}__count'].values
+    n_obs = count.sum()
+    avg = rollup[f'{column}__sum'].sum() / n_obs
+    var = (rollup[f'{column}__sumsq'].sum() - n_obs * avg ** 2) / (n_obs - 1)
+
+    medians = rollup[f'{column}__q50'].values
+    order = np.argsort(medians)
+    cum_count = np.cumsum(count[order])
+    median = medians[order][np.searchsorted(cum_count, n_obs / 2)]
+
+    return {'count': n_obs, 'mean': avg, 'median': median, 'std': np.sqrt(max(var, 0)),
+            'min': rollup[f'{column}__min'].min(), 'max': rollup[f'{column}__max'].max()}
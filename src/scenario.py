@@ -0,0 +1,271 @@
+import os
+import shutil
+import itertools
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from src.store import STORE_DIR, write_partition, read_columns, list_partitions
+
+
+def scenario_grid(levels):
+    """
+    Builds every combination of multiplicative shock levels, e.g. gas prices up 30% and solar down 20%.
+
+    Parameters
+    ----------
+    levels : dict
+        Maps each exogenous column to a list of multipliers, e.g. {'HH_$_mill_BTU': [1.0, 1.3], 'solar': [0.8, 1.0]}.
+
+    Returns
+    -------
+
+    scale : dict
+        Maps each column to an array with one multiplier per scenario, for run_scenarios().
+
+    definitions : dataframe
+        One row per scenario with its multiplier for every column.
+    """
+    names = list(levels.keys())
+    definitions = pd.DataFrame(list(itertools.product(*[levels[name] for name in names])), columns=names)
+    definitions.index.name = 'scenario'
+    return {name: definitions[name].to_numpy(dtype=float) for name in names}, definitions
+
+def random_shock_paths(n_scenarios, n_periods_fcst, columns, volatility, persistence=0.9, seed=0):
+    """
+    Simulates multiplicative shock paths that drift away from the base case, e.g. for gas price or renewable output.
+    Log multipliers follow an AR(1) process per scenario, drawn for every scenario and hour at once.
+
+    Parameters
+    ----------
+    n_scenarios : int
+        Number of scenarios.
+
+    n_periods_fcst : int
+        Number of forecasted hours.
+
+    columns : list of strings
+        Exogenous columns to shock.
+
+    volatility : dict or float
+        Standard deviation of the hourly log shock of each column.
+
+    persistence : float
+        AR(1) coefficient of the log multipliers.
+
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+
+    scale : dict
+        Maps each column to multipliers with shape (n_scenarios, n_periods_fcst), for run_scenarios().
+    """
+    rng = np.random.default_rng(seed)
+    scale = {}
+    for col in columns:
+        vol = volatility[col] if isinstance(volatility, dict) else volatility
+        innovations = rng.normal(0, vol, (n_scenarios, n_periods_fcst))
+        scale[col] = np.exp(signal.lfilter([1.0], [1.0, -persistence], innovations, axis=1))
+    return scale
+
+def apply_exog_shocks(base_exog, exog_columns, scale=None, shift=None, scenarios=slice(None)):
+    """
+    Applies multiplicative and additive shocks to the base exogenous inputs for a batch of scenarios at once.
+
+    Parameters
+    ----------
+    base_exog : arr
+        Exogenous inputs of the base case with shape (n_periods_fcst, n_exog).
+
+    exog_columns : list of strings
+        Name of each exogenous column.
+
+    scale : dict
+        Maps columns to multipliers with shape (n_scenarios,) for a level shock or (n_scenarios, n_periods_fcst) for a path.
+
+    shift : dict
+        Maps columns to additive shocks with the same shapes as scale. Applied after scale.
+
+    scenarios : slice
+        Scenarios of the batch.
+
+    Returns
+    -------
+
+    exog : arr
+        Shocked inputs with shape (n_batch, n_periods_fcst, n_exog).
+    """
+    base_exog = np.asarray(base_exog, dtype=float)
+    shocks = [(scale or {}, np.multiply), (shift or {}, np.add)]
+    n_batch = _n_scenarios(scale, shift, scenarios)
+
+    exog = np.repeat(base_exog[None], n_batch, axis=0)
+    for shock, op in shocks:
+        for col, values in shock.items():
+            values = np.asarray(values, dtype=float)[scenarios]
+            j = exog_columns.index(col)
+            exog[:, :, j] = op(exog[:, :, j], values[:, None] if values.ndim == 1 else values)
+    return exog
+
+def _n_scenarios(scale, shift, scenarios=slice(None)):
+    sizes = {len(np.asarray(v)[scenarios]) for shock in (scale or {}, shift or {}) for v in shock.values()}
+    if len(sizes) != 1:
+        raise ValueError('Every shock must have the same number of scenarios.')
+    return sizes.pop()
+
+def arimax_batch_forecaster(models, base_exog):
+    """
+    Turns fitted ARIMAX models, one per hub, into a forecaster that prices a whole batch of scenarios in one call.
+    An ARIMAX forecast is affine in the future exogenous inputs, so each model is probed once per forecasted hour and
+    input to build its exact response, and every batch is then a single tensor contraction.
+
+    Parameters
+    ----------
+    models : list of objects
+        Models fitted with arimax_fit(), one per hub.
+
+    base_exog : arr
+        Exogenous inputs of the base case with shape (n_periods_fcst, n_exog).
+
+    Returns
+    -------
+
+    forecaster : function
+        Maps exogenous inputs with shape (n_batch, n_periods_fcst, n_exog) to prices with shape
+        (n_batch, n_periods_fcst, n_hubs).
+    """
+    from src.model import arimax_predict
+
+    base_exog = np.asarray(base_exog, dtype=float)
+    n_periods_fcst, n_exog = base_exog.shape
+    base_fcst = np.empty((n_periods_fcst, len(models)))
+    response = np.empty((n_periods_fcst, n_exog, n_periods_fcst, len(models)))
+    for h, model in enumerate(models):
+        base_fcst[:, h] = arimax_predict(model, base_exog)
+        for t, j in itertools.product(range(n_periods_fcst), range(n_exog)):
+            probe = base_exog.copy()
+            probe[t, j] += 1.0
+            response[t, j, :, h] = arimax_predict(model, probe) - base_fcst[:, h]
+
+    def forecaster(exog):
+        return base_fcst + np.einsum('btj,tjph->bph', exog - base_exog, response)
+
+    return forecaster
+
+def run_scenarios(forecaster, base_exog, exog_columns, scale=None, shift=None, hub_names=('NP15', 'SP15', 'ZP26'),
+                  batch_size=1000, name=None, store_dir=STORE_DIR):
+    """
+    Runs every scenario through a batched forecaster with one call per batch of scenarios.
+    With a name, each batch is written to the columnar store as soon as it is priced, so memory use stays flat
+    however many scenarios are run.
+
+    Parameters
+    ----------
+    forecaster : function
+        Maps exogenous inputs with shape (n_batch, n_periods_fcst, n_exog) to prices with shape
+        (n_batch, n_periods_fcst, n_hubs), e.g. from arimax_batch_forecaster().
+
+    base_exog : arr
+        Exogenous inputs of the base case with shape (n_periods_fcst, n_exog).
+
+    exog_columns : list of strings
+        Name of each exogenous column.
+
+    scale : dict
+        Multiplicative shocks, e.g. from scenario_grid() or random_shock_paths().
+
+    shift : dict
+        Additive shocks.
+
+    hub_names : tuple of strings
+        Name of each hub in the forecaster's output.
+
+    batch_size : int
+        Number of scenarios per forecaster call.
+
+    name : str
+        Dataset the results are streamed to, one partition per batch. Results of an earlier run under the same name are
+        deleted first. Results are returned in memory if None.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    fcst : arr
+        Prices with shape (n_scenarios, n_periods_fcst, n_hubs), or the number of scenarios written if name is given.
+    """
+    exog_columns = list(exog_columns)
+    n_scenarios = _n_scenarios(scale, shift)
+    n_periods_fcst = len(base_exog)
+    results = []
+    if name is not None:
+        # A smaller earlier run would otherwise leave batches behind that summarize_scenarios() reads as this run's.
+        shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+    for batch, start in enumerate(range(0, n_scenarios, batch_size)):
+        scenarios = slice(start, min(start + batch_size, n_scenarios))
+        fcst = forecaster(apply_exog_shocks(base_exog, exog_columns, scale, shift, scenarios))
+        if name is None:
+            results.append(fcst)
+            continue
+
+        n_batch = len(fcst)
+        prices = pd.DataFrame(fcst.reshape(n_batch * n_periods_fcst, -1), columns=list(hub_names))
+        prices.insert(0, 'scenario', np.repeat(np.arange(scenarios.start, scenarios.stop), n_periods_fcst))
+        prices.insert(1, 'horizon', np.tile(np.arange(n_periods_fcst), n_batch))
+        write_partition(prices, name, f'batch_{batch:05d}', store_dir)
+
+    return np.concatenate(results) if name is None else n_scenarios
+
+def summarize_scenarios(name, hub_names=('NP15', 'SP15', 'ZP26'), store_dir=STORE_DIR):
+    """
+    Summarizes streamed scenario results one batch at a time: mean, minimum and maximum price of every scenario and hub.
+
+    Parameters
+    ----------
+    name : str
+        Dataset written by run_scenarios().
+
+    hub_names : tuple of strings
+        Hubs to summarize.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    summary : dataframe
+        One row per scenario.
+    """
+    frames = []
+    for partition in list_partitions(name, store_dir):
+        prices = pd.DataFrame(read_columns(name, ['scenario'] + list(hub_names), [partition], store_dir, mmap=False))
+        frames.append(prices.groupby('scenario')[list(hub_names)].agg(['mean', 'min', 'max']))
+    summary = pd.concat(frames)
+    summary.columns = [f'{hub}__{stat}' for hub, stat in summary.columns]
+    return summary
+
+
+if __name__ == '__main__':
+
+    from src.model import EXOG_COLUMNS, load_exog_matrix, arimax_fit
+    from src.store import read_column_matrix
+
+    lmp_matrix = read_column_matrix('caiso_master', ['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26'])
+    exog = load_exog_matrix('caiso_master')
+
+    # Day-ahead scenarios around the last day, with the last day's inputs as the base case.
+    n_train = len(exog) - 24
+    models = [arimax_fit(lmp_matrix[:n_train, h], exog[:n_train], 2, 1, 1) for h in range(lmp_matrix.shape[1])]
+    forecaster = arimax_batch_forecaster(models, exog[n_train:])
+
+    scale, definitions = scenario_grid({'HH_$_mill_BTU': np.linspace(0.7, 1.3, 25),
+                                        'solar': np.linspace(0.6, 1.2, 25),
+                                        'load_MW': np.linspace(0.9, 1.1, 21)})
+    run_scenarios(forecaster, exog[n_train:], EXOG_COLUMNS, scale, name='scenarios_gas_solar_load')
+    print(definitions.join(summarize_scenarios('scenarios_gas_solar_load')).head(20))
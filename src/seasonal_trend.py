@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+
+
+SEASONAL_COMPONENTS = ('month', 'hour', 'day_week')
+
+# Number of levels and the function that maps a DatetimeIndex to integer codes for each component.
+_COMPONENT_CODES = {
+    'month': (12, lambda idx: idx.month.values - 1),
+    'hour': (24, lambda idx: idx.hour.values),
+    'day_week': (7, lambda idx: idx.dayofweek.values),
+}
+
+
+def seasonal_codes(date_idx, components=SEASONAL_COMPONENTS):
+    """
+    Converts timestamps into integer codes for each seasonal component.
+
+    Parameters
+    ----------
+    date_idx : arr
+        Hourly timestamps.
+
+    components : tuple of strings
+        Any of 'month', 'hour' and 'day_week'. Monday = 0.
+
+    Returns
+    -------
+
+    codes : list of tuples
+        One (codes, n_levels) tuple per component, where codes is an integer array with one value per timestamp.
+    """
+    date_idx = pd.DatetimeIndex(date_idx)
+    codes = []
+    for component in components:
+        n_levels, to_codes = _COMPONENT_CODES[component]
+        codes.append((to_codes(date_idx).astype(np.intp), n_levels))
+    return codes
+
+def _grouped_sums(code, n_levels, lmp_matrix):
+    # Sums every column of lmp_matrix by code in a single bincount over (code, column) pairs.
+    n_cols = lmp_matrix.shape[1]
+    flat_codes = (code[:, None] * n_cols + np.arange(n_cols)).ravel()
+    sums = np.bincount(flat_codes, weights=lmp_matrix.ravel(), minlength=n_levels * n_cols)
+    return sums.reshape(n_levels, n_cols)
+
+def fit_seasonal_effects(lmp_matrix, codes):
+    """
+    Fits additive seasonal effects by least squares with one dummy variable per level of each component.
+    The dummy matrix is never built: the normal equations are assembled from grouped counts and sums,
+    so their size depends only on the number of levels. All columns share one solve.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Hourly prices with one column per hub or node, i.e. shape (n_hours, n_hubs). Missing prices are not supported.
+
+    codes : list of tuples
+        Output of seasonal_codes().
+
+    Returns
+    -------
+
+    intercept : arr
+        Intercept for each column.
+
+    effects : list of arrays
+        Effect of each level with shape (n_levels, n_hubs), in the order of codes.
+    """
+    lmp_matrix = np.asarray(lmp_matrix, dtype=float)
+    if lmp_matrix.ndim == 1:
+        lmp_matrix = lmp_matrix[:, None]
+    if np.isnan(lmp_matrix).any():
+        raise ValueError('Fill missing prices before fitting seasonal effects.')
+
+    n_hours = lmp_matrix.shape[0]
+    sizes = [n_levels for _, n_levels in codes]
+    offsets = np.concatenate([[1], 1 + np.cumsum(sizes)])
+    n_params = offsets[-1]
+
+    # X'X is made of level counts on the diagonal blocks and cross-tabulated counts off the diagonal.
+    xtx = np.zeros((n_params, n_params))
+    xty = np.zeros((n_params, lmp_matrix.shape[1]))
+    xtx[0, 0] = n_hours
+    xty[0] = lmp_matrix.sum(axis=0)
+    for i, (code_i, n_i) in enumerate(codes):
+        rows = slice(offsets[i], offsets[i + 1])
+        counts = np.bincount(code_i, minlength=n_i)
+        xtx[0, rows] = xtx[rows, 0] = counts
+        xty[rows] = _grouped_sums(code_i, n_i, lmp_matrix)
+        for j, (code_j, n_j) in enumerate(codes[:i]):
+            cross = np.bincount(code_i * n_j + code_j, minlength=n_i * n_j).reshape(n_i, n_j)
+            cols = slice(offsets[j], offsets[j + 1])
+            xtx[rows, cols] = cross
+            xtx[cols, rows] = cross.T
+        xtx[rows, rows] = np.diag(counts)
+
+    # The full set of dummies plus an intercept is rank deficient, but every least-squares solution
+    # yields the same fitted values, so the minimum-norm solution is used.
+    beta = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+    effects = [beta[offsets[i]:offsets[i + 1]] for i in range(len(codes))]
+    return beta[0], effects
+
+def predict_seasonal_effects(intercept, effects, codes):
+    """
+    Computes the fitted seasonal values for the provided codes.
+
+    Parameters
+    ----------
+    intercept : arr
+        Intercept for each column.
+
+    effects : list of arrays
+        Effect of each level with shape (n_levels, n_hubs).
+
+    codes : list of tuples
+        Output of seasonal_codes().
+
+    Returns
+    -------
+
+    fitted : arr
+        Fitted values with shape (n_hours, n_hubs).
+    """
+    fitted = np.broadcast_to(intercept, (len(codes[0][0]), len(intercept))).copy()
+    for effect, (code, _) in zip(effects, codes):
+        fitted += effect[code]
+    return fitted
+
+def fit_seasonal_means(lmp_matrix, date_idx, components=SEASONAL_COMPONENTS):
+    """
+    Fits and predicts the additive seasonal means of every column in one pass.
+    With a single component the fitted values are simply the group means.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Hourly prices with shape (n_hours,) or (n_hours, n_hubs).
+
+    date_idx : arr
+        Timestamps that correspond to the rows of lmp_matrix.
+
+    components : tuple of strings
+        Any of 'month', 'hour' and 'day_week'.
+
+    Returns
+    -------
+
+    fitted : arr
+        Fitted seasonal values with the same shape as lmp_matrix.
+    """
+    values = np.asarray(lmp_matrix, dtype=float)
+    codes = seasonal_codes(date_idx, components)
+    intercept, effects = fit_seasonal_effects(values, codes)
+    fitted = predict_seasonal_effects(intercept, effects, codes)
+    return fitted.reshape(values.shape)
+
+def remove_seasonal_means(lmp_df, components=SEASONAL_COMPONENTS):
+    """
+    Detrends every hub or node in the dataframe by subtracting its seasonal means.
+
+    Parameters
+    ----------
+    lmp_df : dataframe
+        Hourly prices with a DatetimeIndex and one column per hub or node.
+
+    components : tuple of strings
+        Any of 'month', 'hour' and 'day_week'.
+
+    Returns
+    -------
+
+    resid_df : dataframe
+        Prices less their seasonal means.
+    """
+    fitted = fit_seasonal_means(lmp_df.values, lmp_df.index, components)
+    return lmp_df - fitted
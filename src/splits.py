@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+
+from src.time_axis import CAISO_TZ, utc_hours
+
+
+SPLIT_NAMES = ('train', 'valid', 'test')
+
+
+def _boundary_position(hour_utc, boundary, tz):
+    # Row indices are used as they are. Dates and timestamps are local to the market and located on HOUR_UTC.
+    if boundary is None or isinstance(boundary, (int, np.integer)):
+        return boundary
+    if np.ndim(hour_utc) == 0:
+        raise ValueError('Date boundaries need the HOUR_UTC of every row.')
+    return int(np.searchsorted(hour_utc, utc_hours(pd.DatetimeIndex([pd.Timestamp(boundary)]), tz)[0], side='left'))
+
+def time_split(hour_utc, valid_start, test_start=None, end=None, gap=0, start=None, tz=CAISO_TZ):
+    """
+    Splits the shared time axis into consecutive train, validation and test folds.
+    Every fold is a slice of rows, so it selects the same hours of every hub at once and indexing with it returns a
+    view rather than a copy. The gap hours before each boundary belong to no fold, which keeps lagged features and
+    autocorrelated errors from leaking across it. Models that forecast from the end of their training data, like ARIMA,
+    forecast gap + n_valid hours and drop the first gap.
+
+    Parameters
+    ----------
+    hour_utc : arr or int
+        HOUR_UTC of every row, or the number of rows when every boundary is a row index.
+
+    valid_start : int, str or timestamp
+        First row, or first local date or time, of the validation fold.
+
+    test_start : int, str or timestamp
+        First row, date or time of the test fold. There is no test fold if None.
+
+    end : int, str or timestamp
+        Row, date or time the last fold stops before. Folds run to the last row if None.
+
+    gap : int
+        Embargo hours dropped before each boundary.
+
+    start : int, str or timestamp
+        First row, date or time of the training fold. Training starts at the first row if None.
+
+    tz : str
+        Timezone of date boundaries.
+
+    Returns
+    -------
+
+    split : dict
+        Slice of rows of each fold, keyed by 'train', 'valid' and, with test_start, 'test'.
+    """
+    n_hours = int(hour_utc) if np.ndim(hour_utc) == 0 else len(hour_utc)
+    start = _boundary_position(hour_utc, start, tz) or 0
+    end = n_hours if end is None else min(_boundary_position(hour_utc, end, tz), n_hours)
+    boundaries = [_boundary_position(hour_utc, valid_start, tz)]
+    if test_start is not None:
+        boundaries.append(_boundary_position(hour_utc, test_start, tz))
+
+    starts = [start] + boundaries
+    stops = [boundary - gap for boundary in boundaries] + [end]
+    if any(stop <= first for first, stop in zip(starts, stops)):
+        raise ValueError(f'Every fold needs at least one hour, got starts {starts} and stops {stops}.')
+    return {name: slice(first, stop) for name, first, stop in zip(SPLIT_NAMES, starts, stops)}
+
+def fraction_split(n_hours, fraction_valid, fraction_test=0.0, gap=0):
+    """
+    Splits the last fractions of the rows off as validation and test folds.
+
+    Parameters
+    ----------
+    n_hours : int
+        Number of rows.
+
+    fraction_valid : float
+        Share of the rows in the validation fold.
+
+    fraction_test : float
+        Share of the rows in the test fold. There is no test fold if 0.
+
+    gap : int
+        Embargo hours dropped before each boundary.
+
+    Returns
+    -------
+
+    split : dict
+        Slice of rows of each fold, as from time_split().
+    """
+    n_test = int(fraction_test * n_hours)
+    n_valid = int(fraction_valid * n_hours)
+    test_start = n_hours - n_test if n_test > 0 else None
+    return time_split(n_hours, n_hours - n_test - n_valid, test_start, gap=gap)
+
+def rolling_origin_splits(hour_utc, first_valid, n_folds, valid_hours, step=None, gap=0, train_hours=None, tz=CAISO_TZ):
+    """
+    Creates walk-forward folds whose validation windows move forward in time.
+    Training folds expand from the first row, or slide with a fixed length when train_hours is set.
+
+    Parameters
+    ----------
+    hour_utc : arr or int
+        HOUR_UTC of every row, or the number of rows when first_valid is a row index.
+
+    first_valid : int, str or timestamp
+        First row, date or time of the first validation fold.
+
+    n_folds : int
+        Number of folds.
+
+    valid_hours : int
+        Length of every validation fold.
+
+    step : int
+        Hours between the starts of consecutive validation folds. Defaults to valid_hours.
+
+    gap : int
+        Embargo hours dropped before each validation fold.
+
+    train_hours : int
+        Length of every training fold. Training folds expand if None.
+
+    tz : str
+        Timezone of a date boundary.
+
+    Returns
+    -------
+
+    splits : list of dicts
+        Slices of the 'train' and 'valid' rows of each fold.
+    """
+    n_hours = int(hour_utc) if np.ndim(hour_utc) == 0 else len(hour_utc)
+    step = valid_hours if step is None else step
+    valid_starts = _boundary_position(hour_utc, first_valid, tz) + step * np.arange(n_folds)
+    if valid_starts[-1] + valid_hours > n_hours:
+        raise ValueError(f'The last fold ends after the last of {n_hours} rows.')
+    return [time_split(n_hours, int(valid_start), end=int(valid_start) + valid_hours, gap=gap,
+                       start=None if train_hours is None else max(int(valid_start) - gap - train_hours, 0))
+            for valid_start in valid_starts]
+
+def split_index(split):
+    """
+    Converts the folds of a split to row index arrays.
+
+    Parameters
+    ----------
+    split : dict
+        Slices of rows from time_split().
+
+    Returns
+    -------
+
+    index : dict
+        Row index array of each fold.
+    """
+    return {name: np.arange(fold.start, fold.stop) for name, fold in split.items()}
+
+def split_views(cube, split):
+    """
+    Selects the rows of every fold from the shared data cube without copying it.
+
+    Parameters
+    ----------
+    cube : arr
+        Hourly data with time as the first axis, e.g. prices of shape (n_hours, n_hubs).
+
+    split : dict
+        Slices of rows from time_split().
+
+    Returns
+    -------
+
+    views : dict
+        View of the cube for each fold.
+    """
+    return {name: cube[fold] for name, fold in split.items()}
+
+def split_windows(data, fold, n_prev):
+    """
+    Creates the LSTM windows whose targets fall in a fold, as views of the data.
+    Windows may reach back before the start of the fold, since those hours are known when the fold is forecast, so the
+    first n_prev hours of a validation fold are not lost.
+
+    Parameters
+    ----------
+    data : arr
+        Hourly values of one series, shape (n_hours,), or of every hub, shape (n_hours, n_hubs).
+
+    fold : slice
+        Rows of the fold from time_split().
+
+    n_prev : int
+        The number of values that comprise a sequence/window.
+
+    Returns
+    -------
+
+    x : arr
+        Windows with shape (n_windows, n_prev, 1), or (n_windows, n_prev, n_hubs) for every hub.
+
+    y : arr
+        Targets with shape (n_windows,) or (n_windows, n_hubs).
+    """
+    data = np.asarray(data)
+    start, stop = max(fold.start, n_prev), fold.stop
+    if stop <= start:
+        raise ValueError(f'The fold has no hours with {n_prev} hours of history.')
+    x = np.lib.stride_tricks.sliding_window_view(data[start - n_prev:stop - 1], n_prev, axis=0)
+    x = x[..., None] if data.ndim == 1 else np.moveaxis(x, -1, 1)
+    return x, data[start:stop]
+
+
+if __name__ == '__main__':
+
+    from src.store import read_column_matrix
+    from src.model import arima_uni_var_train_valid_split, split_and_windowize
+
+    lmp_matrix = read_column_matrix('caiso_master', ['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26'])
+    hour_utc = read_column_matrix('caiso_master', ['HOUR_UTC'])[:, 0].astype(np.int64)
+
+    # The last ten days of May 2020 are held out after a one-day embargo, for ARIMA and the LSTM alike.
+    split = time_split(hour_utc, '2020-05-22', gap=24)
+    print({name: (fold.start, fold.stop) for name, fold in split.items()})
+    lmp_train, lmp_valid, _, _ = arima_uni_var_train_valid_split(lmp_matrix[:, 0], hour_utc, split)
+    x_train, x_valid, y_train, y_valid = split_and_windowize(lmp_matrix[:, 0], 24, None, split)
+    print(len(lmp_train), len(lmp_valid), x_train.shape, x_valid.shape, np.shares_memory(x_train, lmp_matrix))
@@ -0,0 +1,252 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+STORE_DIR = '../data/store'
+SCHEMA_FILE = '_schema.json'
+
+
+def _partition_path(dataset, partition, store_dir):
+    return os.path.join(store_dir, dataset, str(partition))
+
+def list_partitions(dataset, store_dir=STORE_DIR):
+    """
+    Lists the partitions of a dataset in the columnar store in sorted order.
+
+    Parameters
+    ----------
+    dataset : str
+        Name of the dataset, e.g. 'caiso_master'.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    partitions : list of strings
+        Partition names. Empty if the dataset does not exist.
+    """
+    dataset_dir = os.path.join(store_dir, dataset)
+    if not os.path.isdir(dataset_dir):
+        return []
+    return sorted(p for p in os.listdir(dataset_dir)
+                  if os.path.exists(os.path.join(dataset_dir, p, SCHEMA_FILE)))
+
+def write_partition(df, dataset, partition='all', store_dir=STORE_DIR, index_name=None):
+    """
+    Writes a dataframe to the columnar store with one .npy file per column.
+    Numeric and datetime columns are stored with their native dtype so that they can be memory-mapped.
+    Timezone-aware datetimes are stored in UTC.
+    Other columns are stored as fixed-width strings. An existing partition with the same name is replaced.
+
+    Parameters
+    ----------
+    df : dataframe
+        Data to store.
+
+    dataset : str
+        Name of the dataset, e.g. 'caiso_master'.
+
+    partition : str
+        Name of the partition, e.g. '2020-05'. Partitions are read back in sorted order.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    index_name : str
+        Stores the dataframe's index as a column with this name. The index is dropped if None.
+
+    Returns
+    -------
+
+    """
+    if index_name is not None:
+        df = df.rename_axis(index_name).reset_index()
+    write_partition_columns(((col, df[col]) for col in df.columns), dataset, partition, store_dir)
+
+def _column_values(values):
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    tz = None
+    if isinstance(values.dtype, pd.DatetimeTZDtype):
+        # Timezone-aware columns are stored as UTC and localized again on read.
+        tz = str(values.dt.tz)
+        values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+    arr = values.to_numpy()
+    if arr.dtype.kind not in 'biufcmM':
+        arr = values.astype(str).to_numpy().astype(str)
+    return arr, tz
+
+def write_partition_columns(columns, dataset, partition='all', store_dir=STORE_DIR):
+    """
+    Writes a partition one column at a time, so only one column has to be in memory at once.
+    Columns are stored as by write_partition(), and an existing partition with the same name is replaced.
+
+    Parameters
+    ----------
+    columns : iterable
+        (name, values) pairs of equal length, e.g. a generator that builds each column when it is needed.
+
+    dataset : str
+        Name of the dataset, e.g. 'caiso_master'.
+
+    partition : str
+        Name of the partition, e.g. '2020-05'.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    Returns
+    -------
+
+    """
+    part_dir = _partition_path(dataset, partition, store_dir)
+    tmp_dir = part_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    schema = {'n_rows': None, 'columns': []}
+    for i, (col, values) in enumerate(columns):
+        values, tz = _column_values(values)
+        if schema['n_rows'] is not None and len(values) != schema['n_rows']:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise ValueError(f'{col} has {len(values)} rows, expected {schema["n_rows"]}.')
+        schema['n_rows'] = len(values)
+        file_name = f'{i:04d}.npy'
+        np.save(os.path.join(tmp_dir, file_name), values, allow_pickle=False)
+        schema['columns'].append({'name': str(col), 'file': file_name, 'dtype': values.dtype.str, 'tz': tz})
+    schema['n_rows'] = schema['n_rows'] or 0
+
+    with open(os.path.join(tmp_dir, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f)
+
+    # Swap the finished partition in so that readers never see a half-written one.
+    shutil.rmtree(part_dir, ignore_errors=True)
+    os.rename(tmp_dir, part_dir)
+
+def read_schema(dataset, partition, store_dir=STORE_DIR):
+    with open(os.path.join(_partition_path(dataset, partition, store_dir), SCHEMA_FILE)) as f:
+        return json.load(f)
+
+def read_columns(dataset, columns=None, partitions=None, store_dir=STORE_DIR, mmap=True):
+    """
+    Reads columns from the columnar store without parsing any text.
+
+    Parameters
+    ----------
+    dataset : str
+        Name of the dataset, e.g. 'caiso_master'.
+
+    columns : list of strings
+        Columns to read. All columns are read if None.
+
+    partitions : list of strings
+        Partitions to read. All partitions are read if None.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    mmap : bool
+        Memory-maps single-partition reads instead of loading them into memory.
+
+    Returns
+    -------
+
+    data : dict
+        Maps each column name to a 1-D array spanning the requested partitions.
+    """
+    if partitions is None:
+        partitions = list_partitions(dataset, store_dir)
+    if len(partitions) == 0:
+        raise FileNotFoundError(f'{dataset} does not exist in {store_dir}.')
+
+    pieces = {}
+    for partition in partitions:
+        part_dir = _partition_path(dataset, partition, store_dir)
+        schema = read_schema(dataset, partition, store_dir)
+        files = {c['name']: c['file'] for c in schema['columns']}
+        for col in (columns if columns is not None else files.keys()):
+            if col not in files:
+                raise KeyError(f'{col} is not a column of {dataset}.')
+            pieces.setdefault(col, []).append(np.load(os.path.join(part_dir, files[col]),
+                                                      mmap_mode='r' if mmap else None))
+
+    return {col: arrs[0] if len(arrs) == 1 else np.concatenate(arrs) for col, arrs in pieces.items()}
+
+def read_dataset(dataset, columns=None, partitions=None, store_dir=STORE_DIR, index_col=None):
+    """
+    Reads a dataset from the columnar store into a dataframe.
+
+    Parameters
+    ----------
+    dataset : str
+        Name of the dataset, e.g. 'caiso_master'.
+
+    columns : list of strings
+        Columns to read. All columns are read if None.
+
+    partitions : list of strings
+        Partitions to read. All partitions are read if None.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    index_col : str
+        Column to use as the index.
+
+    Returns
+    -------
+
+    df : dataframe
+        The stored data.
+    """
+    if columns is not None and index_col is not None and index_col not in columns:
+        columns = [index_col] + list(columns)
+    data = read_columns(dataset, columns, partitions, store_dir, mmap=False)
+    df = pd.DataFrame(data)
+
+    partitions = partitions if partitions is not None else list_partitions(dataset, store_dir)
+    for col in read_schema(dataset, partitions[0], store_dir)['columns']:
+        if col.get('tz') is not None and col['name'] in df.columns:
+            df[col['name']] = df[col['name']].dt.tz_localize('UTC').dt.tz_convert(col['tz'])
+    if index_col is not None:
+        df.set_index(index_col, inplace=True)
+    return df
+
+def read_column_matrix(dataset, columns, partitions=None, store_dir=STORE_DIR, dtype=np.float64):
+    """
+    Reads numeric columns into a single C-contiguous 2-D array, e.g. for exogenous regressors.
+
+    Parameters
+    ----------
+    dataset : str
+        Name of the dataset, e.g. 'caiso_master'.
+
+    columns : list of strings
+        Columns to read. Column order is preserved.
+
+    partitions : list of strings
+        Partitions to read. All partitions are read if None.
+
+    store_dir : str
+        Root directory of the columnar store.
+
+    dtype : dtype
+        Data type of the returned matrix.
+
+    Returns
+    -------
+
+    matrix : arr
+        Array with shape (n_rows, len(columns)).
+    """
+    data = read_columns(dataset, columns, partitions, store_dir)
+    n_rows = len(data[columns[0]])
+    matrix = np.empty((n_rows, len(columns)), dtype=dtype)
+    for j, col in enumerate(columns):
+        matrix[:, j] = data[col]
+    return matrix
@@ -0,0 +1,260 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from src.time_axis import utc_hours, utc_hours_to_local, hour_ending_labels
+
+
+HUB_NODES = ['NP15SLAK_5_N001', 'SP26SLAK_5_N001', 'ZP26SLAK_5_N001']
+OASIS_COLUMNS = ['INTERVALSTARTTIME_GMT', 'INTERVALENDTIME_GMT', 'OPR_DT', 'OPR_HR', 'OPR_INTERVAL', 'NODE_ID_XML', 'NODE_ID',
+                 'NODE', 'MARKET_RUN_ID', 'LMP_TYPE', 'XML_DATA_ITEM', 'PNODE_RESMRID', 'GRP_TYPE', 'POS', 'MW', 'GROUP']
+# Maps each OASIS LMP type to its XML data item. LMP = MCE + MCC + MCL.
+LMP_TYPES = {'LMP': 'LMP_PRC', 'MCE': 'LMP_ENE_PRC', 'MCC': 'LMP_CONG_PRC', 'MCL': 'LMP_LOSS_PRC'}
+# Interval length in minutes, OASIS market run id, price column and report name of each market.
+OASIS_MARKETS = {'DAM': (60, 'DAM', 'MW', 'PRC_LMP_DAM'),
+                 'FMM': (15, 'RTPD', 'PRC', 'PRC_RTPD_LMP_RTPD'),
+                 'RTM': (5, 'RTM', 'VALUE', 'PRC_INTVL_LMP_RTM')}
+
+
+def synthetic_node_ids(n_nodes):
+    """
+    Names the nodes of a synthetic market. The three trading hubs come first so that create_price_curves() finds them.
+
+    Parameters
+    ----------
+    n_nodes : int
+        Number of nodes.
+
+    Returns
+    -------
+
+    node_ids : list of strings
+        OASIS-style node ids.
+    """
+    extra = [f'SYNTH{i:04d}_5_N001' for i in range(max(n_nodes - len(HUB_NODES), 0))]
+    return (HUB_NODES + extra)[:n_nodes]
+
+def synthetic_lmp_matrix(hours, n_nodes, seed=0):
+    """
+    Simulates hourly day-ahead prices with daily, weekly and annual seasonality, AR(1) noise and occasional spikes.
+    Each node adds its own level and congestion noise to a shared system price.
+
+    Parameters
+    ----------
+    hours : arr
+        int64 hours since 1970-01-01 UTC.
+
+    n_nodes : int
+        Number of nodes.
+
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+
+    lmp_matrix : arr
+        Prices in $/MWh with shape (len(hours), n_nodes).
+    """
+    rng = np.random.default_rng(seed)
+    local = utc_hours_to_local(hours)
+    hour_of_day = local.hour.values
+    day_of_year = local.dayofyear.values
+
+    # Solar depresses midday prices and the evening ramp raises them.
+    daily = -8 * np.exp(-((hour_of_day - 12) / 3) ** 2) + 12 * np.exp(-((hour_of_day - 19) / 2) ** 2)
+    weekly = np.where(local.dayofweek.values >= 5, -4.0, 0.0)
+    annual = 6 * np.cos(2 * np.pi * (day_of_year - 200) / 365.25)
+    system = 32 + daily + weekly + annual + signal.lfilter([1.0], [1.0, -0.9], rng.normal(0, 2, len(hours)))
+    spikes = rng.random(len(hours)) < 0.002
+    system[spikes] += rng.gamma(2.0, 40.0, spikes.sum())
+
+    node_levels = rng.normal(0, 2, n_nodes)
+    node_levels[:len(HUB_NODES)] = [0.0, 1.5, 0.8][:n_nodes]
+    congestion = signal.lfilter([1.0], [1.0, -0.7], rng.normal(0, 1, (len(hours), n_nodes)), axis=0)
+    return system[:, None] + node_levels + congestion
+
+def _month_starts(start, n_years):
+    # OASIS files cover whole operating months in Pacific time.
+    first = pd.Timestamp(start).to_period('M').to_timestamp()
+    return pd.date_range(first, periods=int(round(n_years * 12)) + 1, freq='MS')
+
+def write_synthetic_oasis_csvs(out_dir, start='2019-02-01', n_years=1, n_nodes=3, seed=0, market='DAM'):
+    """
+    Writes monthly LMP csv files in the OASIS layout, with all four LMP types per node and interval.
+    Operating dates and hours follow the OASIS convention across daylight saving time, and rows are shuffled as in the
+    real exports. Real-time intervals add intra-hour noise to the day-ahead price of their hour.
+
+    Parameters
+    ----------
+    out_dir : str
+        Directory to write the files to.
+
+    start : str
+        First operating month.
+
+    n_years : float
+        Length of the history in years.
+
+    n_nodes : int
+        Number of nodes in each file.
+
+    seed : int
+        Seed of the random number generator.
+
+    market : str
+        'DAM' for hourly day-ahead, 'FMM' for 15-minute and 'RTM' for 5-minute real-time prices.
+
+    Returns
+    -------
+
+    lmp_files : list of strings
+        Paths of the monthly files, in order, e.g. for create_price_curves().
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    minutes, market_run_id, value_column, report = OASIS_MARKETS[market]
+    per_hour = 60 // minutes
+    rng = np.random.default_rng(seed)
+    node_ids = np.array(synthetic_node_ids(n_nodes))
+    month_starts = _month_starts(start, n_years)
+    axis_start, axis_end = utc_hours(month_starts[[0, -1]], tz='US/Pacific')
+    all_hours = np.arange(axis_start, axis_end, dtype=np.int64)
+    lmp = synthetic_lmp_matrix(all_hours, n_nodes, seed)
+    if per_hour > 1:
+        # Intervals are rows of the price matrix from here on.
+        noise_rng = np.random.default_rng([seed, minutes])
+        noise = signal.lfilter([1.0], [1.0, -0.5], noise_rng.normal(0, 4, (len(lmp) * per_hour, n_nodes)), axis=0)
+        lmp = np.repeat(lmp, per_hour, axis=0) + noise
+    system = lmp.mean(axis=1, keepdims=True)
+    loss = 0.02 * lmp
+    components = {'LMP': lmp, 'MCE': np.broadcast_to(system, lmp.shape), 'MCC': lmp - system - loss, 'MCL': loss}
+
+    lmp_files = []
+    for month_start, month_end in zip(month_starts[:-1], month_starts[1:]):
+        first, last = utc_hours([month_start, month_end], tz='US/Pacific')
+        hours = np.repeat(np.arange(first, last, dtype=np.int64), per_hour)
+        rows = slice((first - axis_start) * per_hour, (last - axis_start) * per_hour)
+        opr_dt, opr_hr = hour_ending_labels(hours)
+        opr_interval = np.tile(np.arange(1, per_hour + 1), last - first) if per_hour > 1 else np.zeros(len(hours), int)
+        interval_minutes = hours * 60 + np.tile(np.arange(per_hour) * minutes, last - first)
+        gmt = pd.DatetimeIndex(pd.to_datetime(np.append(interval_minutes, interval_minutes[-1] + minutes),
+                                              unit='m')).strftime('%Y-%m-%dT%H:%M:%S-00:00')
+
+        # One block of rows per LMP type, each ordered by node and then interval.
+        n_hours, n_types = len(hours), len(LMP_TYPES)
+        hour_pos = np.tile(np.arange(n_hours), n_nodes * n_types)
+        node_pos = np.tile(np.repeat(np.arange(n_nodes), n_hours), n_types)
+        type_pos = np.repeat(np.arange(n_types), n_nodes * n_hours)
+        values = np.concatenate([components[t][rows].T.ravel() for t in LMP_TYPES])
+        order = rng.permutation(len(values))
+        hour_pos, node_pos, type_pos, values = hour_pos[order], node_pos[order], type_pos[order], values[order]
+
+        nodes = node_ids[node_pos]
+        month = pd.DataFrame({'INTERVALSTARTTIME_GMT': gmt[:-1][hour_pos],
+                              'INTERVALENDTIME_GMT': gmt[1:][hour_pos],
+                              'OPR_DT': opr_dt.strftime('%Y-%m-%d')[hour_pos],
+                              'OPR_HR': opr_hr[hour_pos],
+                              'OPR_INTERVAL': opr_interval[hour_pos],
+                              'NODE_ID_XML': nodes,
+                              'NODE_ID': nodes,
+                              'NODE': nodes,
+                              'MARKET_RUN_ID': market_run_id,
+                              'LMP_TYPE': np.array(list(LMP_TYPES))[type_pos],
+                              'XML_DATA_ITEM': np.array(list(LMP_TYPES.values()))[type_pos],
+                              'PNODE_RESMRID': nodes,
+                              'GRP_TYPE': 'ALL',
+                              'POS': 1,
+                              value_column: np.round(values, 5),
+                              'GROUP': 1}, columns=OASIS_COLUMNS[:-2] + [value_column, 'GROUP'])
+
+        file_name = f"{month_start:%Y%m%d}_{month_end:%Y%m%d}_{report}_synthetic_v1.csv"
+        path = os.path.join(out_dir, file_name)
+        month.to_csv(path, index=False)
+        lmp_files.append(path)
+    return lmp_files
+
+def write_synthetic_natgas_csv(path, start='2019-01-01', end='2020-06-30', seed=0):
+    """
+    Writes daily Henry Hub spot prices in the FRED layout: business days only, with '.' for market holidays.
+
+    Parameters
+    ----------
+    path : str
+        Path of the csv file.
+
+    start : str
+        First date.
+
+    end : str
+        Last date.
+
+    seed : int
+        Seed of the random number generator.
+
+    Returns
+    -------
+
+    path : str
+        Path of the csv file, e.g. for obtain_format_hh_natgas_to_df().
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, end)
+    prices = np.maximum(2.5 * np.exp(np.cumsum(rng.normal(0, 0.03, len(dates)))), 0.5)
+    natgas = pd.DataFrame({'DATE': dates.strftime('%Y-%m-%d'), 'DHHNGSP': np.round(prices, 2).astype(str)})
+    natgas.loc[rng.random(len(dates)) < 0.03, 'DHHNGSP'] = '.'
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    natgas.to_csv(path, index=False)
+    return path
+
+class FakeIsoClient:
+    """
+    Stands in for a pyiso CAISO client. get_load(), get_generation() and get_trade() return records with the same keys
+    as pyiso, at 5-minute resolution, without any network access. Values are deterministic for a given seed and time.
+    """
+
+    def __init__(self, freq='5min', seed=0):
+        self.freq = freq
+        self.seed = seed
+        self.n_calls = 0
+
+    def _timestamps(self, start_at, end_at):
+        self.n_calls += 1
+        start_at, end_at = pd.Timestamp(start_at), pd.Timestamp(end_at)
+        start_at = start_at.tz_localize('UTC') if start_at.tz is None else start_at.tz_convert('UTC')
+        end_at = end_at.tz_localize('UTC') if end_at.tz is None else end_at.tz_convert('UTC')
+        return pd.date_range(start_at, end_at, freq=self.freq, inclusive='left')
+
+    def _noise(self, timestamps, salt):
+        # Seeded by time so that overlapping requests return the same values.
+        minutes = timestamps.asi8 // (60 * 10**9)
+        return np.random.default_rng([self.seed, salt, int(minutes[0]) if len(minutes) else 0]).normal(0, 1, len(minutes))
+
+    def _records(self, timestamps, values, market='RT5M'):
+        freq = '5m' if self.freq == '5min' else self.freq
+        return pd.DataFrame({'timestamp': timestamps, 'freq': freq, 'market': market, 'ba_name': 'CAISO',
+                             **values}).to_dict('records')
+
+    def get_load(self, start_at, end_at):
+        timestamps = self._timestamps(start_at, end_at)
+        hour_of_day = timestamps.tz_convert('US/Pacific').hour.values
+        load = 24000 + 5000 * np.sin(2 * np.pi * (hour_of_day - 9) / 24) + 300 * self._noise(timestamps, 1)
+        return self._records(timestamps, {'load_MW': np.round(load, 2)})
+
+    def get_generation(self, start_at, end_at):
+        timestamps = self._timestamps(start_at, end_at)
+        hour_of_day = timestamps.tz_convert('US/Pacific').hour.values
+        fuels = {'solar': np.maximum(9000 * np.sin(np.pi * (hour_of_day - 6) / 13), 0),
+                 'wind': 2500 + 800 * self._noise(timestamps, 2),
+                 'other': 15000 + 500 * self._noise(timestamps, 3)}
+        records = []
+        for fuel_name, gen_mw in fuels.items():
+            records += self._records(timestamps, {'fuel_name': fuel_name, 'gen_MW': np.round(np.maximum(gen_mw, 0), 2)})
+        return records
+
+    def get_trade(self, start_at, end_at):
+        timestamps = self._timestamps(start_at, end_at)
+        net_exp = -6000 + 1500 * self._noise(timestamps, 4)
+        return self._records(timestamps, {'net_exp_MW': np.round(net_exp, 2)})
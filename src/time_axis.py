@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+
+CAISO_TZ = 'US/Pacific'
+NS_PER_HOUR = 3600 * 10**9
+
+
+def utc_hours(timestamps, tz=None):
+    """
+    Converts timestamps to the canonical time axis: int64 hours since 1970-01-01 UTC.
+    Timestamps are floored to the hour. Strings with UTC offsets, e.g. OASIS GMT columns, are parsed directly.
+
+    Parameters
+    ----------
+    timestamps : arr
+        Timestamps or timestamp strings. Timezone-aware values are converted to UTC.
+
+    tz : str
+        Timezone of naive timestamps, e.g. 'US/Pacific'. Naive timestamps are treated as UTC if None.
+
+    Returns
+    -------
+
+    hours : arr
+        int64 hour numbers.
+    """
+    if not isinstance(timestamps, pd.DatetimeIndex):
+        timestamps = pd.Series(timestamps)
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            timestamps = pd.to_datetime(timestamps, utc=True, format='ISO8601')
+        timestamps = pd.DatetimeIndex(timestamps)
+    if timestamps.tz is None and tz is not None:
+        try:
+            timestamps = timestamps.tz_localize(tz, ambiguous='infer', nonexistent='shift_forward')
+        except Exception:
+            timestamps = timestamps.tz_localize(tz, ambiguous=False, nonexistent='shift_forward')
+    if timestamps.tz is not None:
+        timestamps = timestamps.tz_convert('UTC').tz_localize(None)
+    return timestamps.as_unit('ns').asi8 // NS_PER_HOUR
+
+def utc_hours_to_local(hours, tz=CAISO_TZ):
+    """
+    Converts the integer time axis to local timestamps for display.
+
+    Parameters
+    ----------
+    hours : arr
+        int64 hours since 1970-01-01 UTC.
+
+    tz : str
+        Target timezone.
+
+    Returns
+    -------
+
+    timestamps : DatetimeIndex
+        Timezone-aware local timestamps. They are unique even on the day daylight saving time ends.
+    """
+    hours = np.asarray(hours, dtype=np.int64)
+    return pd.DatetimeIndex(pd.to_datetime(hours * NS_PER_HOUR, unit='ns', utc=True)).tz_convert(tz)
+
+def hour_ending_labels(hours, tz=CAISO_TZ):
+    """
+    Derives the local operating date and hour ending of each hour, as published by OASIS.
+    Hour ending follows the local clock: hour ending 3 is skipped when daylight saving time starts,
+    and the repeated hour when it ends is labelled 25.
+
+    Parameters
+    ----------
+    hours : arr
+        int64 hours since 1970-01-01 UTC.
+
+    tz : str
+        Timezone of the market.
+
+    Returns
+    -------
+
+    opr_dt : DatetimeIndex
+        Naive local operating date of each hour.
+
+    opr_hr : arr
+        Hour ending, from 1 to 25.
+    """
+    hours = np.asarray(hours, dtype=np.int64)
+    wall_clock = utc_hours_to_local(hours, tz).tz_localize(None)
+    prev_wall_clock = utc_hours_to_local(hours - 1, tz).tz_localize(None)
+
+    opr_hr = wall_clock.hour.values + 1
+    opr_hr[wall_clock == prev_wall_clock] = 25
+    return wall_clock.normalize(), opr_hr
+
+def hourly_axis(start_hour, end_hour):
+    """
+    Creates a complete integer time axis.
+
+    Parameters
+    ----------
+    start_hour : int
+        First hour, inclusive.
+
+    end_hour : int
+        Last hour, inclusive.
+
+    Returns
+    -------
+
+    axis : arr
+        int64 hours from start_hour to end_hour.
+    """
+    return np.arange(start_hour, end_hour + 1, dtype=np.int64)
+
+def align_to_axis(axis, hours, values):
+    """
+    Places values on a complete integer time axis with direct offset indexing instead of a timestamp join.
+    Hours outside the axis are dropped. When an hour appears more than once, the last value wins.
+
+    Parameters
+    ----------
+    axis : arr
+        Complete, increasing int64 hours, e.g. from hourly_axis().
+
+    hours : arr
+        int64 hour of each value.
+
+    values : arr
+        Values with shape (n,) or (n, n_cols).
+
+    Returns
+    -------
+
+    aligned : arr
+        Values on the axis with missing hours set to NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    pos = np.asarray(hours, dtype=np.int64) - axis[0]
+    keep = (pos >= 0) & (pos < len(axis))
+    aligned = np.full((len(axis),) + values.shape[1:], np.nan)
+    aligned[pos[keep]] = values[keep]
+    return aligned
@@ -0,0 +1,205 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.lstm_search import pin_worker_threads
+
+
+# A single hidden layer of 32 nodes produced the most accurate LSTM (see README).
+DEFAULT_LSTM_CONFIG = {'n_layers': 1, 'n_nodes': 32, 'dropout': 0.0, 'window': 24, 'batch_size': 64}
+
+# Populated once per worker process by _init_walk_forward_worker so the price matrix is not pickled with every hub.
+_WORKER_DATA = {}
+
+
+def _recursive_fcst(lstm_uni, history, n_periods_fcst):
+    # Feeds each one-step forecast back into the window to forecast the next hour.
+    window = np.asarray(history, dtype=np.float32).copy()
+    fcst = np.empty(n_periods_fcst)
+    for h in range(n_periods_fcst):
+        fcst[h] = float(lstm_uni(window[None, :, None], training=False)[0, 0])
+        window[:-1] = window[1:]
+        window[-1] = fcst[h]
+    return fcst
+
+def walk_forward_lstm(lmp_curve, origins, n_periods_fcst=24, config=None, cold_epochs=20, warm_epochs=2,
+                      warm_start=True, replay_hours=0, seed=0):
+    """
+    Retrains an LSTM at every forecast origin and forecasts the following hours recursively.
+    With warm_start the first origin is fit from random weights and every later origin fine-tunes the previous
+    origin's model for a few epochs on the hours that arrived since, so daily retraining costs a fraction of a cold fit.
+    Prices are min-max scaled with the history before the first origin so that carried-over weights stay valid.
+
+    Parameters
+    ----------
+    lmp_curve : arr
+        Historic hourly prices for one of the hubs.
+
+    origins : arr
+        Increasing index of the first forecasted hour for each origin, e.g. from backtest_origins().
+        Only hours before the origin are used to train.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    config : dict
+        LSTM hyperparameters - n_layers, n_nodes, dropout, window, batch_size. Missing keys use DEFAULT_LSTM_CONFIG.
+
+    cold_epochs : int
+        Number of epochs of a fit from random weights.
+
+    warm_epochs : int
+        Number of fine-tuning epochs at each later origin.
+
+    warm_start : bool
+        Fine-tunes the previous origin's model. Every origin is fit from random weights if False.
+
+    replay_hours : int
+        Additional hours before the previous origin that are included when fine-tuning.
+
+    seed : int
+        Seed for the weight initialization and the batch order.
+
+    Returns
+    -------
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst).
+
+    fit_seconds : arr
+        Training time at each origin.
+    """
+    import tensorflow as tf
+    from src.model import build_lstm_uni_var, windowize_data
+
+    config = {**DEFAULT_LSTM_CONFIG, **(config or {})}
+    window = config['window']
+    origins = np.asarray(origins)
+    if np.any(np.diff(origins) <= 0):
+        raise ValueError('origins must be increasing.')
+    if origins[0] <= window:
+        raise ValueError(f'The first origin needs more than {window} hours of history.')
+
+    lmp_curve = np.asarray(lmp_curve, dtype=np.float32)
+    lmp_min, lmp_max = lmp_curve[:origins[0]].min(), lmp_curve[:origins[0]].max()
+    scale = lmp_max - lmp_min if lmp_max > lmp_min else 1.0
+    scaled = (lmp_curve - lmp_min) / scale
+
+    tf.keras.utils.set_random_seed(seed)
+    fcst = np.empty((len(origins), n_periods_fcst))
+    fit_seconds = np.empty(len(origins))
+    lstm_uni, prev_origin = None, None
+    for i, origin in enumerate(origins):
+        start = time.perf_counter()
+        if lstm_uni is None or not warm_start:
+            tf.keras.backend.clear_session()
+            lstm_uni = build_lstm_uni_var(window, 1, config['n_nodes'], config['n_layers'], config['dropout'])
+            x_train, y_train = windowize_data(scaled[:origin], window)
+            lstm_uni.fit(x_train, y_train, batch_size=config['batch_size'], epochs=cold_epochs, verbose=0)
+        else:
+            # Only windows whose target arrived since the previous origin, plus any replayed hours, are trained on.
+            first_target = max(prev_origin - replay_hours, window)
+            x_train, y_train = windowize_data(scaled[first_target - window:origin], window)
+            lstm_uni.fit(x_train, y_train, batch_size=config['batch_size'], epochs=warm_epochs, verbose=0)
+        fit_seconds[i] = time.perf_counter() - start
+
+        fcst[i] = _recursive_fcst(lstm_uni, scaled[origin - window:origin], n_periods_fcst) * scale + lmp_min
+        prev_origin = origin
+    return fcst, fit_seconds
+
+def _init_walk_forward_worker(n_threads, lmp_matrix, origins, kwargs):
+    pin_worker_threads(n_threads)
+    _WORKER_DATA['lmp_matrix'] = lmp_matrix
+    _WORKER_DATA['origins'] = origins
+    _WORKER_DATA['kwargs'] = kwargs
+
+def _walk_forward_hub(hub):
+    return walk_forward_lstm(_WORKER_DATA['lmp_matrix'][:, hub], _WORKER_DATA['origins'], **_WORKER_DATA['kwargs'])
+
+def walk_forward_lstm_hubs(lmp_matrix, origins, n_periods_fcst=24, config=None, cold_epochs=20, warm_epochs=2,
+                           warm_start=True, replay_hours=0, n_workers=None, threads_per_worker=1, seed=0):
+    """
+    Runs walk_forward_lstm() for every hub, with independent hubs trained in parallel worker processes.
+    Each worker caps its intra-op threads so that workers do not compete for cores.
+
+    Parameters
+    ----------
+    lmp_matrix : arr
+        Hourly prices with one column per hub, i.e. shape (n_hours, n_hubs).
+
+    origins : arr
+        Increasing index of the first forecasted hour for each origin.
+
+    n_periods_fcst : int
+        Number of hours forecasted from each origin.
+
+    config : dict
+        LSTM hyperparameters shared by every hub.
+
+    cold_epochs : int
+        Number of epochs of a fit from random weights.
+
+    warm_epochs : int
+        Number of fine-tuning epochs at each later origin.
+
+    warm_start : bool
+        Fine-tunes the previous origin's model. Every origin is fit from random weights if False.
+
+    replay_hours : int
+        Additional hours before the previous origin that are included when fine-tuning.
+
+    n_workers : int
+        Number of worker processes. Defaults to one per hub, limited by the number of cores divided by threads_per_worker.
+
+    threads_per_worker : int
+        Number of TensorFlow intra-op threads in each worker.
+
+    seed : int
+        Seed for the weight initialization and the batch order.
+
+    Returns
+    -------
+
+    fcst : arr
+        Forecasted prices with shape (n_origins, n_periods_fcst, n_hubs), as produced by the baseline forecasts.
+
+    fit_seconds : arr
+        Training time with shape (n_origins, n_hubs).
+    """
+    lmp_matrix = np.asarray(lmp_matrix, dtype=np.float32)
+    if lmp_matrix.ndim == 1:
+        lmp_matrix = lmp_matrix[:, None]
+    n_hubs = lmp_matrix.shape[1]
+    if n_workers is None:
+        n_workers = max(1, min(n_hubs, (os.cpu_count() or 1) // threads_per_worker))
+    kwargs = {'n_periods_fcst': n_periods_fcst, 'config': config, 'cold_epochs': cold_epochs,
+              'warm_epochs': warm_epochs, 'warm_start': warm_start, 'replay_hours': replay_hours, 'seed': seed}
+
+    # Spawn rather than fork so that workers never inherit an initialised TensorFlow runtime.
+    mp_context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context, initializer=_init_walk_forward_worker,
+                             initargs=(threads_per_worker, lmp_matrix, np.asarray(origins), kwargs)) as pool:
+        results = list(pool.map(_walk_forward_hub, range(n_hubs)))
+
+    fcst = np.stack([r[0] for r in results], axis=-1)
+    fit_seconds = np.stack([r[1] for r in results], axis=-1)
+    return fcst, fit_seconds
+
+
+if __name__ == '__main__':
+
+    from src.import_process_data import import_caiso_dataset
+    from src.baseline import backtest_origins, stack_fcst_targets, calc_baseline_rmse
+
+    caiso = import_caiso_dataset('caiso_master')
+    lmp_matrix = caiso[['$_MWH_np15', '$_MWH_sp15', '$_MWH_zp26']].values
+
+    # Day-ahead forecasts retrained every day over the last 30 days.
+    origins = backtest_origins(len(lmp_matrix), 24, 30)
+    y_true = stack_fcst_targets(lmp_matrix, origins, 24)
+    for warm_start in [False, True]:
+        fcst, fit_seconds = walk_forward_lstm_hubs(lmp_matrix, origins, warm_start=warm_start)
+        print(f'warm_start={warm_start}: RMSE {calc_baseline_rmse(y_true, fcst)}, fit seconds {fit_seconds.sum(axis=0)}')